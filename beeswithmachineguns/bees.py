@@ -30,27 +30,29 @@ from future import standard_library
 standard_library.install_aliases()
 from builtins import zip
 from builtins import map
-from builtins import bytes
 from builtins import range
 from past.utils import old_div
-from multiprocessing import Pool
+from array import array
 import os
 import re
 import socket
 import time
 import sys
 import ast
-IS_PY2 = sys.version_info.major == 2
-if IS_PY2:
-    from urllib.request import urlopen, Request
-    from io import StringIO
-else:
-    from urllib.request import urlopen, Request
-    from io import StringIO
+import inspect
+from urllib.parse import urlparse
+from io import StringIO
+from queue import Queue, Empty
+from shlex import quote
 import base64
 import csv
-import random
+import gzip
+import hashlib
+import http.client
+import itertools
+import operator
 import ssl
+import tarfile
 from contextlib import contextmanager
 import traceback
 
@@ -58,11 +60,65 @@ import boto.ec2
 import boto.exception
 import paramiko
 import json
-from collections import defaultdict
+from collections import defaultdict, deque, namedtuple
+import threading
 import time
 
-
-STATE_FILENAME = os.path.expanduser('~/.bees')
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from . import broker
+from . import native
+from . import state
+from . import workload
+
+
+# How many bees may be doing their SSH handshake at once, and how far apart
+# (in seconds) the handshakes are started
+SSH_WINDOW = 50
+SSH_STAGGER = 0.01
+
+# How long up() waits for new bees to be running and answer on the SSH port
+# (in seconds), how far apart its polls of EC2 are and how long each SSH
+# probe may take
+INSTANCE_READY_TIMEOUT = 600
+INSTANCE_POLL_MIN = 2
+INSTANCE_POLL_MAX = 15
+SSH_PORT = 22
+SSH_PROBE_TIMEOUT = 3
+
+# How long up() waits for spot requests to be fulfilled (in seconds)
+SPOT_TIMEOUT = 600
+
+# How long the addresses recorded in the roster are trusted before an
+# attack asks EC2 for them again (in seconds)
+INSTANCE_CACHE_TTL = 900
+
+# How many urls the swarm requests at once when stinging in parallel, and
+# how long it waits for each (in seconds)
+STING_CONCURRENCY = 16
+STING_TIMEOUT = 30
+
+# Where the bees keep the post files and workload tables they have been
+# sent, by their sha1, relative to their home directory, and how hard
+# they are gzipped on the way
+PAYLOAD_CACHE = '.bees-payloads'
+PAYLOAD_COMPRESS_LEVEL = 6
+
+# How far ahead of the last bee being armed the swarm is told to start
+# firing, and how long armed bees wait for the rest (in seconds)
+START_LEAD = 1.0
+START_TIMEOUT = 60
+
+# Where find_capacity starts its search (requests/sec), how long each step
+# attacks for (seconds), how close it gets to the limit (as a fraction of
+# the rate) and how many steps it takes at most
+CAPACITY_START_RATE = 100
+CAPACITY_STEP_DURATION = 30
+CAPACITY_PRECISION = 0.05
+CAPACITY_MAX_STEPS = 20
 
 # Utilities
 
@@ -74,34 +130,22 @@ def _redirect_stdout(outfile=None):
     sys.stdout = save_stdout
 
 def _read_server_list(*mr_zone):
-    instance_ids = []
-    if len(mr_zone) > 0:
-        MR_STATE_FILENAME = _get_new_state_file_name(mr_zone[-1])
-    else:
-        MR_STATE_FILENAME = STATE_FILENAME
-    if not os.path.isfile(MR_STATE_FILENAME):
+    swarm = state.read_swarm(mr_zone[-1]) if mr_zone and mr_zone[-1] else None
+    if swarm is None:
         return (None, None, None, None)
 
-    with open(MR_STATE_FILENAME, 'r') as f:
-        username = f.readline().strip()
-        key_name = f.readline().strip()
-        zone = f.readline().strip()
-        text = f.read()
-        instance_ids = [i for i in text.split('\n') if i != '']
+    username, key_name, zone, bees = swarm
+    instance_ids = [bee['instance_id'] for bee in bees]
 
-        print(('Read {} bees from the roster: {}').format(len(instance_ids), zone))
+    print(('Read {} bees from the roster: {}').format(len(instance_ids), zone))
 
     return (username, key_name, zone, instance_ids)
 
-def _write_server_list(username, key_name, zone, instances):
-    with open(_get_new_state_file_name(zone), 'w') as f:
-        f.write('%s\n' % username)
-        f.write('%s\n' % key_name)
-        f.write('%s\n' % zone)
-        f.write('\n'.join([instance.id for instance in instances]))
+def _write_server_list(username, key_name, zone, instances, bid=None):
+    state.write_swarm(username, key_name, zone, [state.describe(instance, bid) for instance in instances])
 
 def _delete_server_list(zone):
-    os.remove(_get_new_state_file_name(zone))
+    state.delete_swarm(zone)
 
 
 def _get_pem_path(key):
@@ -110,6 +154,16 @@ def _get_pem_path(key):
 def _get_region(zone):
     return zone if 'gov' in zone else zone[:-1] # chop off the "d" in the "us-east-1d" to get the "Region"
 
+def _connect_ec2(zone):
+    """
+    Connect to EC2 in the zone's region, or to the EC2 compatible API at
+    $BEES_EC2_ENDPOINT if it is set, e.g. a local fake for testing.
+    """
+    endpoint = os.environ.get('BEES_EC2_ENDPOINT')
+    if endpoint:
+        return boto.connect_ec2_endpoint(endpoint)
+    return boto.ec2.connect_to_region(_get_region(zone))
+
 def _get_security_group_id(connection, security_group_name, subnet):
     """Takes a security group name and returns the ID.  If the name cannot be found, the name will be attempted
     as an ID.  The first group found by this name or ID will be used."""
@@ -129,7 +183,8 @@ def _get_security_group_id(connection, security_group_name, subnet):
 
 # Methods
 
-def up(count, group, zone, image_id, instance_type, username, key_name, subnet, tags, bid = None):
+def up(count, group, zone, image_id, instance_type, username, key_name, subnet, tags, bid = None, ready_timeout = INSTANCE_READY_TIMEOUT,
+       spot_timeout = None, spot_quorum = None, spot_backfill = False):
     """
     Startup the load testing server.
     """
@@ -138,7 +193,7 @@ def up(count, group, zone, image_id, instance_type, username, key_name, subnet,
 
     count = int(count)
     if existing_username == username and existing_key_name == key_name and existing_zone == zone:
-        ec2_connection = boto.ec2.connect_to_region(_get_region(zone))
+        ec2_connection = _connect_ec2(zone)
         existing_reservations = ec2_connection.get_all_instances(instance_ids=instance_ids)
         existing_instances = [instance for reservation in existing_reservations for instance in reservation.instances if instance.state == 'running']
         # User, key and zone match existing values and instance ids are found on state file
@@ -167,7 +222,7 @@ def up(count, group, zone, image_id, instance_type, username, key_name, subnet,
     print('Connecting to the hive.')
 
     try:
-        ec2_connection = boto.ec2.connect_to_region(_get_region(zone))
+        ec2_connection = _connect_ec2(zone)
     except boto.exception.NoAuthHandlerFound as e:
         print("Authenciation config error, perhaps you do not have a ~/.boto file with correct permissions?")
         print(e.message)
@@ -186,36 +241,34 @@ def up(count, group, zone, image_id, instance_type, username, key_name, subnet,
     placement = None if 'gov' in zone else zone
     print("Placement: %s" % placement)
 
+    launch_options = dict(
+        image_id=image_id,
+        key_name=key_name,
+        security_group_ids=[groupId],
+        instance_type=instance_type,
+        placement=placement,
+        subnet_id=subnet)
+
+    instances = []
     if bid:
         print('Attempting to call up %i spot bees, this can take a while...' % count)
 
-        spot_requests = ec2_connection.request_spot_instances(
-            image_id=image_id,
-            price=bid,
-            count=count,
-            key_name=key_name,
-            security_group_ids=[groupId],
-            instance_type=instance_type,
-            placement=placement,
-            subnet_id=subnet)
+        spot_requests = ec2_connection.request_spot_instances(price=bid, count=count, **launch_options)
 
-        # it can take a few seconds before the spot requests are fully processed
-        time.sleep(5)
+        instances, count = _wait_for_spot_request_fulfillment(ec2_connection, spot_requests, spot_timeout or SPOT_TIMEOUT, spot_quorum)
+        if count and spot_backfill:
+            print('Backfilling %i spot bees with on-demand bees.' % count)
+        else:
+            count = 0
 
-        instances = _wait_for_spot_request_fulfillment(ec2_connection, spot_requests)
-    else:
+    if count:
         print('Attempting to call up %i bees.' % count)
 
         try:
             reservation = ec2_connection.run_instances(
-                image_id=image_id,
                 min_count=count,
                 max_count=count,
-                key_name=key_name,
-                security_group_ids=[groupId],
-                instance_type=instance_type,
-                placement=placement,
-                subnet_id=subnet)
+                **launch_options)
 
         except boto.exception.EC2ResponseError as e:
             print(("Unable to call bees:", e.message))
@@ -224,7 +277,11 @@ def up(count, group, zone, image_id, instance_type, username, key_name, subnet,
             print(groupId)
             return e
 
-        instances = reservation.instances
+        instances.extend(reservation.instances)
+
+    if not instances:
+        print('No bees could be called up.')
+        return
     if tags:
         try:
             tags_dict = ast.literal_eval(tags)
@@ -245,23 +302,148 @@ def up(count, group, zone, image_id, instance_type, username, key_name, subnet,
 
     instance_ids = instance_ids or []
 
-    for instance in [i for i in instances if i.state == 'pending']:
-        instance.update()
-        while instance.state != 'running':
-            print('.')
-            time.sleep(5)
-            instance.update()
-
-        instance_ids.append(instance.id)
-
-        print('Bee %s is ready for the attack.' % instance.id)
+    new_instances = _wait_for_instances(ec2_connection, [i for i in instances if i.id not in instance_ids], ready_timeout)
+    instances = new_instances + [i for i in instances if i.id in instance_ids]
+    instance_ids.extend(i.id for i in new_instances)
 
     ec2_connection.create_tags(instance_ids, { "Name": "a bee!" })
 
-    _write_server_list(username, key_name, zone, instances)
+    _write_server_list(username, key_name, zone, instances, bid)
 
     print('The swarm has assembled %i bees.' % len(instances))
 
+def _wait_for_instances(ec2_connection, instances, timeout):
+    """
+    Wait until the instances are running and their SSH servers answer.
+
+    Every poll describes all the instances still pending in one call and
+    probes SSH on all the running ones at once.  Polls start
+    INSTANCE_POLL_MIN seconds apart and back off to INSTANCE_POLL_MAX while
+    no bee becomes ready.  Returns the refreshed instances, leaving out any
+    that died on the way; bees that are not ready once `timeout` seconds
+    are up are kept so that "bees down" still knows about them.
+    """
+    latest = dict((instance.id, instance) for instance in instances)
+    waiting = set(latest)
+    deadline = time.time() + timeout
+    delay = INSTANCE_POLL_MIN
+    while waiting:
+        progress = False
+        try:
+            reservations = ec2_connection.get_all_instances(instance_ids=sorted(waiting))
+        except boto.exception.EC2ResponseError as e:
+            # new instances take a moment to show up in the API
+            if 'InvalidInstanceID.NotFound' not in str(e):
+                raise
+            reservations = []
+
+        running = []
+        for instance in [i for r in reservations for i in r.instances]:
+            latest[instance.id] = instance
+            if instance.state == 'running':
+                running.append(instance)
+            elif instance.state != 'pending':
+                print('Bee %s is %s and will not make it to the attack.' % (instance.id, instance.state))
+                waiting.discard(instance.id)
+                del latest[instance.id]
+
+        probes = [{'instance_name': _get_instance_name(instance)} for instance in running]
+        for instance, reachable in zip(running, _run_swarm(_probe_ssh, probes, SSH_WINDOW, 0)):
+            if reachable:
+                print('Bee %s is ready for the attack.' % instance.id)
+                waiting.discard(instance.id)
+                progress = True
+
+        if not waiting:
+            break
+        if time.time() + delay > deadline:
+            print('bees: warning: %i bees were not ready after %i seconds: %s' % (len(waiting), timeout, ', '.join(sorted(waiting))))
+            break
+        delay = INSTANCE_POLL_MIN if progress else min(delay * 1.5, INSTANCE_POLL_MAX)
+        print('%i bees are still loading their machine guns.' % len(waiting))
+        time.sleep(delay)
+
+    return [latest[instance.id] for instance in instances if instance.id in latest]
+
+
+class _RosterInstance(object):
+    """
+    A bee as recorded in the roster, standing in for the boto instance.
+    """
+    def __init__(self, bee):
+        self.id = bee['instance_id']
+        self.public_dns_name = bee['public_dns_name'] or ''
+        self.private_dns_name = bee['private_dns_name'] or ''
+        self.state = bee['state']
+
+
+def _get_instances(zone, instance_ids, ttl=INSTANCE_CACHE_TTL):
+    """
+    Return the bees in a swarm, from the roster if every one of them was
+    seen running with an address less than `ttl` seconds ago, or else from
+    EC2, recording what it says in the roster.
+    """
+    swarm = state.read_swarm(zone)
+    bees = swarm[3] if swarm else []
+    now = time.time()
+    if ttl and bees and [bee['instance_id'] for bee in bees] == list(instance_ids) and all(
+            bee['state'] == 'running' and (bee['public_dns_name'] or bee['private_dns_name'])
+            and now - (bee['checked'] or 0) < ttl for bee in bees):
+        print('Assembling bees from the roster.')
+        return [_RosterInstance(bee) for bee in bees]
+
+    print('Connecting to the hive.')
+
+    ec2_connection = _connect_ec2(zone)
+
+    print('Assembling bees.')
+
+    reservations = ec2_connection.get_all_instances(instance_ids=instance_ids)
+
+    instances = []
+
+    for reservation in reservations:
+        instances.extend(reservation.instances)
+
+    state.update_bees([state.describe(instance) for instance in instances])
+
+    return instances
+
+
+def _forget_unreachable(params, results):
+    """
+    Make the next attack ask EC2 about the bees that couldn't be reached
+    over SSH, as the roster's addresses for them may be out of date.
+    """
+    unreachable = [param['instance_id'] for param, result in zip(params, results) if isinstance(result, Exception)]
+    if unreachable:
+        state.update_bees([dict(instance_id=i, checked=None) for i in unreachable])
+        print('bees: warning: %i bees could not be reached, they will be looked up again next time: %s' % (len(unreachable), ', '.join(unreachable)))
+
+
+def _get_instance_name(instance):
+    return instance.private_dns_name if instance.public_dns_name == "" else instance.public_dns_name
+
+
+def _probe_ssh(params):
+    """
+    Return whether an SSH server answers with its banner at the bee.
+
+    Intended for use with _run_swarm.
+    """
+    try:
+        sock = socket.create_connection((params['instance_name'], SSH_PORT), SSH_PROBE_TIMEOUT)
+    except (socket.error, socket.timeout):
+        return False
+    try:
+        sock.settimeout(SSH_PROBE_TIMEOUT)
+        return sock.recv(4) == b'SSH-'
+    except (socket.error, socket.timeout):
+        return False
+    finally:
+        sock.close()
+
+
 def report():
     """
     Report the status of the load testing servers.
@@ -272,7 +454,7 @@ def report():
             print('No bees have been mobilized.')
             return
 
-        ec2_connection = boto.ec2.connect_to_region(_get_region(zone))
+        ec2_connection = _connect_ec2(zone)
 
         reservations = ec2_connection.get_all_instances(instance_ids=instance_ids)
 
@@ -284,6 +466,8 @@ def report():
         for instance in instances:
             print('Bee %s: %s @ %s' % (instance.id, instance.state, instance.ip_address))
 
+        state.update_bees([state.describe(instance) for instance in instances])
+
     for i in _get_existing_regions():
         username, key_name, zone, instance_ids = _read_server_list(i)
         _check_instances()
@@ -302,7 +486,7 @@ def down(*mr_zone):
 
         print('Connecting to the hive.')
 
-        ec2_connection = boto.ec2.connect_to_region(_get_region(zone))
+        ec2_connection = _connect_ec2(zone)
 
         print(('Calling off the swarm for {}.').format(region))
 
@@ -319,161 +503,757 @@ def down(*mr_zone):
     else:
         for region in _get_existing_regions():
             _check_to_down_it()
+        # the connections it kept to the bees are no use any more
+        if broker.shutdown():
+            print('Closed the SSH connection broker.')
 
-def _wait_for_spot_request_fulfillment(conn, requests, fulfilled_requests = []):
+def _wait_for_spot_request_fulfillment(conn, requests, timeout=SPOT_TIMEOUT, quorum=None):
     """
-    Wait until all spot requests are fulfilled.
+    Wait until the spot requests are fulfilled, polling all the open ones
+    in one call, backing off like _wait_for_instances.
+
+    Waiting stops once every request is fulfilled, once `quorum` of them
+    are, or after `timeout` seconds, whichever comes first. Requests still
+    open then are cancelled so that no bee turns up after the swarm has
+    moved on.
 
-    Once all spot requests are fulfilled, return a list of corresponding spot instances.
+    Returns the fulfilled spot instances and the number of requests that
+    were not fulfilled.
     """
-    if len(requests) == 0:
-        reservations = conn.get_all_instances(instance_ids = [r.instance_id for r in fulfilled_requests])
-        return [r.instances[0] for r in reservations]
-    else:
-        time.sleep(10)
-        print('.')
+    quorum = min(quorum or len(requests), len(requests))
+    waiting = set(r.id for r in requests)
+    fulfilled = {}
+    deadline = time.time() + timeout
+    delay = INSTANCE_POLL_MIN
+    while True:
+        try:
+            polled = conn.get_all_spot_instance_requests(request_ids=sorted(waiting))
+        except boto.exception.EC2ResponseError as e:
+            # new requests take a moment to show up in the API
+            if 'InvalidSpotInstanceRequestID.NotFound' not in str(e):
+                raise
+            polled = []
+
+        progress = False
+        for req in polled:
+            if req.instance_id and req.state in ('open', 'active'):
+                fulfilled[req.id] = req.instance_id
+                waiting.discard(req.id)
+                progress = True
+                print("spot bee `{}` joined the swarm.".format(req.instance_id))
+            elif req.state in ('cancelled', 'failed', 'closed'):
+                waiting.discard(req.id)
+                print('spot request `{}` {}: {}'.format(req.id, req.state, getattr(req.status, 'code', '')))
+
+        if not waiting or len(fulfilled) >= quorum:
+            break
+        if time.time() + delay > deadline:
+            print('bees: warning: %i spot requests were not fulfilled after %i seconds.' % (len(waiting), timeout))
+            break
+        delay = INSTANCE_POLL_MIN if progress else min(delay * 1.5, INSTANCE_POLL_MAX)
+        print('%i of %i spot bees have joined the swarm, waiting on %i.' % (len(fulfilled), quorum, quorum - len(fulfilled)))
+        time.sleep(delay)
+
+    if waiting:
+        print('Cancelling %i open spot requests.' % len(waiting))
+        conn.cancel_spot_instance_requests(sorted(waiting))
+        # a request may have been fulfilled since the last poll, in which
+        # case its bee is already running and had better join the swarm
+        for req in conn.get_all_spot_instance_requests(request_ids=sorted(waiting)):
+            if req.instance_id:
+                fulfilled[req.id] = req.instance_id
+                waiting.discard(req.id)
+                print("spot bee `{}` joined the swarm.".format(req.instance_id))
 
-    requests = conn.get_all_spot_instance_requests(request_ids=[req.id for req in requests])
-    for req in requests:
-        if req.status.code == 'fulfilled':
-            fulfilled_requests.append(req)
-            print("spot bee `{}` joined the swarm.".format(req.instance_id))
+    instances = []
+    if fulfilled:
+        reservations = conn.get_all_instances(instance_ids=sorted(fulfilled.values()))
+        instances = [i for r in reservations for i in r.instances]
+    return instances, len(requests) - len(fulfilled)
 
-    return _wait_for_spot_request_fulfillment(conn, [r for r in requests if r not in fulfilled_requests], fulfilled_requests)
 
-def _sting(params):
+class _RequestTemplate(namedtuple('_RequestTemplate', 'method url headers body_hash body_size')):
     """
-    Request the target URL for caching.
-
-    Intended for use with multiprocessing.
+    The request the swarm sends, parsed and checked once per attack rather
+    than by every bee: the method, the url, the headers as (name, value)
+    pairs with the content type, cookies and basic auth folded in, and the
+    sha1 of the body.  The body itself travels separately and the bees keep
+    it by that hash (see _Payload), so a bee is only ever sent a given body
+    once.
+
+    Templates are immutable, so a bee's is the swarm's with her url swapped
+    in, and the native engine loads them from the JSON as_json writes.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def parse(cls, options):
+        """
+        Build the template from the attack options, without a url.  Returns
+        it along with the body, or raises ValueError saying what is wrong.
+        """
+        body = None
+        if options.get('post_file'):
+            try:
+                with open(options['post_file'], 'rb') as post_file:
+                    body = post_file.read()
+            except IOError as e:
+                raise ValueError('cannot read the post file: %s' % e)
+
+        sends_body = body is not None or bool(options.get('corpus'))
+        method = options.get('verb') or ('POST' if sends_body else 'GET')
+        if not re.match('^[A-Za-z]+$', method):
+            raise ValueError('%s is not an HTTP method' % method)
+
+        headers = []
+        for header in (options.get('headers') or '').split(';'):
+            if header.strip() == '':
+                continue
+            name, colon, value = header.partition(':')
+            if not colon or not name.strip():
+                raise ValueError('header "%s" is not of the form "Name: value"' % header.strip())
+            headers.append((name.strip(), value.strip()))
+        if sends_body and options.get('contenttype'):
+            headers.append(('Content-Type', options['contenttype']))
+        if options.get('cookies'):
+            headers.append(('Cookie', options['cookies']))
+        if options.get('basic_auth'):
+            headers.append(('Authorization', 'Basic %s' % _basic_auth_token(options['basic_auth'])))
+
+        if body is None:
+            return cls(method.upper(), None, tuple(headers), None, 0), None
+        return cls(method.upper(), None, tuple(headers), hashlib.sha1(body).hexdigest(), len(body)), body
+
+    def as_json(self):
+        return json.dumps(self._asdict(), separators=(',', ':'))
+
+
+class _StingPool(object):
+    """
+    Keep-alive connections to the target for stinging, kept per host and
+    handed to one thread at a time, so warming up many urls on the same
+    site costs one handshake per thread rather than one per request.
     """
-    url = params['url']
-    headers = params['headers']
-    contenttype = params['contenttype']
-    cookies = params['cookies']
-    post_file = params['post_file']
-    basic_auth = params['basic_auth']
+    def __init__(self, timeout=STING_TIMEOUT):
+        self.timeout = timeout
+        self.idle = defaultdict(list)
+        self.lock = threading.Lock()
+
+    def _connect(self, scheme, netloc):
+        if scheme == 'https':
+            context = ssl._create_unverified_context() if hasattr(ssl, '_create_unverified_context') else None
+            return http.client.HTTPSConnection(netloc, timeout=self.timeout, context=context)
+        return http.client.HTTPConnection(netloc, timeout=self.timeout)
+
+    def request(self, method, url, body=None, headers=None):
+        """
+        Send a request and read the whole response. Returns its status and
+        how long it took in ms.
+        """
+        parts = urlparse(url if '://' in url else 'http://' + url)
+        key = (parts.scheme.lower(), parts.netloc)
+        path = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+        with self.lock:
+            connection = self.idle[key].pop() if self.idle[key] else None
+        reused = connection is not None
+        while True:
+            if connection is None:
+                connection = self._connect(*key)
+            started = time.time()
+            try:
+                connection.request(method, path, body, headers or {})
+                response = connection.getresponse()
+                response.read()
+                break
+            except (http.client.HTTPException, socket.error):
+                connection.close()
+                if not reused:
+                    raise
+                # the server closed it while it sat idle, try a fresh one
+                connection, reused = None, False
+        elapsed = (time.time() - started) * 1000
+        if response.will_close:
+            connection.close()
+        else:
+            with self.lock:
+                self.idle[key].append(connection)
+        return response.status, elapsed
 
-    # Create request
-    request = Request(url)
+    def close(self):
+        with self.lock:
+            for connections in self.idle.values():
+                for connection in connections:
+                    connection.close()
+            self.idle.clear()
 
-    # Need to revisit to support all http verbs.
-    if post_file:
-        try:
-            with open(post_file, 'r') as content_file:
-                content = content_file.read()
-            if IS_PY2:
-                request.add_data(content)
-            else:
-                # python3 removed add_data method from Request and added data attribute, either bytes or iterable of bytes
-                request.data = bytes(content.encode('utf-8'))
-        except IOError:
-            print('bees: error: The post file you provided doesn\'t exist.')
-            return
 
-    if cookies is not '':
-        request.add_header('Cookie', cookies)
+def _sting(params, sting=1, passes=1):
+    """
+    Request every distinct url the swarm is about to attack, with the
+    headers and body it will send, so the target has it cached before the
+    attack starts. With sting 1 the urls are requested one at a time, with
+    2 up to STING_CONCURRENCY at once, and the whole set is requested
+    `passes` times.
+
+    Returns how long each pass took as a list of dicts with the number of
+    urls, the mean and slowest time in ms and the number of failures.
+    """
+    if not sting:
+        print('Stinging URL skipped.')
+        return []
+    if params[0]['expand']:
+        print('Stinging URL skipped, the bees expand its placeholders for every request.')
+        return []
+
+    # the bees' requests only differ in their url
+    request, body = params[0]['request'], params[0]['body']
+    urls = sorted(set(p['request'].url for p in params))
+    method, headers = request.method, dict(request.headers)
+
+    concurrency = min(STING_CONCURRENCY if sting == 2 else 1, len(urls))
+    print('Stinging %i url%s %s so %s cached for the attack.' % (
+        len(urls), '' if len(urls) == 1 else 's', 'in parallel' if concurrency > 1 else 'sequentially',
+        'it will be' if len(urls) == 1 else 'they will be'))
+
+    pool = _StingPool()
+    results = []
+    try:
+        for number in range(passes):
+            queue = Queue()
+            for url in urls:
+                queue.put(url)
+            times = []
+            failures = []
+
+            def worker():
+                while True:
+                    try:
+                        url = queue.get_nowait()
+                    except Empty:
+                        return
+                    try:
+                        status, elapsed = pool.request(method, url, body, headers)
+                    except (http.client.HTTPException, socket.error) as e:
+                        failures.append((url, e))
+                        continue
+                    times.append(elapsed)
+                    if status >= 400:
+                        failures.append((url, 'HTTP %i' % status))
+
+            threads = [threading.Thread(target=worker) for i in range(concurrency)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            for url, error in failures:
+                print('bees: warning: stinging %s failed: %s' % (url, error))
+            result = {
+                'urls': len(urls),
+                'mean': old_div(sum(times), len(times)) if times else float('nan'),
+                'max': max(times) if times else float('nan'),
+                'failed': len(failures),
+            }
+            print('Sting pass %i: %i urls, %f [ms] mean, %f [ms] slowest, %i failed.' % (
+                number + 1, result['urls'], result['mean'], result['max'], result['failed']))
+            results.append(result)
+    finally:
+        pool.close()
+    return results
+
+
+class _Payload(namedtuple('_Payload', 'digest size data gzipped')):
+    """
+    A file the bees keep in their payload cache: the sha1 it is kept by,
+    its size, and the bytes sent to stock it, gzipped unless that doesn't
+    make them smaller.  Packing happens once per attack, however many bees
+    the payload goes to.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def pack(cls, data):
+        packed = gzip.compress(data, PAYLOAD_COMPRESS_LEVEL)
+        if len(packed) < len(data):
+            return cls(hashlib.sha1(data).hexdigest(), len(data), packed, True)
+        return cls(hashlib.sha1(data).hexdigest(), len(data), data, False)
 
-    if basic_auth is not '':
-        authentication = base64.encodestring(basic_auth).replace('\n', '')
-        request.add_header('Authorization', 'Basic %s' % authentication)
 
-    # Ping url so it will be cached for testing
-    dict_headers = {}
-    if headers is not '':
-        dict_headers = headers = dict(j.split(':') for j in [i.strip() for i in headers.split(';') if i != ''])
+def _stock_payloads(client, payloads):
+    """
+    Make sure the bee has the payloads in her cache, sending over only the
+    ones an earlier attack hasn't already.  One command on the bee's SSH
+    connection lists the missing ones and unpacks them from a tar of their
+    packed bytes, so a bee costs one round trip however many there are.
 
-    if contenttype is not '':
-        request.add_header("Content-Type", contenttype)
+    Returns the payloads that had to be sent.
+    """
+    if not payloads:
+        return []
+    by_digest = dict((payload.digest, payload) for payload in payloads)
+    stdin, stdout, stderr = client.exec_command(
+        'missing=$(for digest in %(digests)s; do [ -f %(cache)s/$digest ] || echo $digest; done)\n'
+        'echo $missing\n'
+        '[ -n "$missing" ] || exit 0\n'
+        'mkdir -p %(cache)s && stock=$(mktemp -d %(cache)s/.stock.XXXXXX) || exit 1\n'
+        'trap \'rm -rf "$stock"\' EXIT\n'
+        'tar -xf - -C "$stock" || exit 1\n'
+        'for packed in "$stock"/*.gz; do [ ! -f "$packed" ] || gunzip "$packed" || exit 1; done\n'
+        'mv "$stock"/* %(cache)s/ && rmdir "$stock" && echo stocked\n' % dict(
+            digests=' '.join(sorted(by_digest)), cache=quote(PAYLOAD_CACHE)))
+    lines = iter(stdout)
+    missing = [by_digest[digest] for digest in next(lines, '').split()]
+    if missing:
+        for chunk in _tar_payloads(missing):
+            stdin.write(chunk)
+    stdin.channel.shutdown_write()
+    if missing and next(lines, '').strip() != 'stocked':
+        raise IOError('could not store payloads in %s' % PAYLOAD_CACHE)
+    return missing
+
+
+def _tar_payloads(payloads):
+    """
+    Yield a tar of the payloads' packed bytes, named by digest and with .gz
+    on the gzipped ones, without the padding to 10 KB records tarfile adds.
+    """
+    for payload in payloads:
+        info = tarfile.TarInfo(payload.digest + ('.gz' if payload.gzipped else ''))
+        info.size = len(payload.data)
+        yield info.tobuf()
+        yield payload.data
+        yield tarfile.NUL * (-len(payload.data) % tarfile.BLOCKSIZE)
+    yield tarfile.NUL * 2 * tarfile.BLOCKSIZE
 
-    for key, value in list(dict_headers.items()):
-        request.add_header(key, value)
 
-    if url.lower().startswith("https://") and hasattr(ssl, '_create_unverified_context'):
-        context = ssl._create_unverified_context()
-        response = urlopen(request, context=context)
+class _ConnectionGate(object):
+    """
+    Bound how many bees may be setting up their SSH connection at once and
+    space the handshakes out by `stagger` seconds, so a large swarm does not
+    hit the controller and the network with every handshake in one instant.
+    """
+    def __init__(self, window, stagger):
+        self.semaphore = threading.BoundedSemaphore(window)
+        self.stagger = stagger
+        self.lock = threading.Lock()
+        self.next_start = 0
+
+    def __enter__(self):
+        self.semaphore.acquire()
+        with self.lock:
+            now = time.time()
+            wait = self.next_start - now
+            self.next_start = max(now, self.next_start) + self.stagger
+        if wait > 0:
+            time.sleep(wait)
+
+    def __exit__(self, *exc_info):
+        self.semaphore.release()
+
+
+def _connect(params):
+    """
+    Open an SSH connection to the bee, waiting for a slot in the swarm's
+    connection window if there is one.  With the broker, this only makes
+    sure the broker has a live connection to the bee.
+    """
+    pem_path = params.get('key_name') and _get_pem_path(params['key_name']) or None
+    if params.get('broker'):
+        # the broker keeps the connection open once this command is done
+        client = broker.BrokerClient(
+            params['instance_name'],
+            params['username'],
+            pem_path if os.path.isfile(pem_path) else None,
+            port=SSH_PORT)
     else:
-        response = urlopen(request)
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+
+    gate = params.get('gate')
+    if gate is not None:
+        gate.__enter__()
+    try:
+        if params.get('broker'):
+            client.connect()
+        elif not os.path.isfile(pem_path):
+            client.load_system_host_keys()
+            client.connect(params['instance_name'], SSH_PORT, username=params['username'])
+        else:
+            client.connect(
+                params['instance_name'],
+                SSH_PORT,
+                username=params['username'],
+                key_filename=pem_path)
+    finally:
+        if gate is not None:
+            gate.__exit__(None, None, None)
+
+    return client
 
-    response.read()
+
+def _run_swarm(worker, params, window=SSH_WINDOW, stagger=SSH_STAGGER):
+    """
+    Run `worker` for every bee from this one process and return the results
+    in the same order as `params`, like Pool.map did.
+
+    Each bee gets a thread, since she spends the attack waiting on her SSH
+    channel, while the connection gate bounds how many handshakes are in
+    flight at once. The threads keep the default stack size: it can only be
+    set for the whole process, where the ticker and the up() pollers are
+    starting threads of their own, and an untouched stack costs address
+    space rather than memory anyway.
+    """
+    gate = _ConnectionGate(window, stagger)
+    results = [None] * len(params)
+    errors = []
+
+    def run(i):
+        try:
+            results[i] = worker(params[i])
+        except Exception as e:
+            errors.append(e)
+
+    for param in params:
+        param['gate'] = gate
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(params))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        raise errors[0]
+    return results
 
 
 def _attack(params):
     """
     Test the target URL with requests.
 
-    Intended for use with multiprocessing.
+    Intended for use with _run_swarm.
     """
     print('Bee %i is joining the swarm.' % params['i'])
 
     try:
-        client = paramiko.SSHClient()
-        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        client = _connect(params)
 
-        pem_path = params.get('key_name') and _get_pem_path(params['key_name']) or None
-        if not os.path.isfile(pem_path):
-            client.load_system_host_keys()
-            client.connect(params['instance_name'], username=params['username'])
-        else:
-            client.connect(
-                params['instance_name'],
-                username=params['username'],
-                key_filename=pem_path)
+        sent = _stock_payloads(client, list(params['payloads'].values()))
+        if sent:
+            print('Bee %i is loading %i bytes of ammo.' % (params['i'], sum(len(payload.data) for payload in sent)))
 
         print('Bee %i is firing her machine gun. Bang bang!' % params['i'])
 
-        options = ''
-        if params['headers'] is not '':
-            for h in params['headers'].split(';'):
-                if h != '':
-                    options += ' -H "%s"' % h.strip()
+        engine = ENGINES[params.get('engine') or 'ab']
+        stdout = _run_job(client, engine.job(params), params.get('barrier'), params['i'])
+        response = engine.parse(stdout, params)
+        if response is None:
+            return None
+
+        print('Bee %i is out of ammo.' % params['i'])
 
-        if params['contenttype'] is not '':
-            options += ' -T %s' % params['contenttype']
+        client.close()
 
-        stdin, stdout, stderr = client.exec_command('mktemp')
-        # paramiko's read() returns bytes which need to be converted back to a str
-        params['csv_filename'] = IS_PY2 and stdout.read().strip() or stdout.read().decode('utf-8').strip()
-        if params['csv_filename']:
-            options += ' -e %(csv_filename)s' % params
+        return response
+    except socket.error as e:
+        return e
+    except Exception as e:
+        traceback.print_exc()
+        print()
+        raise e
+    finally:
+        # don't leave the rest of the swarm waiting on a bee that fell out
+        if params.get('barrier') is not None:
+            params['barrier'].drop(params['i'])
+
+
+# marks the start of a named section in the output of a bee's job
+JOB_SECTION = '--bees-result-%s--'
+# the job line that waits for the instant to start firing at
+JOB_START = 'read -r BEES_START'
+
+
+def _build_job(params, commands, wait=True, files=()):
+    """
+    Wrap the given shell commands into a self-contained job for a bee.
+
+    The job makes its own scratch directory, links the post file, the
+    workload table, her share of the corpus, the CSV columns for
+    placeholders and the native engine (if any) from the bee's payload
+    cache into it as $BEES_TMP/post, $BEES_TMP/workload, $BEES_TMP/corpus,
+    $BEES_TMP/columns and $BEES_TMP/native (see _stock_payloads), unpacks
+    any other `files` the engine needs into it, and cleans up after itself,
+    so that everything else the bee needs travels over the one channel
+    that runs it.
+    """
+    job = ['BEES_TMP=$(mktemp -d)', 'trap \'rm -rf "$BEES_TMP"\' EXIT']
+    for name, payload in sorted(params['payloads'].items()):
+        job.append('ln -s "$HOME"/%s "$BEES_TMP/%s"' % (quote('%s/%s' % (PAYLOAD_CACHE, payload.digest)), name))
+    for name, data in files:
+        job.extend(_job_file(name, data))
+    if params.get('barrier') is not None:
+        # report armed and read the wall-clock instant _run_job sends once
+        # the whole swarm is, then sleep until it unless the commands
+        # rather wait for $BEES_START themselves
+        job.extend(['echo %s' % quote(JOB_SECTION % 'ready'), JOB_START])
+        if wait:
+            job.append('sleep $(awk -v start="$BEES_START" -v now="$(date +%s.%N)" \'BEGIN { d = start - now; print (d > 0 ? d : 0) }\')')
+    job.append('BEES_STARTED=$(date +%s.%N)')
+    job.extend(commands)
+    job.extend([
+        'echo %s' % quote(JOB_SECTION % 'times'),
+        'echo "$BEES_STARTED $(date +%s.%N)"'])
+    return '\n'.join(job) + '\n'
+
+
+def _job_file(name, data):
+    """
+    Return the job lines that write `data` to $BEES_TMP/`name` on the bee.
+    """
+    encoded = base64.b64encode(data).decode('ascii')
+    lines = ['base64 -d > "$BEES_TMP/%s" <<\'BEES_FILE\'' % name]
+    lines.extend(encoded[i:i + 76] for i in range(0, len(encoded), 76))
+    lines.append('BEES_FILE')
+    return lines
+
+
+def _run_job(client, job, barrier=None, bee=None):
+    """
+    Run a job built by _build_job on the bee and return its stdout.
+
+    With a start barrier, the job is sent up to the line where it waits
+    for the start instant. Once the bee reports it is armed and the
+    barrier has given out the instant, that goes down the same stdin as
+    the rest of the job, which bash only reads as it gets to it.
+    """
+    stdin, stdout, stderr = client.exec_command('bash -s')
+    if barrier is not None:
+        head, tail = job.split(JOB_START + '\n', 1)
+        stdin.write(head + JOB_START + '\n')
+        for line in stdout:
+            if line.rstrip('\n') == JOB_SECTION % 'ready':
+                job = '%f\n%s' % (barrier.wait(bee), tail)
+                break
         else:
-            print('Bee %i lost sight of the target (connection timed out creating csv_filename).' % params['i'])
-            return None
+            barrier.drop(bee)
+            job = ''
+    stdin.write(job)
+    stdin.channel.shutdown_write()
+    return stdout
+
+
+def _get_job_times(text):
+    """
+    Return the wall-clock (started, finished) times a job reported in its
+    times section, or None if it didn't get that far.
+    """
+    try:
+        started, finished = [float(t) for t in text.split()]
+    except ValueError:
+        return None
+    return started, finished
+
+
+class _StartBarrier(object):
+    """
+    Hold the swarm's fire until every bee is armed, then hand them all the
+    same wall-clock instant to start at, START_LEAD seconds on so that it
+    reaches the bees in time. Bees that won't make it are dropped, and
+    `timeout` seconds after the first bee is armed the others go without
+    the stragglers.
+    """
+    def __init__(self, bees, lead=START_LEAD, timeout=START_TIMEOUT):
+        self.pending = set(bees)
+        self.lead = lead
+        self.timeout = timeout
+        # connecting and sending the payload take as long as they take, so
+        # the countdown only starts once there is a bee waiting
+        self.deadline = None
+        self.start = None
+        self.condition = threading.Condition()
+
+    def _release(self):
+        if self.start is None:
+            self.start = time.time() + self.lead
+            self.condition.notify_all()
+
+    def wait(self, bee):
+        """
+        Report a bee armed and return the instant to start firing at.
+        """
+        with self.condition:
+            self.pending.discard(bee)
+            if not self.pending:
+                self._release()
+            if self.deadline is None:
+                self.deadline = time.time() + self.timeout
+            while self.start is None:
+                remaining = self.deadline - time.time()
+                if remaining <= 0:
+                    print('bees: warning: %i bees were not armed after %i seconds, the rest of the swarm is going without them.' % (len(self.pending), self.timeout))
+                    self._release()
+                    break
+                self.condition.wait(remaining)
+            return self.start
+
+    def drop(self, bee):
+        """
+        Stop waiting for a bee that won't make it to the start.
+        """
+        with self.condition:
+            if bee in self.pending:
+                self.pending.discard(bee)
+                if not self.pending:
+                    self._release()
+
+
+def _pack_job_output(commands):
+    """
+    Wrap commands so that their output is gzipped and base64 encoded on the
+    bee, in a section of its own that _unpack_job_output opens up again.
+    """
+    return [
+        'echo %s' % quote(JOB_SECTION % 'packed'),
+        '{\n%s\n} | gzip -c | base64 -w 0' % '\n'.join(commands),
+        'echo']
+
+
+def _unpack_job_output(sections):
+    """
+    Replace the packed section of a job's output with the sections inside.
+    """
+    packed = sections.pop('packed', '').strip()
+    if packed:
+        sections.update(_split_job_output(gzip.decompress(base64.b64decode(packed)).decode('utf-8')))
+    return sections
+
+
+def _split_job_output(output):
+    """
+    Split a job's output on its section markers. Whatever precedes the first
+    marker is returned under None.
+    """
+    sections = {}
+    name, lines = None, []
+    for line in output.splitlines():
+        match = re.match('^' + JOB_SECTION % '([a-z]+)' + '$', line)
+        if match:
+            sections[name] = '\n'.join(lines)
+            name, lines = match.group(1), []
+        else:
+            lines.append(line)
+    sections[name] = '\n'.join(lines)
+    return sections
 
-        if params['post_file']:
-            pem_file_path=_get_pem_path(params['key_name'])
-            scpCommand = "scp -q -o 'StrictHostKeyChecking=no' -i %s %s %s@%s:~/" % (pem_file_path, params['post_file'], params['username'], params['instance_name'])
-            os.system(scpCommand)
-            options += ' -p ~/%s' % params['post_file']
+
+class _Engine(object):
+    """
+    A load generator the bees can fire with.
+
+    An engine turns a bee's params into the shell commands of her job, and
+    the job's output back into a result with the keys _summarize_results
+    works with: the SUMMARY_METRICS, and where the engine can tell, a
+    latency histogram or request_time_cdf, a per-second timeline, the
+    started and finished times and the bytes received.  Engines are looked
+    up by the name in ENGINES.
+    """
+    name = None
+    # files the job unpacks into $BEES_TMP before the swarm starts
+    files = ()
+    # whether the commands wait for $BEES_START themselves, rather than
+    # the job sleeping until then (see _build_job)
+    waits_for_start = False
+    # whether the engine fires for --seconds rather than -n requests
+    timed = False
+
+    def commands(self, params):
+        """
+        Return the shell commands that run the engine on the bee.
+        """
+        raise NotImplementedError
+
+    def parse(self, stdout, params):
+        """
+        Read the job's output into a result, or return None if the bee
+        lost sight of the target.
+        """
+        raise NotImplementedError
+
+    def job(self, params):
+        return _build_job(params, self.commands(params), wait=not self.waits_for_start, files=self.files)
+
+    def _read_sections(self, stdout):
+        # paramiko's read() returns bytes which need to be converted back to a str
+        return _split_job_output(stdout.read().decode('utf-8'))
+
+    def _add_times(self, response, sections):
+        times = _get_job_times(sections.get('times', ''))
+        if times and 'started' not in response:
+            response['started'], response['finished'] = times
+        return response
+
+
+class _AbEngine(_Engine):
+    """
+    ApacheBench, which most bee images have.  Its report is scraped for the
+    totals, its percentile csv gives the latency distribution and its -g
+    output the per-second timeline.
+    """
+    name = 'ab'
+
+    def commands(self, params):
+        request = params['request']
+        options = ''
+        cookies = None
+        for name, value in request.headers:
+            if name == 'Content-Type':
+                # ab wants the content type of the post file this way
+                options += ' -T %s' % quote(value)
+            elif name == 'Cookie':
+                cookies = value
+            else:
+                options += ' -H %s' % quote('%s: %s' % (name, value))
+
+        options += ' -e "$BEES_TMP/cdf.csv" -g "$BEES_TMP/requests.tsv"'
+
+        if request.body_hash:
+            options += ' -p "$BEES_TMP/post"'
 
         if params['keep_alive']:
             options += ' -k'
 
-        if params['cookies'] is not '':
-            options += ' -H \"Cookie: %s;sessionid=NotARealSessionID;\"' % params['cookies']
+        if cookies is not None:
+            options += ' -H %s' % quote('Cookie: %s;sessionid=NotARealSessionID;' % cookies)
         else:
             options += ' -C \"sessionid=NotARealSessionID\"'
 
-        if params['ciphers'] is not '':
+        if params['ciphers'] != '':
             options += ' -Z %s' % params['ciphers']
 
-        if params['basic_auth'] is not '':
-            options += ' -A %s' % params['basic_auth']
-
         params['options'] = options
-        # substrings to use for grep to perform remote output filtering
-        # resolves issue #194, too much data sent over SSH control channel to BWMG
-        # any future statistics parsing that requires more output from ab
-        # may need this line altered to include other patterns
-        params['output_filter_patterns'] = '\n'.join(['Time per request:', 'Requests per second: ', 'Failed requests: ', 'Connect: ', 'Receive: ', 'Length: ', 'Exceptions: ', 'Complete requests: ', 'HTTP/1.1'])
-        benchmark_command = 'ab -v 3 -r -n %(num_requests)s -c %(concurrent_requests)s %(options)s "%(url)s" 2>/dev/null | grep -F "%(output_filter_patterns)s"' % params
+        # ab -v 3 prints every response's headers, so the status lines are
+        # counted on the bee and only the summary lines are kept (see #194)
+        params['output_filter'] = ('/^HTTP\\/1\\.[01] [0-9]/ { codes[substr($2, 1, 1)]++; next } '
+                                   '/^(Complete requests|Failed requests|Requests per second|Time per request):|Exceptions: / { print } '
+                                   'END { for (c = 2; c <= 5; c++) printf "Responses %ixx: %i\\n", c, codes[c] }')
+        benchmark_command = 'ab -v 3 -r -n %(num_requests)s -c %(concurrent_requests)s %(options)s %(url)s 2>/dev/null | awk %(output_filter)s' % dict(params, url=quote(request.url), output_filter=quote(params['output_filter']))
         print(benchmark_command)
-        stdin, stdout, stderr = client.exec_command(benchmark_command)
-
+        return _pack_job_output([
+            benchmark_command,
+            'echo %s' % quote(JOB_SECTION % 'csv'),
+            'tail -n +2 "$BEES_TMP/cdf.csv" | cut -d , -f 2',
+            # boil the line ab writes per request down to a count and total
+            # time for every second (columns 2 and 5 are when it started and
+            # how long it took); ab doesn't say which ones failed
+            'echo %s' % quote(JOB_SECTION % 'timeline'),
+            'awk -F \'\\t\' \'NR > 1 { n[$2]++; ms[$2] += $5 } END { for (s in n) print s, n[s], 0, ms[s] }\' "$BEES_TMP/requests.tsv"'])
+
+    def parse(self, stdout, params):
         response = {}
 
-        # paramiko's read() returns bytes which need to be converted back to a str
-        ab_results = IS_PY2 and stdout.read() or stdout.read().decode('utf-8')
+        job_output = _unpack_job_output(self._read_sections(stdout))
+        ab_results = job_output[None]
         ms_per_request_search = re.search('Time\ per\ request:\s+([0-9.]+)\ \[ms\]\ \(mean\)', ab_results)
 
         if not ms_per_request_search:
@@ -496,88 +1276,431 @@ def _attack(params):
 
         complete_requests_search = re.search('Complete\ requests:\s+([0-9]+)', ab_results)
 
-        response['number_of_200s'] = len(re.findall('HTTP/1.1\ 2[0-9][0-9]', ab_results))
-        response['number_of_300s'] = len(re.findall('HTTP/1.1\ 3[0-9][0-9]', ab_results))
-        response['number_of_400s'] = len(re.findall('HTTP/1.1\ 4[0-9][0-9]', ab_results))
-        response['number_of_500s'] = len(re.findall('HTTP/1.1\ 5[0-9][0-9]', ab_results))
+        for status_class in range(2, 6):
+            count = re.search('Responses %ixx: ([0-9]+)' % status_class, ab_results)
+            response['number_of_%i00s' % status_class] = int(count.group(1)) if count else 0
 
         response['ms_per_request'] = float(ms_per_request_search.group(1))
         response['requests_per_second'] = float(requests_per_second_search.group(1))
         response['failed_requests'] = float(failed_requests.group(1))
         response['complete_requests'] = float(complete_requests_search.group(1))
 
-        stdin, stdout, stderr = client.exec_command('cat %(csv_filename)s' % params)
-        response['request_time_cdf'] = []
-        for row in csv.DictReader(stdout):
-            row["Time in ms"] = float(row["Time in ms"])
-            response['request_time_cdf'].append(row)
+        response['request_time_cdf'] = [float(t) for t in job_output.get('csv', '').split()]
         if not response['request_time_cdf']:
             print('Bee %i lost sight of the target (connection timed out reading csv).' % params['i'])
             return None
 
-        print('Bee %i is out of ammo.' % params['i'])
+        response['timeline'] = sorted([int(second), int(complete), int(failed), float(ms)]
+                                      for second, complete, failed, ms in
+                                      (line.split() for line in job_output.get('timeline', '').splitlines() if line.strip()))
 
-        client.close()
+        return self._add_times(response, job_output)
+
+
+class _NativeEngine(_Engine):
+    """
+    The load generator in native.py, shipped to the bee and run with her
+    python3.  It is the only engine that can keep an arrival rate, follow
+    a load profile, draw from a request mix and stream its results.
+    """
+    name = 'native'
+    waits_for_start = True
+
+    def job(self, params):
+        # the engine reads the request from its template rather than from
+        # options rendered for every bee
+        files = [('request.json', params['request'].as_json().encode('utf-8'))]
+        return _build_job(params, self.commands(params), wait=False, files=files)
+
+    def commands(self, params):
+        args = ['-n', params['num_requests'], '-c', params['concurrent_requests']]
+        if params.get('interval'):
+            args += ['-i', params['interval']]
+        if params.get('arrival_rate'):
+            args += ['-r', params['arrival_rate']]
+        if params.get('profile'):
+            args += ['-P', native.format_profile(params['profile'], params['profile_share'])]
+
+        benchmark_command = 'python3 "$BEES_TMP/native" %s -R "$BEES_TMP/request.json"' % ' '.join(quote(str(a)) for a in args)
+        if params.get('barrier') is not None:
+            # the engine waits for the start itself, once it is set up
+            benchmark_command += ' -S "$BEES_START"'
+        if params['request'].body_hash:
+            benchmark_command += ' -p "$BEES_TMP/post"'
+        if 'workload' in params['payloads']:
+            benchmark_command += ' -W "$BEES_TMP/workload"'
+        if 'corpus' in params['payloads']:
+            benchmark_command += ' -B "$BEES_TMP/corpus"'
+        if params['expand']:
+            benchmark_command += ' -E -b %i -k %i' % (params['i'], params['bees'])
+        if 'columns' in params['payloads']:
+            benchmark_command += ' -V "$BEES_TMP/columns"'
+        print(benchmark_command)
+        return [benchmark_command]
+
+    def parse(self, stdout, params):
+        # read the records as they arrive rather than waiting for the bee to
+        # finish, so the ticker stays live and a bee that dies halfway still
+        # reports the intervals it got through
+        response = None
+        streamed = []
+        times = None
+        for line in stdout:
+            if not line.startswith(native.PACKED):
+                # the only other thing the job prints is its times section
+                times = _get_job_times(line) or times
+                continue
+            record = native.unpack_result(line)
+            if record.get('type') == 'interval':
+                streamed.append(record)
+                if params.get('ticker') is not None:
+                    params['ticker'].put((params['i'], record))
+            else:
+                response = record
+
+        if response is None:
+            if not streamed:
+                print('Bee %i lost sight of the target (native engine did not report results).' % params['i'])
+                return None
+            print('Bee %i went quiet after %i intervals, using what she streamed so far.' % (params['i'], len(streamed)))
+            stats = native.Stats()
+            for record in streamed:
+                stats.merge(native.Stats.from_result(record))
+            response = stats.as_result(len(streamed) * params['interval'])
+
+        histogram = native.Histogram.load(response['histogram'])
+        response['request_time_cdf'] = histogram.percentiles(list(range(100)))
+        if times and 'started' not in response:
+            response['started'], response['finished'] = times
 
         return response
-    except socket.error as e:
-        return e
-    except Exception as e:
-        traceback.print_exc()
-        print()
-        raise e
 
 
-def _summarize_results(results, params, csv_filename):
-    summarized_results = dict()
-    summarized_results['timeout_bees'] = [r for r in results if r is None]
-    summarized_results['exception_bees'] = [r for r in results if type(r) == socket.error]
-    summarized_results['complete_bees'] = [r for r in results if r is not None and type(r) != socket.error]
-    summarized_results['timeout_bees_params'] = [p for r, p in zip(results, params) if r is None]
-    summarized_results['exception_bees_params'] = [p for r, p in zip(results, params) if type(r) == socket.error]
-    summarized_results['complete_bees_params'] = [p for r, p in zip(results, params) if r is not None and type(r) != socket.error]
-    summarized_results['num_timeout_bees'] = len(summarized_results['timeout_bees'])
-    summarized_results['num_exception_bees'] = len(summarized_results['exception_bees'])
-    summarized_results['num_complete_bees'] = len(summarized_results['complete_bees'])
+class _HurlEngine(_Engine):
+    """
+    hurl (https://github.com/VerizonDigital/hlx), which runs for a number
+    of seconds rather than requests and reports its totals as JSON.  It
+    doesn't report a latency distribution.
+    """
+    name = 'hurl'
+    timed = True
+
+    def commands(self, params):
+        request = params['request']
+        options = ''
+        for header in request.headers:
+            options += ' -H %s' % quote('%s: %s' % header)
+
+        options += ' -o "$BEES_TMP/out.json"'
+
+        if request.body_hash:
+            options += ' -d "$BEES_TMP/post"'
+
+        if params.get('seconds'):
+            options += ' -l %d' % params['seconds']
+
+        if params.get('rate'):
+            options += ' -A %d' % params['rate']
+
+        if params.get('responses_per'):
+            options += ' -L'
+
+        options += ' -X %s' % request.method
+
+        if params.get('threads'):
+            options += ' -t %d' % params['threads']
+
+        if params.get('fetches'):
+            options += ' -f %d' % params['fetches']
+
+        if params.get('timeout'):
+            options += ' -T %d' % params['timeout']
+
+        if params.get('send_buffer'):
+            options += ' -S %d' % params['send_buffer']
+
+        if params.get('recv_buffer'):
+            options += ' -R %d' % params['recv_buffer']
+
+        params['options'] = options
+        hurl_command = 'hurl %(url)s -p %(concurrent_requests)s %(options)s -j' % dict(params, url=quote(request.url))
+        print(hurl_command)
+        return [
+            hurl_command,
+            'echo %s' % quote(JOB_SECTION % 'json'),
+            # the json doesn't end in a newline
+            'cat "$BEES_TMP/out.json"; echo']
+
+    def parse(self, stdout, params):
+        job_output = self._read_sections(stdout)
+        try:
+            hurl_json = json.loads(job_output.get('json', ''))
+        except ValueError:
+            print('Bee %i lost sight of the target (hurl did not report results).' % params['i'])
+            return None
+
+        if params.get('long_output'):
+            print('Bee %i (%s):' % (params['i'], params['instance_id']))
+            print(job_output[None])
+            for k, v in sorted(hurl_json.items()):
+                print('     %s:\t%s' % (k, v))
+
+        codes = dict((status_class, 0) for status_class in range(2, 6))
+        for code, count in (hurl_json.get('response-codes') or {}).items():
+            if str(code)[:1] in '2345':
+                codes[int(str(code)[:1])] += int(count)
+        fetches = int(hurl_json.get('fetches', 0))
+
+        response = {
+            'complete_requests': fetches,
+            # fetches that got no status line at all
+            'failed_requests': max(fetches - sum(codes.values()), 0),
+            'failed_requests_connect': 0,
+            'failed_requests_receive': 0,
+            'failed_requests_length': 0,
+            'failed_requests_exceptions': 0,
+            'requests_per_second': float(hurl_json.get('fetches-per-sec', 0)),
+            'ms_per_request': float(hurl_json.get('end2end-ms-mean', hurl_json.get('1st-resp-ms-mean', 0))),
+            'bytes': int(hurl_json.get('bytes', 0)),
+        }
+        for status_class, count in codes.items():
+            response['number_of_%i00s' % status_class] = count
+        return self._add_times(response, job_output)
+
+
+# wrk runs this script to count responses by status class in every thread
+# and print the totals and latency percentiles in a form bees can read
+WRK_SCRIPT = """\
+local threads = {}
+
+function setup(thread)
+   table.insert(threads, thread)
+end
+
+local body = os.getenv("BEES_BODY")
+if body then
+   local f = assert(io.open(body, "rb"))
+   wrk.body = f:read("*a")
+   f:close()
+   wrk.method = "POST"
+end
+wrk.method = os.getenv("BEES_METHOD") or wrk.method
+
+codes = {}
+
+function response(status, headers, body)
+   local class = math.floor(status / 100)
+   codes[class] = (codes[class] or 0) + 1
+end
+
+function done(summary, latency, requests)
+   local e = summary.errors
+   io.write(string.format("bees requests %d\\nbees duration %d\\nbees bytes %d\\n",
+                          summary.requests, summary.duration, summary.bytes))
+   io.write(string.format("bees connect %d\\nbees read %d\\nbees write %d\\nbees timeout %d\\n",
+                          e.connect, e.read, e.write, e.timeout))
+   for class = 2, 5 do
+      local count = 0
+      for _, thread in ipairs(threads) do
+         count = count + (thread:get("codes")[class] or 0)
+      end
+      io.write(string.format("bees %dxx %d\\n", class, count))
+   end
+   io.write(string.format("bees mean %f\\n", latency.mean))
+   for p = 0, 99 do
+      io.write(string.format("bees p%d %d\\n", p, latency:percentile(p)))
+   end
+end
+"""
+
+
+class _WrkEngine(_Engine):
+    """
+    wrk (https://github.com/wg/wrk), which runs for a number of seconds
+    rather than requests.  A Lua script reports its totals, the responses
+    by status class and the latency percentiles.
+    """
+    name = 'wrk'
+    timed = True
+    files = (('report.lua', WRK_SCRIPT.encode('utf-8')),)
+
+    def commands(self, params):
+        request = params['request']
+        connections = params['concurrent_requests']
+        options = ' -c %d -t %d' % (connections, max(1, min(params.get('threads') or 1, connections)))
+        options += ' -d %ds' % (params.get('seconds') or 60)
+        if params.get('timeout'):
+            options += ' --timeout %ds' % params['timeout']
+        for header in request.headers:
+            options += ' -H %s' % quote('%s: %s' % header)
+
+        environment = 'BEES_METHOD=%s ' % request.method
+        if request.body_hash:
+            environment += 'BEES_BODY="$BEES_TMP/post" '
+        benchmark_command = '%swrk%s -s "$BEES_TMP/report.lua" %s' % (environment, options, quote(request.url))
+        print(benchmark_command)
+        return [benchmark_command]
+
+    def parse(self, stdout, params):
+        job_output = self._read_sections(stdout)
+        report = dict(re.findall(r'^bees (\S+) (\S+)$', job_output[None], re.M))
+        if 'requests' not in report or not float(report['duration']):
+            print('Bee %i lost sight of the target (wrk did not report results).' % params['i'])
+            return None
+
+        response = {
+            'complete_requests': int(report['requests']),
+            'failed_requests_connect': int(report['connect']),
+            'failed_requests_receive': int(report['read']),
+            'failed_requests_length': 0,
+            'failed_requests_exceptions': int(report['write']) + int(report['timeout']),
+            'requests_per_second': int(report['requests']) / (float(report['duration']) / 1000000),
+            # wrk reports latencies in microseconds
+            'ms_per_request': float(report['mean']) / 1000,
+            'request_time_cdf': [int(report['p%i' % p]) / 1000.0 for p in range(100)],
+            'bytes': int(report['bytes']),
+        }
+        response['failed_requests'] = (response['failed_requests_connect'] + response['failed_requests_receive'] +
+                                       response['failed_requests_exceptions'])
+        for status_class in range(2, 6):
+            response['number_of_%i00s' % status_class] = int(report['%ixx' % status_class])
+        return self._add_times(response, job_output)
+
 
-    complete_results = [r['complete_requests'] for r in summarized_results['complete_bees']]
-    summarized_results['total_complete_requests'] = sum(complete_results)
+def _basic_auth_token(basic_auth):
+    return base64.b64encode(basic_auth.encode('utf-8')).decode('ascii')
 
-    complete_results = [r['failed_requests'] for r in summarized_results['complete_bees']]
-    summarized_results['total_failed_requests'] = sum(complete_results)
 
-    complete_results = [r['failed_requests_connect'] for r in summarized_results['complete_bees']]
-    summarized_results['total_failed_requests_connect'] = sum(complete_results)
+# The engines the bees can fire with, by the name given to --engine
+ENGINES = dict((engine.name, engine) for engine in (_AbEngine(), _NativeEngine(), _HurlEngine(), _WrkEngine()))
 
-    complete_results = [r['failed_requests_receive'] for r in summarized_results['complete_bees']]
-    summarized_results['total_failed_requests_receive'] = sum(complete_results)
 
-    complete_results = [r['failed_requests_length'] for r in summarized_results['complete_bees']]
-    summarized_results['total_failed_requests_length'] = sum(complete_results)
+def _get_native_source():
+    return inspect.getsource(native)
 
-    complete_results = [r['failed_requests_exceptions'] for r in summarized_results['complete_bees']]
-    summarized_results['total_failed_requests_exceptions'] = sum(complete_results)
 
-    complete_results = [r['number_of_200s'] for r in summarized_results['complete_bees']]
-    summarized_results['total_number_of_200s'] = sum(complete_results)
+class _Ticker(object):
+    """
+    Keep a rolling cluster-wide view of the interval records the bees stream
+    back and print a live requests/sec and p99 ticker while they attack.
+    """
+    def __init__(self, interval, queue):
+        self.interval = interval
+        self.queue = queue
+        self.latest = {}
+        self.window = deque()
+        self.complete_requests = 0
+        self.failed_requests = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+
+    def start(self):
+        self.started = time.time()
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def _add(self, bee, record):
+        now = time.time()
+        self.latest[bee] = (now, record['requests_per_second'])
+        self.window.append((now, native.Histogram.load(record['histogram'])))
+        self.complete_requests += record['complete_requests']
+        self.failed_requests += record['failed_requests']
+
+    def _print(self):
+        now = time.time()
+        # bees that stopped reporting have finished or died, so only count
+        # the ones heard from recently
+        recent = now - 2 * self.interval
+        rps = sum(r for t, r in self.latest.values() if t >= recent)
+        reporting = len([t for t, r in self.latest.values() if t >= recent])
+        while self.window and self.window[0][0] < now - 3 * self.interval:
+            self.window.popleft()
+        histogram = native.Histogram()
+        for t, h in self.window:
+            histogram.merge(h)
+        print('     [%6.1fs] %10.1f [#/sec]  p99 %9.2f [ms]  %i complete, %i failed, %i bees reporting' % (
+            now - self.started, rps, histogram.percentile(99), self.complete_requests, self.failed_requests, reporting))
+
+    def _run(self):
+        next_print = time.time() + self.interval
+        while not self.stopped.is_set():
+            try:
+                bee, record = self.queue.get(timeout=max(0, next_print - time.time()))
+                self._add(bee, record)
+            except Empty:
+                pass
+            if time.time() >= next_print:
+                self._print()
+                next_print += self.interval
+
 
-    complete_results = [r['number_of_300s'] for r in summarized_results['complete_bees']]
-    summarized_results['total_number_of_300s'] = sum(complete_results)
+# The counters every engine reports, summed across the swarm by
+# _summarize_results into total_<name>; the last two are averaged instead.
+SUMMARY_METRICS = ('complete_requests', 'failed_requests', 'failed_requests_connect', 'failed_requests_receive',
+                   'failed_requests_length', 'failed_requests_exceptions', 'number_of_200s', 'number_of_300s',
+                   'number_of_400s', 'number_of_500s', 'requests_per_second', 'ms_per_request')
 
-    complete_results = [r['number_of_400s'] for r in summarized_results['complete_bees']]
-    summarized_results['total_number_of_400s'] = sum(complete_results)
 
-    complete_results = [r['number_of_500s'] for r in summarized_results['complete_bees']]
-    summarized_results['total_number_of_500s'] = sum(complete_results)
+def _summarize_results(results, params, csv_filename):
+    summarized_results = dict()
+    summarized_results['timeout_bees'] = [r for r in results if r is None]
+    summarized_results['exception_bees'] = [r for r in results if isinstance(r, socket.error)]
+    summarized_results['complete_bees'] = [r for r in results if r is not None and not isinstance(r, socket.error)]
+    summarized_results['timeout_bees_params'] = [p for r, p in zip(results, params) if r is None]
+    summarized_results['exception_bees_params'] = [p for r, p in zip(results, params) if isinstance(r, socket.error)]
+    summarized_results['complete_bees_params'] = [p for r, p in zip(results, params) if r is not None and not isinstance(r, socket.error)]
+    summarized_results['num_timeout_bees'] = len(summarized_results['timeout_bees'])
+    summarized_results['num_exception_bees'] = len(summarized_results['exception_bees'])
+    summarized_results['num_complete_bees'] = len(summarized_results['complete_bees'])
 
-    complete_results = [r['requests_per_second'] for r in summarized_results['complete_bees']]
-    summarized_results['mean_requests'] = sum(complete_results)
+    matrix = _ResultMatrix(summarized_results['complete_bees'], SUMMARY_METRICS)
+    for name in SUMMARY_METRICS[:-2]:
+        summarized_results['total_' + name] = matrix.sum(name)
+    # each bee's rate over its own run, which adds up to more than the
+    # target saw whenever the bees didn't all fire at once
+    summarized_results['bees_requests'] = matrix.sum('requests_per_second')
+    if summarized_results['complete_bees'] and all('bytes' in r for r in summarized_results['complete_bees']):
+        summarized_results['total_bytes'] = sum(r['bytes'] for r in summarized_results['complete_bees'])
 
-    complete_results = [r['ms_per_request'] for r in summarized_results['complete_bees']]
+    timeline = _merge_timelines(summarized_results['complete_bees'])
     if summarized_results['num_complete_bees'] == 0:
         summarized_results['mean_response'] = "no bees are complete"
+    elif timeline and all(r.get('timeline') for r in summarized_results['complete_bees']):
+        # every request's own time, rather than ab's estimate
+        summarized_results['mean_response'] = old_div(sum(row[3] for row in timeline), max(sum(row[1] for row in timeline), 1))
+    else:
+        # weighted by requests, so that lightly loaded bees don't skew it
+        summarized_results['mean_response'] = matrix.weighted_mean('ms_per_request', 'complete_requests')
+
+    if timeline:
+        summarized_results['timeline'] = timeline
+        rates = [row[1] for row in timeline]
+        # the attack only covers part of its first and last seconds
+        whole = rates[1:-1] or rates
+        summarized_results['peak_requests'] = max(whole)
+        # the rate kept up in 90% of the seconds
+        summarized_results['sustained_requests'] = sorted(whole)[len(whole) // 10]
+
+    if any('started' in r for r in summarized_results['complete_bees']):
+        started = [r['started'] for r in summarized_results['complete_bees'] if 'started' in r]
+        finished = [r['finished'] for r in summarized_results['complete_bees'] if 'started' in r]
+        summarized_results['attack_span'] = max(finished) - min(started)
+        summarized_results['overlap'] = max(min(finished) - max(started), 0)
+        if summarized_results['attack_span'] > 0:
+            summarized_results['span_requests_per_second'] = old_div(summarized_results['total_complete_requests'], summarized_results['attack_span'])
+
+    # the rate the target actually saw, lined up on the wall clock, over
+    # the whole seconds if the attack lasted any
+    if len(timeline) > 2 and all(r.get('timeline') for r in summarized_results['complete_bees']):
+        summarized_results['mean_requests'] = sum(whole) / len(whole)
+    elif 'span_requests_per_second' in summarized_results:
+        summarized_results['mean_requests'] = summarized_results['span_requests_per_second']
     else:
-        summarized_results['mean_response'] = old_div(sum(complete_results), summarized_results['num_complete_bees'])
+        summarized_results['mean_requests'] = summarized_results['bees_requests']
 
     summarized_results['tpr_bounds'] = params[0]['tpr']
     summarized_results['rps_bounds'] = params[0]['rps']
@@ -589,58 +1712,252 @@ def _summarize_results(results, params, csv_filename):
             summarized_results['performance_accepted'] = False
 
     if summarized_results['rps_bounds'] is not None:
-        if summarized_results['mean_requests'] > summarized_results['rps_bounds'] and summarized_results['performance_accepted'] is True or None:
+        if summarized_results['mean_requests'] > summarized_results['rps_bounds'] and summarized_results.get('performance_accepted', True):
             summarized_results['performance_accepted'] = True
         else:
             summarized_results['performance_accepted'] = False
 
-    summarized_results['request_time_cdf'] = _get_request_time_cdf(summarized_results['total_complete_requests'], summarized_results['complete_bees'])
+    complete_results = [r['target_rate'] for r in summarized_results['complete_bees'] if 'target_rate' in r]
+    if complete_results:
+        summarized_results['target_rate'] = sum(complete_results)
+        summarized_results['achieved_rate'] = sum(r['achieved_rate'] for r in summarized_results['complete_bees'])
+
+    if params[0].get('profile'):
+        summarized_results['stages'] = _summarize_stages(params[0]['profile'], summarized_results['complete_bees'])
+
+    if len(set(p.get('zone') for p in params)) > 1:
+        summarized_results['regions'] = _summarize_regions(params, summarized_results, matrix)
+
+    histogram = matrix.histogram()
+    # engines like hurl don't report a distribution to go on
+    summarized_results['request_time_cdf'] = histogram.percentiles(list(range(100))) if histogram.count else []
+    summarized_results['request_time_p99'], summarized_results['request_time_p999'] = histogram.percentiles([99, 99.9])
+    summarized_results['request_time_max'] = histogram.percentile(100)
     if csv_filename:
-        _create_request_time_cdf_csv(results, summarized_results['complete_bees_params'], summarized_results['request_time_cdf'], csv_filename)
+        _create_request_time_cdf_csv(summarized_results['complete_bees'], summarized_results['complete_bees_params'], summarized_results['request_time_cdf'], csv_filename,
+                                     summarized_results.get('regions'))
 
     return summarized_results
 
 
-def _create_request_time_cdf_csv(results, complete_bees_params, request_time_cdf, csv_filename):
-    if csv_filename:
-        # csv requires files in text-mode with newlines='' in python3
+def _merge_timelines(complete_bees):
+    """
+    Line up the per-second [second, complete, failed, ms] buckets the bees
+    reported on the wall clock and add them up into one time series for
+    the swarm, with empty buckets for any seconds in between.
+    """
+    timelines = [r['timeline'] for r in complete_bees if r.get('timeline')]
+    if timelines and numpy is not None:
+        rows = numpy.fromiter(itertools.chain.from_iterable(itertools.chain.from_iterable(timelines)),
+                              dtype=numpy.float64).reshape(-1, 4)
+        seconds = rows[:, 0].astype(numpy.int64)
+        first = int(seconds.min())
+        columns = [numpy.bincount(seconds - first, weights=rows[:, j]).tolist() for j in (1, 2, 3)]
+        return [[first + i, int(complete), int(failed), ms] for i, (complete, failed, ms) in enumerate(zip(*columns))]
+
+    merged = {}
+    for timeline in timelines:
+        for second, complete, failed, ms in timeline:
+            bucket = merged.setdefault(second, [0, 0, 0.0])
+            bucket[0] += complete
+            bucket[1] += failed
+            bucket[2] += ms
+    if not merged:
+        return []
+    return [[second] + merged.get(second, [0, 0, 0.0]) for second in range(min(merged), max(merged) + 1)]
+
+
+def _summarize_stages(profile, complete_bees):
+    """
+    Combine the results each bee reported for every stage of a load profile.
+    """
+    stages = []
+    for i, stage in enumerate(profile):
+        results = [r['stages'][i] for r in complete_bees if len(r.get('stages', ())) > i]
+        histogram = _merge_histograms(results)
+        summary = {
+            'name': native.stage_name(stage),
+            'target_rate': (stage[1] + stage[2]) / 2.0,
+            'total_complete_requests': sum(r['complete_requests'] for r in results),
+            'total_failed_requests': sum(r['failed_requests'] for r in results),
+            'mean_requests': sum(r['requests_per_second'] for r in results),
+            'mean_response': histogram.mean(),
+        }
+        summary['request_time_p50'], summary['request_time_p90'], summary['request_time_p99'] = histogram.percentiles([50, 90, 99])
+        stages.append(summary)
+    return stages
+
+
+def _summarize_regions(params, summarized_results, matrix):
+    """
+    Break the results of an attack from several regions down by the zone
+    each bee attacked from.
+    """
+    regions = []
+    for zone in sorted(set(p['zone'] for p in params)):
+        rows = [i for i, p in enumerate(summarized_results['complete_bees_params']) if p['zone'] == zone]
+        histogram = matrix.histogram(rows)
+        summary = {
+            'zone': zone,
+            'num_bees': len([p for p in params if p['zone'] == zone]),
+            'num_complete_bees': len(rows),
+            'total_complete_requests': matrix.sum('complete_requests', rows),
+            'total_failed_requests': matrix.sum('failed_requests', rows),
+            'mean_requests': matrix.sum('requests_per_second', rows),
+            'mean_response': matrix.weighted_mean('ms_per_request', 'complete_requests', rows) if rows else float('nan'),
+            'request_time_cdf': histogram.percentiles(list(range(100))) if histogram.count else [],
+        }
+        summary['request_time_p99'] = histogram.percentile(99) if histogram.count else float('nan')
+        regions.append(summary)
+    return regions
+
+
+def _create_request_time_cdf_csv(complete_bees, complete_bees_params, request_time_cdf, csv_filename, regions=None):
+    if csv_filename:
+        # csv requires files in text-mode with newlines=''
         # see http://python3porting.com/problems.html#csv-api-changes
-        openmode = IS_PY2 and 'w' or 'wt'
-        openkwargs = IS_PY2 and {} or {'encoding': 'utf-8', 'newline': ''}
-        with open(csv_filename, openmode, openkwargs) as stream:
+        with open(csv_filename, 'wt', encoding='utf-8', newline='') as stream:
             writer = csv.writer(stream)
             header = ["% faster than", "all bees [ms]"]
+            for region in regions or []:
+                header.append("region %(zone)s [ms]" % region)
             for p in complete_bees_params:
                 header.append("bee %(instance_id)s [ms]" % p)
             writer.writerow(header)
-            for i in range(100):
-                row = [i, request_time_cdf[i]] if i < len(request_time_cdf) else [i,float("inf")]
-                for r in results:
-                    if r is not None:
-                    	row.append(r['request_time_cdf'][i]["Time in ms"])
-                writer.writerow(row)
-
-
-def _get_request_time_cdf(total_complete_requests, complete_bees):
-    # Recalculate the global cdf based on the csv files collected from
-    # ab. Can do this by sampling the request_time_cdfs for each of
-    # the completed bees in proportion to the number of
-    # complete_requests they have
-    n_final_sample = 100
-    sample_size = 100 * n_final_sample
-    n_per_bee = [int(r['complete_requests'] / total_complete_requests * sample_size)
-                 for r in complete_bees]
-    sample_response_times = []
-    for n, r in zip(n_per_bee, complete_bees):
-        cdf = r['request_time_cdf']
-        for i in range(n):
-            j = int(random.random() * len(cdf))
-            sample_response_times.append(cdf[j]["Time in ms"])
-    sample_response_times.sort()
-    # python3 division returns floats so convert back to int
-    request_time_cdf = sample_response_times[0:sample_size:int(old_div(sample_size, n_final_sample))]
-
-    return request_time_cdf
+            # every cdf is a column of the csv; padding them all to 100 rows
+            # lets zip turn them into rows in one go
+            columns = [list(range(100)), request_time_cdf]
+            columns.extend(region['request_time_cdf'] for region in regions or [])
+            columns.extend(r.get('request_time_cdf', []) for r in complete_bees)
+            writer.writerows(zip(*[list(column[:100]) + [float("inf")] * (100 - len(column)) for column in columns]))
+
+
+def _get_histogram(result):
+    """
+    Return the latency histogram of a completed bee.  The native engine ships
+    one; for ab it is rebuilt from the 100-row percentile csv, counting each
+    row as a hundredth of the bee's complete requests.
+    """
+    if 'histogram' in result:
+        return native.Histogram.load(result['histogram'])
+
+    histogram = native.Histogram()
+    cdf = result.get('request_time_cdf') or []
+    complete_requests = int(result.get('complete_requests', 0))
+    for i, row in enumerate(cdf):
+        count = (i + 1) * complete_requests // len(cdf) - i * complete_requests // len(cdf)
+        if count:
+            histogram.record(row, count)
+    return histogram
+
+
+def _merge_histograms(complete_bees):
+    # Merge the per-bee histograms bucket by bucket, which is exact and
+    # costs the same however many requests the bees made
+    return _ResultMatrix(complete_bees, ()).histogram()
+
+
+class _ResultMatrix(object):
+    """
+    The results of the completed bees laid out for summarizing: a flat
+    array with a row per bee and a column per metric, filled in one pass
+    over the results, and a matrix of their histograms' buckets.  Totals,
+    means and merged histograms, for the whole swarm or for any rows of
+    it, are then reduced a column at a time.
+
+    The bucket matrix is built with numpy when it is installed; otherwise
+    each bee's histogram is kept and they are merged with
+    native.Histogram.combine, which is a few times slower.
+    """
+    def __init__(self, complete_bees, metrics):
+        self.bees = complete_bees
+        self.columns = dict((name, j) for j, name in enumerate(metrics))
+        self.width = len(metrics)
+        self.values = array('d')
+        if metrics:
+            get = operator.itemgetter(*metrics)
+            for r in complete_bees:
+                self.values.extend(get(r) if self.width > 1 else (get(r),))
+        self._buckets = None
+
+    def column(self, name, rows=None):
+        values = self.values[self.columns[name]::self.width]
+        if rows is None:
+            return values
+        return array('d', [values[i] for i in rows])
+
+    def sum(self, name, rows=None):
+        return sum(self.column(name, rows))
+
+    def weighted_mean(self, name, weight, rows=None):
+        weights = self.column(weight, rows)
+        return old_div(sum(map(operator.mul, self.column(name, rows), weights)), max(sum(weights), 1))
+
+    def histogram(self, rows=None):
+        """
+        Return the merged histogram of the given rows, or of all the bees.
+        """
+        if self._buckets is None:
+            self._buckets = self._numpy_buckets() if numpy is not None else [_get_histogram(r) for r in self.bees]
+        if numpy is None:
+            return native.Histogram.combine(self._buckets if rows is None else [self._buckets[i] for i in rows])
+
+        counts, stats = self._buckets
+        if rows is not None:
+            counts, stats = counts[rows], stats[rows]
+        counts = counts.sum(axis=0)
+        histogram = native.Histogram()
+        if len(stats):
+            histogram.counts = array('q')
+            histogram.counts.frombytes(counts.astype(numpy.int64).tobytes())
+            histogram.count, histogram.total = [int(v) for v in stats[:, :2].sum(axis=0)]
+            histogram.min = int(stats[:, 2].min())
+            histogram.max = int(stats[:, 3].max())
+            if histogram.min > native.Histogram.MAX_VALUE:
+                histogram.min = None
+        return histogram
+
+    def _numpy_buckets(self):
+        """
+        Return a bees x buckets matrix of counts, and a bees x 4 one of
+        each histogram's count, total, min and max (min being past
+        MAX_VALUE for an empty one).
+        """
+        empty = native.Histogram.MAX_VALUE + 1
+        counts = numpy.zeros((len(self.bees), native.Histogram.BUCKETS), dtype=numpy.int64)
+        stats = numpy.zeros((len(self.bees), 4), dtype=numpy.int64)
+        stats[:, 2] = empty
+        rebuild = defaultdict(list)
+        for i, r in enumerate(self.bees):
+            if 'histogram' in r:
+                histogram = native.Histogram.load(r['histogram'])
+                counts[i] = numpy.frombuffer(histogram.counts, dtype=numpy.int64)
+                stats[i] = (histogram.count, histogram.total,
+                            empty if histogram.min is None else histogram.min, histogram.max)
+            elif r.get('request_time_cdf'):
+                rebuild[len(r['request_time_cdf'])].append(i)
+
+        # the same as _get_histogram, for all the bees with a cdf of the
+        # same length at once
+        for length, rows in rebuild.items():
+            rows = numpy.array(rows)
+            cdf = numpy.array([self.bees[i]['request_time_cdf'] for i in rows], dtype=numpy.float64)
+            complete_requests = numpy.array([int(self.bees[i].get('complete_requests', 0)) for i in rows], dtype=numpy.int64)[:, None]
+            i = numpy.arange(length, dtype=numpy.int64)
+            weights = (i + 1) * complete_requests // length - i * complete_requests // length
+            values = numpy.minimum((cdf * 1000).astype(numpy.int64), native.Histogram.MAX_VALUE)
+            # Histogram.index: values past 2**SUB_BUCKET_BITS share a bucket
+            # with their neighbours within a 1/2**(SUB_BUCKET_BITS - 1) range
+            shift = numpy.frexp(values)[1].astype(numpy.int64) - native.Histogram.SUB_BUCKET_BITS
+            index = numpy.where(shift <= 0, values,
+                                (shift << (native.Histogram.SUB_BUCKET_BITS - 1)) + (values >> numpy.maximum(shift, 0)))
+            numpy.add.at(counts, (numpy.repeat(rows, length), index.ravel()), weights.ravel())
+            recorded = weights > 0
+            stats[rows, 0] = weights.sum(axis=1)
+            stats[rows, 1] = (values * weights).sum(axis=1)
+            stats[rows, 2] = numpy.where(recorded, values, empty).min(axis=1)
+            stats[rows, 3] = numpy.where(recorded, values, 0).max(axis=1)
+        return counts, stats
 
 
 def _print_results(summarized_results):
@@ -670,16 +1987,54 @@ def _print_results(summarized_results):
     print('          3xx:\t\t%i' % summarized_results['total_number_of_300s'])
     print('          4xx:\t\t%i' % summarized_results['total_number_of_400s'])
     print('          5xx:\t\t%i' % summarized_results['total_number_of_500s'])
-    print('     Requests per second:\t%f [#/sec] (mean of bees)' % summarized_results['mean_requests'])
+    if 'total_bytes' in summarized_results:
+        print('     Total transferred:\t\t%i [bytes]' % summarized_results['total_bytes'])
+    print('     Requests per second:\t%f [#/sec] (mean)' % summarized_results['mean_requests'])
+    print('     Requests per second:\t%f [#/sec] (sum of the bees\' own rates)' % summarized_results['bees_requests'])
+    if 'span_requests_per_second' in summarized_results:
+        print('     Requests per second:\t%f [#/sec] (over the whole attack)' % summarized_results['span_requests_per_second'])
+    if 'peak_requests' in summarized_results:
+        print('     Requests per second:\t%i [#/sec] (peak second)' % summarized_results['peak_requests'])
+        print('     Requests per second:\t%i [#/sec] (sustained for 90%% of seconds)' % summarized_results['sustained_requests'])
     if 'rps_bounds' in summarized_results and summarized_results['rps_bounds'] is not None:
         print('     Requests per second:\t%f [#/sec] (upper bounds)' % summarized_results['rps_bounds'])
-
-    print('     Time per request:\t\t%f [ms] (mean of bees)' % summarized_results['mean_response'])
+    if 'overlap' in summarized_results:
+        print('     Overlap window:\t\t%f [s] of %f [s] (all bees firing)' % (summarized_results['overlap'], summarized_results['attack_span']))
+
+    if 'target_rate' in summarized_results:
+        print('     Arrival rate:\t\t%f [#/sec] (achieved)' % summarized_results['achieved_rate'])
+        print('     Arrival rate:\t\t%f [#/sec] (target)' % summarized_results['target_rate'])
+        for r, p in zip(summarized_results['complete_bees'], summarized_results['complete_bees_params']):
+            print('          bee %s:\t%f of %f [#/sec]' % (p['instance_id'], r['achieved_rate'], r['target_rate']))
+
+    print('     Time per request:\t\t%f [ms] (mean of requests)' % summarized_results['mean_response'])
+    for number, stung in enumerate(summarized_results.get('sting') or [], 1):
+        print('     Time per request:\t\t%f [ms] (sting pass %i, slowest %f [ms])' % (stung['mean'], number, stung['max']))
     if 'tpr_bounds' in summarized_results and summarized_results['tpr_bounds'] is not None:
         print('     Time per request:\t\t%f [ms] (lower bounds)' % summarized_results['tpr_bounds'])
 
-    print('     50%% responses faster than:\t%f [ms]' % summarized_results['request_time_cdf'][49])
-    print('     90%% responses faster than:\t%f [ms]' % summarized_results['request_time_cdf'][89])
+    if summarized_results['request_time_cdf']:
+        print('     50%% responses faster than:\t%f [ms]' % summarized_results['request_time_cdf'][49])
+        print('     90%% responses faster than:\t%f [ms]' % summarized_results['request_time_cdf'][89])
+        print('     99%% responses faster than:\t%f [ms]' % summarized_results['request_time_p99'])
+        print('     99.9%% responses faster than:\t%f [ms]' % summarized_results['request_time_p999'])
+        print('     Longest request:\t\t%f [ms]' % summarized_results['request_time_max'])
+
+    if summarized_results.get('stages'):
+        print('     Stages:\t\t\t target rps      rps     mean      50%      90%      99%   failed')
+        for stage in summarized_results['stages']:
+            print('          %-22s%9.1f%9.1f%9.2f%9.2f%9.2f%9.2f%9i' % (
+                stage['name'], stage['target_rate'], stage['mean_requests'], stage['mean_response'],
+                stage['request_time_p50'], stage['request_time_p90'], stage['request_time_p99'],
+                stage['total_failed_requests']))
+
+    if summarized_results.get('regions'):
+        print('     Regions:\t\t\t     bees complete      rps     mean      99%   failed')
+        for region in summarized_results['regions']:
+            print('          %-22s%4i/%-4i%9i%9.1f%9.2f%9.2f%9i' % (
+                region['zone'], region['num_complete_bees'], region['num_bees'], region['total_complete_requests'],
+                region['mean_requests'], region['mean_response'], region['request_time_p99'],
+                region['total_failed_requests']))
 
     if 'performance_accepted' in summarized_results:
         print('     Performance check:\t\t%s' % summarized_results['performance_accepted'])
@@ -696,20 +2051,90 @@ def _print_results(summarized_results):
         print('Mission Assessment: Swarm annihilated target.')
 
 
-def attack(url, n, c, **options):
+def _parse_request(url, options):
     """
-    Test the root url of this site.
+    Parse the request the swarm will send into options['request'], the
+    post file into options['body'] and the payloads sent to the bees into
+    options['payloads'], once for every bee and region.  The bodies of a
+    corpus are read into options['bodies'], to be dealt out by
+    _shard_corpus.  Returns the new options, or None if they don't make a
+    request.
+    """
+    bodies = None
+    if options.get('corpus'):
+        if options.get('post_file'):
+            print('bees: error: give either a post file or a corpus, not both')
+            return None
+        try:
+            bodies = workload.load_corpus(options['corpus'])
+        except (IOError, workload.WorkloadError) as e:
+            print('bees: error: %s' % e)
+            return None
+    try:
+        request, body = _RequestTemplate.parse(options)
+    except ValueError as e:
+        print('bees: error: %s' % e)
+        return None
+    payloads = {'post': _Payload.pack(body)} if body is not None else {}
+    if options.get('engine') == 'native':
+        # the engine itself is cached like any other payload, rather than
+        # sent along with every job
+        payloads['native'] = _Payload.pack(_get_native_source().encode('utf-8'))
+    if options.get('expand'):
+        columns = _parse_placeholders(url, request, body)
+        if columns is None:
+            return None
+        if columns:
+            payloads['columns'] = _Payload.pack(json.dumps(columns).encode('utf-8'))
+    return dict(options, request=request, body=body, payloads=payloads, bodies=bodies)
+
+
+def _parse_placeholders(url, request, body):
+    """
+    Check the placeholders the bees will expand in the urls, headers and
+    post file, and read the CSV columns they take values from.  Returns the
+    columns, or None if the placeholders are no good.
+    """
+    try:
+        placeholders = []
+        for u in url.split(','):
+            if '{{' in urlparse(u if '://' in u else 'http://' + u).netloc:
+                raise ValueError('placeholders can only be used in the path and query of a url')
+            placeholders += native.parse_placeholders(u.encode('utf-8'))
+        for name, value in request.headers:
+            placeholders += native.parse_placeholders(value.encode('utf-8'))
+        if body is not None:
+            placeholders += native.parse_placeholders(body)
+        return workload.load_columns(placeholders)
+    except (IOError, ValueError, workload.WorkloadError) as e:
+        print('bees: error: %s' % e)
+        return None
+
+
+def _shard_corpus(params, bodies):
+    """
+    Deal the bodies of a corpus out between the bees as a payload of her
+    own for each, so that no two bees send the same body.  Returns False
+    if there aren't enough to go round.
+    """
+    if len(bodies) < len(params):
+        print('bees: error: a corpus of %i bodies is not enough for %i bees' % (len(bodies), len(params)))
+        return False
+    print('Each of %i bees will send a different body with every request, from her share of a corpus of %i.' % (len(params), len(bodies)))
+    for i, param in enumerate(params):
+        param['payloads'] = dict(param['payloads'], corpus=_Payload.pack(native.pack_corpus(bodies[i::len(params)])))
+    return True
+
+
+def _prepare_attack(url, n, c, options):
+    """
+    Look up the swarm and build the params each bee will attack with,
+    sending the request parsed into options['request'].  Returns None if
+    the attack can't go ahead.
     """
     username, key_name, zone, instance_ids = _read_server_list(options.get('zone'))
-    headers = options.get('headers', '')
-    contenttype = options.get('contenttype', '')
     csv_filename = options.get("csv_filename", '')
-    cookies = options.get('cookies', '')
     ciphers = options.get('ciphers', '')
-    post_file = options.get('post_file', '')
-    keep_alive = options.get('keep_alive', False)
-    basic_auth = options.get('basic_auth', '')
-    sting = options.get('sting', 1)
 
     if csv_filename:
         try:
@@ -721,18 +2146,7 @@ def attack(url, n, c, **options):
         print('No bees are ready to attack.')
         return
 
-    print('Connecting to the hive.')
-
-    ec2_connection = boto.ec2.connect_to_region(_get_region(zone))
-
-    print('Assembling bees.')
-
-    reservations = ec2_connection.get_all_instances(instance_ids=instance_ids)
-
-    instances = []
-
-    for reservation in reservations:
-        instances.extend(reservation.instances)
+    instances = _get_instances(zone, instance_ids, options.get('cache_ttl', INSTANCE_CACHE_TTL))
 
     instance_count = len(instances)
 
@@ -746,14 +2160,81 @@ def attack(url, n, c, **options):
         print('bees: error: the number of concurrent requests (%d) must be at most the same as number of requests (%d)' % (c, n))
         return
 
+    engine = ENGINES.get(options.get('engine') or 'ab')
+    if engine is None:
+        print('bees: error: unknown engine %s, choose from %s' % (options['engine'], ', '.join(sorted(ENGINES))))
+        return
+
+    if options.get('arrival_rate') and options.get('engine') != 'native':
+        print('bees: error: an arrival rate can only be kept by the native engine (--engine native)')
+        return
+
+    profile = None
+    if options.get('profile'):
+        if options.get('engine') != 'native':
+            print('bees: error: a load profile can only be followed by the native engine (--engine native)')
+            return
+        try:
+            profile = native.parse_profile(options['profile'])
+        except ValueError as e:
+            print('bees: error: %s' % e)
+            return
+
+    payloads = dict(options['payloads'])
+    if options.get('corpus') and options.get('engine') != 'native':
+        print('bees: error: a corpus can only be sent by the native engine (--engine native)')
+        return
+
+    if options.get('expand') and options.get('engine') != 'native':
+        print('bees: error: placeholders can only be expanded by the native engine (--engine native)')
+        return
+
+    table = None
+    if options.get('workload') or options.get('replay'):
+        if options.get('engine') != 'native':
+            print('bees: error: a request mix can only be drawn from by the native engine (--engine native)')
+            return
+        if options.get('workload') and options.get('replay'):
+            print('bees: error: give either a workload file or an access log to replay, not both')
+            return
+        if options.get('corpus'):
+            print('bees: error: a corpus can\'t be sent with a request mix')
+            return
+        if options.get('expand'):
+            print('bees: error: placeholders can\'t be expanded in a request mix')
+            return
+        try:
+            if options.get('workload'):
+                entries = workload.load(options['workload'])
+            else:
+                entries = workload.load_access_log(options['replay'])
+        except (IOError, workload.WorkloadError) as e:
+            print('bees: error: %s' % e)
+            return
+        table = workload.compile_table(entries)
+        payloads['workload'] = _Payload.pack(table)
+
     requests_per_instance = int(old_div(float(n), instance_count))
     connections_per_instance = int(old_div(float(c), instance_count))
+    arrival_rate_per_instance = old_div(float(options.get('arrival_rate') or 0), instance_count)
 
-    print('Each of %i bees will fire %s rounds, %s at a time.' % (instance_count, requests_per_instance, connections_per_instance))
+    if profile:
+        print('Each of %i bees will fire her share of the load profile over %i stages lasting %s seconds, %s at a time.' % (instance_count, len(profile), sum(stage[3] for stage in profile), connections_per_instance))
+    elif engine.timed:
+        print('Each of %i bees will fire for %s seconds, %s at a time.' % (instance_count, options.get('seconds') or 60, connections_per_instance))
+    else:
+        print('Each of %i bees will fire %s rounds, %s at a time.' % (instance_count, requests_per_instance, connections_per_instance))
+    if arrival_rate_per_instance and not profile:
+        print('Each of %i bees will fire %f rounds per second, whether or not the target keeps up.' % (instance_count, arrival_rate_per_instance))
+    if table is not None:
+        print('Each of %i bees will draw her rounds from a mix of %i requests.' % (instance_count, len(entries)))
 
     params = []
 
     urls = url.split(",")
+    # an empty url repeats the one before it
+    for i in range(1, len(urls)):
+        urls[i] = urls[i] or urls[i - 1]
     url_count = len(urls)
 
     if url_count > instance_count:
@@ -762,200 +2243,135 @@ def attack(url, n, c, **options):
     for i, instance in enumerate(instances):
         params.append({
             'i': i,
+            'bees': instance_count,
             'instance_id': instance.id,
-            'instance_name': instance.private_dns_name if instance.public_dns_name == "" else instance.public_dns_name,
-            'url': urls[i % url_count],
+            'instance_name': _get_instance_name(instance),
+            'request': options['request']._replace(url=urls[i % url_count]),
+            'body': options['body'],
+            'payloads': payloads,
             'concurrent_requests': connections_per_instance,
             'num_requests': requests_per_instance,
             'username': username,
             'key_name': key_name,
-            'headers': headers,
-            'contenttype': contenttype,
-            'cookies': cookies,
             'ciphers': ciphers,
-            'post_file': options.get('post_file'),
             'keep_alive': options.get('keep_alive'),
             'mime_type': options.get('mime_type', ''),
             'tpr': options.get('tpr'),
             'rps': options.get('rps'),
-            'basic_auth': options.get('basic_auth')
+            'engine': engine.name,
+            'expand': options.get('expand', False),
+            'seconds': options.get('seconds'),
+            'rate': options.get('rate'),
+            'threads': options.get('threads'),
+            'fetches': options.get('fetches'),
+            'timeout': options.get('timeout'),
+            'send_buffer': options.get('send_buffer'),
+            'recv_buffer': options.get('recv_buffer'),
+            'long_output': options.get('long_output'),
+            'responses_per': options.get('responses_per'),
+            'interval': options.get('interval', 0),
+            'arrival_rate': arrival_rate_per_instance,
+            'profile': profile,
+            'profile_share': old_div(1.0, instance_count),
+            'broker': options.get('broker', False),
+            'zone': zone
         })
 
-    if sting == 1:
-        print('Stinging URL sequentially so it will be cached for the attack.')
-        for param in params:
-            _sting(param)
-    elif sting == 2:
-        print('Stinging URL in parallel so it will be cached for the attack.')
-        url_used_count = min(url_count-1, instance_count-1)
-        pool = Pool(url_used_count+1)
-        pool.map(_sting, params[:url_used_count-1])
-    else:
-        print('Stinging URL skipped.')
+    return params
 
-    print('Organizing the swarm.')
-    # Spin up processes for connecting to EC2 instances
-    pool = Pool(len(params))
-    results = pool.map(_attack, params)
 
-    summarized_results = _summarize_results(results, params, csv_filename)
-    print('Offensive complete.')
-    _print_results(summarized_results)
+def _prepare_regions(url, n, c, zones, options):
+    """
+    Prepare the swarms in all the zones at once and return their params as
+    one swarm, so that they attack together. Each swarm fires `n` requests
+    `c` at a time, as if it were attacking alone. Zones whose swarm can't
+    attack are left out; returns None if none of them can.
+    """
+    if len(zones) == 1:
+        return _prepare_attack(url, n, c, dict(options, zone=zones[0]))
 
-    print('The swarm is awaiting new orders.')
+    prepared = [None] * len(zones)
 
-    if 'performance_accepted' in summarized_results:
-        if summarized_results['performance_accepted'] is False:
-            print("Your targets performance tests did not meet our standard.")
-            sys.exit(1)
-        else:
-            print('Your targets performance tests meet our standards, the Queen sends her regards.')
-            sys.exit(0)
+    def prepare(i):
+        prepared[i] = _prepare_attack(url, n, c, dict(options, zone=zones[i]))
 
-#############################
-### hurl version methods, ###
-#############################
+    threads = [threading.Thread(target=prepare, args=(i,)) for i in range(len(zones))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
 
-def hurl_attack(url, n, c, **options):
+    params = []
+    for zone, region_params in zip(zones, prepared):
+        if region_params is None:
+            print('bees: warning: the swarm in %s will sit this attack out.' % zone)
+            continue
+        params.extend(region_params)
+    if not params:
+        return None
+
+    for i, param in enumerate(params):
+        param['i'] = i
+        param['bees'] = len(params)
+    print('%i bees from %i regions will attack together.' % (len(params), len(set(p['zone'] for p in params))))
+    return params
+
+
+def _run_attack(params, options, csv_filename=None):
     """
-    Test the root url of this site.
+    Send the swarm in with the given params and return the summarized results.
     """
-    print(options.get('zone'))
-    username, key_name, zone, instance_ids = _read_server_list(options.get('zone'))
-    headers = options.get('headers', '')
-    contenttype = options.get('contenttype', '')
-    csv_filename = options.get("csv_filename", '')
-    cookies = options.get('cookies', '')
-    post_file = options.get('post_file', '')
-    keep_alive = options.get('keep_alive', False)
-    basic_auth = options.get('basic_auth', '')
-
-    if csv_filename:
-        try:
-            stream = open(csv_filename, 'w')
-        except IOError as e:
-            raise IOError("Specified csv_filename='%s' is not writable. Check permissions or specify a different filename and try again." % csv_filename)
-
-    if not instance_ids:
-        print('No bees are ready to attack.')
-        return
+    ticker = None
+    if options.get('interval'):
+        if options.get('engine') != 'native':
+            print('bees: warning: only the native engine streams results, the ticker is disabled.')
+        else:
+            ticker = _Ticker(options['interval'], Queue())
+            for param in params:
+                param['ticker'] = ticker.queue
+            ticker.start()
 
-    print('Connecting to the hive.')
+    if options.get('broker'):
+        broker.ensure_running(options.get('broker_idle') or broker.IDLE_TIMEOUT)
 
-    ec2_connection = boto.ec2.connect_to_region(_get_region(zone))
+    # the bees start firing together once they are all armed
+    barrier = _StartBarrier([param['i'] for param in params])
+    for param in params:
+        param['barrier'] = barrier
 
-    print('Assembling bees.')
+    print('Organizing the swarm.')
+    # Drive every bee's SSH session from this process
+    results = _run_swarm(_attack, params,
+                         options.get('ssh_window') or SSH_WINDOW,
+                         options.get('ssh_stagger', SSH_STAGGER))
+    _forget_unreachable(params, results)
 
-    reservations = ec2_connection.get_all_instances(instance_ids=instance_ids)
+    if ticker is not None:
+        ticker.stop()
 
-    instances = []
+    return _summarize_results(results, params, csv_filename)
 
-    for reservation in reservations:
-        instances.extend(reservation.instances)
 
-    instance_count = len(instances)
+def attack(url, n, c, **options):
+    """
+    Test the root url of this site, from the swarms in all of
+    options['zones'] at once or from the one in options['zone'].
+    """
+    options = _parse_request(url, options)
+    if options is None:
+        return
 
-    if n < instance_count * 2:
-        print('bees: error: the total number of requests must be at least %d (2x num. instances)' % (instance_count * 2))
+    params = _prepare_regions(url, n, c, options.get('zones') or [options.get('zone')], options)
+    if params is None:
         return
-    if c < instance_count:
-        print('bees: error: the number of concurrent requests must be at least %d (num. instances)' % instance_count)
+    if options['bodies'] is not None and not _shard_corpus(params, options['bodies']):
         return
-    if n < c:
-        print('bees: error: the number of concurrent requests (%d) must be at most the same as number of requests (%d)' % (c, n))
-        return
-
-    requests_per_instance = int(old_div(float(n), instance_count))
-    connections_per_instance = int(old_div(float(c), instance_count))
-
-    print('Each of %i bees will fire %s rounds, %s at a time.' % (instance_count, requests_per_instance, connections_per_instance))
-
-    params = []
-
-    for i, instance in enumerate(instances):
-        params.append({
-            'i': i,
-            'instance_id': instance.id,
-            'instance_name': instance.private_dns_name if instance.public_dns_name == "" else instance.public_dns_name,
-            'url': url,
-            'concurrent_requests': connections_per_instance,
-            'num_requests': requests_per_instance,
-            'username': username,
-            'key_name': key_name,
-            'headers': headers,
-            'contenttype': contenttype,
-            'cookies': cookies,
-            'post_file': options.get('post_file'),
-            'keep_alive': options.get('keep_alive'),
-            'mime_type': options.get('mime_type', ''),
-            'tpr': options.get('tpr'),
-            'rps': options.get('rps'),
-            'basic_auth': options.get('basic_auth'),
-            'seconds': options.get('seconds'),
-            'rate' : options.get('rate'),
-            'long_output' : options.get('long_output'),
-            'responses_per' : options.get('responses_per'),
-            'verb' : options.get('verb'),
-            'threads' : options.get('threads'),
-            'fetches' : options.get('fetches'),
-            'timeout' : options.get('timeout'),
-            'send_buffer' : options.get('send_buffer'),
-            'recv_buffer' : options.get('recv_buffer')
-        })
-
-    print('Stinging URL so it will be cached for the attack.')
-
-    request = Request(url)
-    # Need to revisit to support all http verbs.
-    if post_file:
-        try:
-            with open(post_file, 'r') as content_file:
-                content = content_file.read()
-            if IS_PY2:
-                request.add_data(content)
-            else:
-                # python3 removed add_data method from Request and added data attribute, either bytes or iterable of bytes
-                request.data = bytes(content.encode('utf-8'))
-        except IOError:
-            print('bees: error: The post file you provided doesn\'t exist.')
-            return
-
-    if cookies is not '':
-        request.add_header('Cookie', cookies)
-
-    if basic_auth is not '':
-        authentication = base64.encodestring(basic_auth).replace('\n', '')
-        request.add_header('Authorization', 'Basic %s' % authentication)
-
-    # Ping url so it will be cached for testing
-    dict_headers = {}
-    if headers is not '':
-        dict_headers = headers = dict(j.split(':') for j in [i.strip() for i in headers.split(';') if i != ''])
-
-    if contenttype is not '':
-        request.add_header("Content-Type", contenttype)
-
-    for key, value in list(dict_headers.items()):
-        request.add_header(key, value)
-
-    if url.lower().startswith("https://") and hasattr(ssl, '_create_unverified_context'):
-        context = ssl._create_unverified_context()
-        response = urlopen(request, context=context)
-    else:
-        response = urlopen(request)
-
-    response.read()
-
-    print('Organizing the swarm.')
-    # Spin up processes for connecting to EC2 instances
-    pool = Pool(len(params))
-    results = pool.map(_hurl_attack, params)
-
 
-    summarized_results = _hurl_summarize_results(results, params, csv_filename)
+    stung = _sting(params, options.get('sting', 1), options.get('sting_passes') or 1)
+    summarized_results = _run_attack(params, options, options.get('csv_filename', ''))
+    summarized_results['sting'] = stung
     print('Offensive complete.')
-
-    _hurl_print_results(summarized_results)
+    _print_results(summarized_results)
 
     print('The swarm is awaiting new orders.')
 
@@ -968,342 +2384,101 @@ def hurl_attack(url, n, c, **options):
             sys.exit(0)
 
 
-def _hurl_attack(params):
-    """
-    Test the target URL with requests.
-
-    Intended for use with multiprocessing.
+def find_capacity(url, c, **options):
     """
+    Attack at increasing arrival rates to find the highest rate at which the
+    target still meets the --tpr/--rps thresholds. The rate doubles from
+    start_rate until a step fails, then the gap between the last rate that
+    passed and the first that failed is halved until it is within
+    `precision` of the rate that passed.
 
-    print('Bee %i is joining the swarm.' % params['i'])
-
-    try:
-        client = paramiko.SSHClient()
-        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-
-        pem_path = params.get('key_name') and _get_pem_path(params['key_name']) or None
-        if not os.path.isfile(pem_path):
-            client.load_system_host_keys()
-            client.connect(params['instance_name'], username=params['username'])
-        else:
-            client.connect(
-                params['instance_name'],
-                username=params['username'],
-                key_filename=pem_path)
-
-        print('Bee %i is firing her machine gun. Bang bang!' % params['i'])
+    Whatever --engine and --broker say, the search runs the native engine,
+    the only one that keeps an arrival rate, through the connection broker.
 
-        options = ''
-        if params['headers'] is not '':
-            for h in params['headers'].split(';'):
-                if h != '':
-                    options += ' -H "%s"' % h.strip()
-
-        if params['contenttype'] is not '':
-            options += ' -H \"Content-Type : %s\"' % params['contenttype']
-
-        stdin, stdout, stderr = client.exec_command('mktemp')
-        # paramiko's read() returns bytes which need to be converted back to a str
-        params['csv_filename'] = IS_PY2 and stdout.read().strip() or stdout.read().decode('utf-8').strip()
-        if params['csv_filename']:
-            options += ' -o %(csv_filename)s' % params
+    Returns the highest rate that passed, or None.
+    """
+    if options.get('tpr') is None and options.get('rps') is None:
+        print('bees: error: finding the capacity needs a --tpr and/or --rps threshold for the target to meet')
+        return None
+
+    # the search depends on holding an arrival rate, and the broker keeps
+    # the SSH connections to the bees open from one step to the next
+    options = _parse_request(url, dict(options, engine='native', broker=True, profile=None))
+    if options is None:
+        return None
+    rate = float(options.get('start_rate') or CAPACITY_START_RATE)
+    max_rate = options.get('max_rate')
+    duration = options.get('step_duration') or CAPACITY_STEP_DURATION
+    precision = options.get('precision') or CAPACITY_PRECISION
+
+    params = _prepare_attack(url, max(int(rate * duration), c), c, dict(options, arrival_rate=rate))
+    if params is None:
+        return None
+    if options['bodies'] is not None and not _shard_corpus(params, options['bodies']):
+        return None
+    _sting(params, options.get('sting', 1), options.get('sting_passes') or 1)
+
+    curve = []
+    passed = failed = None
+    while len(curve) < CAPACITY_MAX_STEPS:
+        for param in params:
+            param['arrival_rate'] = old_div(rate, len(params))
+            param['num_requests'] = max(int(old_div(rate * duration, len(params))), param['concurrent_requests'])
+        print('Attacking at %f requests per second for %s seconds.' % (rate, duration))
+        summarized_results = _run_attack(params, options)
+        accepted = bool(summarized_results['num_complete_bees'] and summarized_results.get('performance_accepted'))
+        curve.append((rate, summarized_results, accepted))
+        if summarized_results['num_complete_bees']:
+            print('     %f [#/sec] achieved, %f [ms] mean, %f [ms] 99%%: %s' % (
+                summarized_results.get('achieved_rate', 0), summarized_results['mean_response'],
+                summarized_results['request_time_p99'], accepted and 'passed' or 'failed'))
+
+        if accepted:
+            passed = rate
         else:
-            print('Bee %i lost sight of the target (connection timed out creating csv_filename).' % params['i'])
-            return None
-
-        if params['post_file']:
-            pem_file_path=_get_pem_path(params['key_name'])
-            scpCommand = "scp -q -o 'StrictHostKeyChecking=no' -i %s %s %s@%s:~/" % (pem_file_path, params['post_file'], params['username'], params['instance_name'])
-            os.system(scpCommand)
-            options += ' -d ~/%s' % params['post_file']
-
-        if params['cookies'] is not '':
-            options += ' -H \"Cookie: %s;\"' % params['cookies']
-
-        if params['basic_auth'] is not '':
-            options += ' -H \"Authorization : Basic %s\"' % params['basic_auth']
-
-        if params['seconds']:
-            options += ' -l %d' % params['seconds']
-
-        if params['rate']:
-            options += ' -A %d' % params['rate']
-
-        if params['responses_per']:
-            options += ' -L'
-
-        if params['verb'] is not '':
-            options += ' -X %s' % params['verb']
-
-        if params['threads']:
-            options += ' -t %d' % params['threads']
-
-        if params['fetches']:
-            options += ' -f %d' % params['fetches']
-
-        if params['timeout']:
-            options += ' -T %d' % params['timeout']
-
-        if params['send_buffer']:
-            options += ' -S %d' % params['send_buffer']
-
-        if params['recv_buffer']:
-            options += ' -R %d' % params['recv_buffer']
-
-        params['options'] = options
-
-        hurl_command = 'hurl %(url)s -p %(concurrent_requests)s %(options)s -j' % params
-        stdin, stdout, stderr = client.exec_command(hurl_command)
-
-        response = defaultdict(int)
-
-        # paramiko's read() returns bytes which need to be converted back to a str
-        hurl_results = IS_PY2 and stdout.read() or stdout.read().decode('utf-8')
-
-        #print output for each instance if -o/--long_output is supplied
-        def _long_output():
-            '''if long_output option,.. display info per bee instead of summarized version'''
-            tabspace=''
-            singletab=()
-            doubletabs=('seconds', 'connect-ms-min',
-                       'fetches','bytes-per-sec',
-                       'end2end-ms-min',
-                       'max-parallel', 'response-codes',
-                       'end2end-ms-max', 'connect-ms-max' )
-            trippletab=('bytes')
-            try:
-                print(("Bee: {}").format(params['instance_id']))
-                for k, v in list(response.items()):
-                    if k == 'response-codes':
-                        print(k)
-                        tabspace='\t'
-                        for rk, rv in list(v.items()):
-                            print(("{}{}:{}{}").format(tabspace, rk, tabspace+tabspace, rv))
-                        continue
-                    if k in doubletabs:
-                        tabspace='\t\t'
-                    elif k in trippletab:
-                        tabspace='\t\t\t'
-                    else:
-                        tabspace='\t'
-                    print(("{}:{}{}").format(k, tabspace, v))
-                print("\n")
-
-            except:
-                print("Please check the url entered, also possible no requests were successful Line: 1018")
-                return None
-
-
-        #create the response dict to return to hurl_attack()
-        stdin, stdout, stderr = client.exec_command('cat %(csv_filename)s' % params)
-        try:
-            hurl_json = dict(json.loads(stdout.read().decode('utf-8')))
-            for k ,v in list(hurl_json.items()):
-                response[k] = v
-
-            #check if user wants output for seperate instances and Sdisplay if so
-            long_out_container=[]
-            if params['long_output']:
-                print(hurl_command)
-                print("\n", params['instance_id'] + "\n",params['instance_name'] + "\n" , hurl_results)
-                _long_output()
-                time.sleep(.02)
-
-        except:
-            print("Please check the url entered, also possible no requests were successful Line: 1032")
-            return None
-        finally:
-            return response
-
-        print(hurl_json['response-codes'])
-        response['request_time_cdf'] = []
-        for row in csv.DictReader(stdout):
-            row["Time in ms"] = float(row["Time in ms"])
-            response['request_time_cdf'].append(row)
-        if not response['request_time_cdf']:
-            print('Bee %i lost sight of the target (connection timed out reading csv).' % params['i'])
-            return None
-
-        print('Bee %i is out of ammo.' % params['i'])
-
-        client.close()
-
-        return response
-    except socket.error as e:
-        return e
-    except Exception as e:
-        traceback.print_exc()
-        print()
-        raise e
-
-def _hurl_summarize_results(results, params, csv_filename):
-
-    #summarized_results = dict()
-    summarized_results = defaultdict(int)
-    summarized_results['timeout_bees'] = [r for r in results if r is None]
-    summarized_results['exception_bees'] = [r for r in results if type(r) == socket.error]
-    summarized_results['complete_bees'] = [r for r in results if r is not None and type(r) != socket.error]
-    summarized_results['timeout_bees_params'] = [p for r, p in zip(results, params) if r is None]
-    summarized_results['exception_bees_params'] = [p for r, p in zip(results, params) if type(r) == socket.error]
-    summarized_results['complete_bees_params'] = [p for r, p in zip(results, params) if r is not None and type(r) != socket.error]
-    summarized_results['num_timeout_bees'] = len(summarized_results['timeout_bees'])
-    summarized_results['num_exception_bees'] = len(summarized_results['exception_bees'])
-    summarized_results['num_complete_bees'] = len(summarized_results['complete_bees'])
-
-    complete_results = [r['fetches'] for r in summarized_results['complete_bees']]
-    summarized_results['total_complete_requests'] = sum(complete_results)
-
-    #make summarized_results based of the possible response codes hurl gets
-    reported_response_codes = [r['response-codes'] for r in [x for x in summarized_results['complete_bees']]]
-    for i in reported_response_codes:
-        if isinstance(i, dict):
-            for k , v in list(i.items()):
-                if k.startswith('20'):
-                    summarized_results['total_number_of_200s']+=float(v)
-                elif k.startswith('30'):
-                    summarized_results['total_number_of_300s']+=float(v)
-                elif k.startswith('40'):
-                    summarized_results['total_number_of_400s']+=float(v)
-                elif k.startswith('50'):
-                    summarized_results['total_number_of_500s']+=float(v)
-
-    complete_results = [r['bytes'] for r in summarized_results['complete_bees']]
-    summarized_results['total_bytes'] = sum(complete_results)
-
-    complete_results = [r['seconds'] for r in summarized_results['complete_bees']]
-    summarized_results['seconds'] = max(complete_results)
-
-    complete_results = [r['connect-ms-max'] for r in summarized_results['complete_bees']]
-    summarized_results['connect-ms-max'] = max(complete_results)
-
-    complete_results = [r['1st-resp-ms-max'] for r in summarized_results['complete_bees']]
-    summarized_results['1st-resp-ms-max'] = max(complete_results)
-
-    complete_results = [r['1st-resp-ms-mean'] for r in summarized_results['complete_bees']]
-    summarized_results['1st-resp-ms-mean'] = old_div(sum(complete_results), summarized_results['num_complete_bees'])
-
-    complete_results = [r['fetches-per-sec'] for r in summarized_results['complete_bees']]
-    summarized_results['fetches-per-sec'] = old_div(sum(complete_results), summarized_results['num_complete_bees'])
-
-    complete_results = [r['fetches'] for r in summarized_results['complete_bees']]
-    summarized_results['total-fetches'] = sum(complete_results)
-
-    complete_results = [r['connect-ms-min'] for r in summarized_results['complete_bees']]
-    summarized_results['connect-ms-min'] = min(complete_results)
-
-    complete_results = [r['bytes-per-sec'] for r in summarized_results['complete_bees']]
-    summarized_results['bytes-per-second-mean'] = old_div(sum(complete_results), summarized_results['num_complete_bees'])
-
-    complete_results = [r['end2end-ms-min'] for r in summarized_results['complete_bees']]
-    summarized_results['end2end-ms-min'] = old_div(sum(complete_results), summarized_results['num_complete_bees'])
-
-    complete_results = [r['mean-bytes-per-conn'] for r in summarized_results['complete_bees']]
-    summarized_results['mean-bytes-per-conn'] = old_div(sum(complete_results), summarized_results['num_complete_bees'])
-
-    complete_results = [r['connect-ms-mean'] for r in summarized_results['complete_bees']]
-    summarized_results['connect-ms-mean'] = old_div(sum(complete_results), summarized_results['num_complete_bees'])
-
-    if summarized_results['num_complete_bees'] == 0:
-        summarized_results['mean_response'] = "no bees are complete"
-    else:
-        summarized_results['mean_response'] = old_div(sum(complete_results), summarized_results['num_complete_bees'])
-
-    complete_results = [r['connect-ms-mean'] for r in summarized_results['complete_bees']]
-    if summarized_results['num_complete_bees'] == 0:
-        summarized_results['mean_response'] = "no bees are complete"
-    else:
-        summarized_results['mean_response'] = old_div(sum(complete_results), summarized_results['num_complete_bees'])
-
-
-    summarized_results['tpr_bounds'] = params[0]['tpr']
-    summarized_results['rps_bounds'] = params[0]['rps']
-
-    if summarized_results['tpr_bounds'] is not None:
-        if summarized_results['mean_response'] < summarized_results['tpr_bounds']:
-            summarized_results['performance_accepted'] = True
+            failed = rate
+        if failed is None:
+            if max_rate and rate >= max_rate:
+                break
+            rate = min(rate * 2, max_rate or float('inf'))
+        elif passed is None:
+            rate = old_div(rate, 2)
+            if rate < 1:
+                break
+        elif failed - passed <= precision * passed:
+            break
         else:
-            summarized_results['performance_accepted'] = False
-
-    if summarized_results['rps_bounds'] is not None:
-        if summarized_results['mean_requests'] > summarized_results['rps_bounds'] and summarized_results['performance_accepted'] is True or None:
-            summarized_results['performance_accepted'] = True
+            rate = old_div(passed + failed, 2)
+
+    print('Capacity search complete.')
+    print('     Offered [#/sec]  Achieved [#/sec]    Mean [ms]     99% [ms]  Failed  Accepted')
+    for rate, summarized_results, accepted in sorted(curve, key=lambda step: step[0]):
+        if summarized_results['num_complete_bees']:
+            print('     %15.1f %17.1f %12.2f %12.2f %7i  %s' % (
+                rate, summarized_results.get('achieved_rate', 0), summarized_results['mean_response'],
+                summarized_results['request_time_p99'], summarized_results['total_failed_requests'], accepted))
         else:
-            summarized_results['performance_accepted'] = False
+            print('     %15.1f  no bees completed the mission' % rate)
 
-    summarized_results['request_time_cdf'] = _get_request_time_cdf(summarized_results['total_complete_requests'], summarized_results['complete_bees'])
+    csv_filename = options.get('csv_filename')
     if csv_filename:
-        _create_request_time_cdf_csv(results, summarized_results['complete_bees_params'], summarized_results['request_time_cdf'], csv_filename)
-
-    return summarized_results
-
-
-def _hurl_print_results(summarized_results):
-    """
-    Print summarized load-testing results.
-    """
-    if summarized_results['exception_bees']:
-        print('     %i of your bees didn\'t make it to the action. They might be taking a little longer than normal to'
-              ' find their machine guns, or may have been terminated without using "bees down".' % summarized_results['num_exception_bees'])
-
-    if summarized_results['timeout_bees']:
-        print('     Target timed out without fully responding to %i bees.' % summarized_results['num_timeout_bees'])
-
-    if summarized_results['num_complete_bees'] == 0:
-        print('     No bees completed the mission. Apparently your bees are peace-loving hippies.')
-        return
-    print('\nSummarized Results')
-    print('     Total bytes:\t\t%i' % summarized_results['total_bytes'])
-    print('     Seconds:\t\t\t%i' % summarized_results['seconds'])
-    print('     Connect-ms-max:\t\t%f' % summarized_results['connect-ms-max'])
-    print('     1st-resp-ms-max:\t\t%f' % summarized_results['1st-resp-ms-max'])
-    print('     1st-resp-ms-mean:\t\t%f' % summarized_results['1st-resp-ms-mean'])
-    print('     Fetches/sec mean:\t\t%f' % summarized_results['fetches-per-sec'])
-    print('     connect-ms-min:\t\t%f' % summarized_results['connect-ms-min'])
-    print('     Total fetches:\t\t%i' % summarized_results['total-fetches'])
-    print('     bytes/sec mean:\t\t%f' % summarized_results['bytes-per-second-mean'])
-    print('     end2end-ms-min mean:\t%f' % summarized_results['end2end-ms-min'])
-    print('     mean-bytes-per-conn:\t%f' % summarized_results['mean-bytes-per-conn'])
-    print('     connect-ms-mean:\t\t%f' % summarized_results['connect-ms-mean'])
-    print('\nResponse Codes:')
-
-    print('     2xx:\t\t\t%i' % summarized_results['total_number_of_200s'])
-    print('     3xx:\t\t\t%i' % summarized_results['total_number_of_300s'])
-    print('     4xx:\t\t\t%i' % summarized_results['total_number_of_400s'])
-    print('     5xx:\t\t\t%i' % summarized_results['total_number_of_500s'])
-    print()
-
-    if 'rps_bounds' in summarized_results and summarized_results['rps_bounds'] is not None:
-        print('     Requests per second:\t%f [#/sec] (upper bounds)' % summarized_results['rps_bounds'])
-
-
-    if 'tpr_bounds' in summarized_results and summarized_results['tpr_bounds'] is not None:
-        print('     Time per request:\t\t%f [ms] (lower bounds)' % summarized_results['tpr_bounds'])
-
-    if 'performance_accepted' in summarized_results:
-        print('     Performance check:\t\t%s' % summarized_results['performance_accepted'])
-
-    if summarized_results['mean_response'] < 500:
-        print('Mission Assessment: Target crushed bee offensive.')
-    elif summarized_results['mean_response'] < 1000:
-        print('Mission Assessment: Target successfully fended off the swarm.')
-    elif summarized_results['mean_response'] < 1500:
-        print('Mission Assessment: Target wounded, but operational.')
-    elif summarized_results['mean_response'] < 2000:
-        print('Mission Assessment: Target severely compromised.')
+        with open(csv_filename, 'wt', encoding='utf-8', newline='') as stream:
+            writer = csv.writer(stream)
+            writer.writerow(['offered rps', 'achieved rps', 'mean [ms]', '50% [ms]', '90% [ms]', '99% [ms]', 'failed requests', 'accepted'])
+            for rate, summarized_results, accepted in sorted(curve, key=lambda step: step[0]):
+                if summarized_results['num_complete_bees']:
+                    cdf = summarized_results['request_time_cdf'] or [float('nan')] * 100
+                    writer.writerow([rate, summarized_results.get('achieved_rate', 0), summarized_results['mean_response'],
+                                     cdf[49], cdf[89],
+                                     summarized_results['request_time_p99'], summarized_results['total_failed_requests'], accepted])
+
+    if passed is None:
+        print('The target did not meet our standards at any rate tried.')
     else:
-        print('Mission Assessment: Swarm annihilated target.')
+        print('Maximum sustainable rate:\t%f [#/sec]' % passed)
+    return passed
 
-def _get_new_state_file_name(zone):
-    ''' take zone and return multi regional bee file,
-    from ~/.bees to ~/.bees.${region}'''
-    return STATE_FILENAME+'.'+zone
 
 def _get_existing_regions():
-    '''return a list of zone name strings from looking at
-    existing region ~/.bees.* files'''
-    existing_regions = []
-    possible_files = os.listdir(os.path.expanduser('~'))
-    for f in possible_files:
-        something= re.search(r'\.bees\.(.*)', f)
-        existing_regions.append( something.group(1)) if something else "no"
-    return existing_regions
+    '''return a list of zone name strings for the swarms in the roster'''
+    return state.zones()
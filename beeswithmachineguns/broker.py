@@ -0,0 +1,449 @@
+"""
+The MIT License
+
+Copyright (c) 2010 The Chicago Tribune & Contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+SSH connection broker.
+
+Much like OpenSSH's ControlMaster, the broker is a small local daemon that
+keeps authenticated paramiko transports to the bees open between bees
+commands, so repeated attacks skip the TCP and key exchange handshakes.
+bees talks to it over a unix socket in the user's home directory; each
+command runs on a fresh channel of the cached transport and its stdin,
+stdout, stderr and exit status are relayed as frames over that socket.
+Transports that go unused for a while are closed, and the broker exits
+once it has nothing left to keep warm.
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import select
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+
+import socketserver
+
+import paramiko
+
+# where the broker listens unless given a path, looked up on use
+SOCKET_PATH = os.path.expanduser('~/.bees-broker.sock')
+# the port of the bees' SSH servers, unless a request gives one
+SSH_PORT = 22
+IDLE_TIMEOUT = 900
+BUFFER_SIZE = 32768
+
+STDIN = b'i'
+STDOUT = b'o'
+STDERR = b'e'
+EXIT = b'x'
+ERROR = b'!'
+
+_FRAME_HEADER = struct.Struct('!cI')
+
+
+def _send_frame(sock, kind, data=b''):
+    sock.sendall(_FRAME_HEADER.pack(kind, len(data)) + data)
+
+
+def _recv_exactly(stream, size):
+    data = b''
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            raise EOFError('broker connection closed')
+        data += chunk
+    return data
+
+
+def _recv_frame(stream):
+    kind, size = _FRAME_HEADER.unpack(_recv_exactly(stream, _FRAME_HEADER.size))
+    return kind, _recv_exactly(stream, size) if size else b''
+
+
+class _Transport(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.client = None
+        self.in_use = 0
+        self.last_used = time.time()
+
+
+class _Transports(object):
+    """
+    The warm SSH connections, keyed by host, username and key file.
+    """
+    def __init__(self, idle):
+        self.idle = idle
+        self.lock = threading.Lock()
+        self.transports = {}
+        self.last_activity = time.time()
+
+    def acquire(self, host, port, username, key_filename):
+        with self.lock:
+            transport = self.transports.setdefault((host, port, username, key_filename), _Transport())
+            transport.in_use += 1
+            self.last_activity = time.time()
+        try:
+            with transport.lock:
+                active = transport.client is not None and transport.client.get_transport() is not None \
+                    and transport.client.get_transport().is_active()
+                if not active:
+                    transport.client = _open(host, port, username, key_filename)
+        except Exception:
+            self.release(transport)
+            raise
+        return transport
+
+    def release(self, transport):
+        with self.lock:
+            transport.in_use -= 1
+            transport.last_used = self.last_activity = time.time()
+
+    def evict(self):
+        """
+        Close the transports nobody used for `idle` seconds.  Return True
+        once there is nothing left and the broker has been idle as long.
+        """
+        now = time.time()
+        with self.lock:
+            for key, transport in list(self.transports.items()):
+                if transport.in_use == 0 and now - transport.last_used > self.idle:
+                    if transport.client is not None:
+                        transport.client.close()
+                    del self.transports[key]
+            return not self.transports and now - self.last_activity > self.idle
+
+    def close(self):
+        with self.lock:
+            for transport in self.transports.values():
+                if transport.client is not None:
+                    transport.client.close()
+            self.transports.clear()
+
+
+def _open(host, port, username, key_filename):
+    client = paramiko.SSHClient()
+    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    if key_filename:
+        client.connect(host, port, username=username, key_filename=key_filename)
+    else:
+        client.load_system_host_keys()
+        client.connect(host, port, username=username)
+    return client
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            # is_running only checks that it can connect
+            return
+        request = json.loads(line.decode('utf-8'))
+        if request['op'] == 'shutdown':
+            threading.Thread(target=self.server.shutdown).start()
+            _send_frame(self.request, EXIT, struct.pack('!i', 0))
+            return
+
+        transports = self.server.transports
+        try:
+            transport = transports.acquire(request['host'], request.get('port', SSH_PORT), request['username'],
+                                           request.get('key_filename'))
+        except Exception as e:
+            _send_frame(self.request, ERROR, str(e).encode('utf-8'))
+            return
+        try:
+            if request['op'] == 'connect':
+                _send_frame(self.request, EXIT, struct.pack('!i', 0))
+            elif request['op'] == 'exec':
+                self._exec(transport.client, request['command'])
+        finally:
+            transports.release(transport)
+
+    def _exec(self, client, command):
+        channel = client.get_transport().open_session()
+        channel.exec_command(command)
+
+        def pump_stdin():
+            try:
+                while True:
+                    kind, data = _recv_frame(self.rfile)
+                    if not data:
+                        break
+                    channel.sendall(data)
+            except (EOFError, socket.error):
+                pass
+            channel.shutdown_write()
+        stdin_thread = threading.Thread(target=pump_stdin)
+        stdin_thread.daemon = True
+        stdin_thread.start()
+
+        try:
+            while True:
+                select.select([channel], [], [], 1.0)
+                progressed = False
+                if channel.recv_stderr_ready():
+                    _send_frame(self.request, STDERR, channel.recv_stderr(BUFFER_SIZE))
+                    progressed = True
+                if channel.recv_ready():
+                    data = channel.recv(BUFFER_SIZE)
+                    if data:
+                        _send_frame(self.request, STDOUT, data)
+                        progressed = True
+                if not progressed and (channel.eof_received or channel.closed):
+                    break
+            _send_frame(self.request, EXIT, struct.pack('!i', channel.recv_exit_status()))
+        except socket.error:
+            # bees went away mid-command
+            pass
+        finally:
+            channel.close()
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(path=None, idle=IDLE_TIMEOUT):
+    """
+    Run the broker until it has been idle for `idle` seconds or is told to
+    shut down.
+    """
+    path = path or SOCKET_PATH
+    if os.path.exists(path):
+        os.remove(path)
+    old_umask = os.umask(0o077)
+    try:
+        server = _Server(path, _Handler)
+    finally:
+        os.umask(old_umask)
+    server.transports = _Transports(idle)
+
+    def reap():
+        while True:
+            time.sleep(min(idle, 30))
+            if server.transports.evict():
+                server.shutdown()
+                return
+    reaper = threading.Thread(target=reap)
+    reaper.daemon = True
+    reaper.start()
+
+    try:
+        server.serve_forever()
+    finally:
+        server.transports.close()
+        server.server_close()
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _connect_socket(path=None):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(path or SOCKET_PATH)
+    return sock
+
+
+def is_running(path=None):
+    try:
+        _connect_socket(path).close()
+        return True
+    except socket.error:
+        return False
+
+
+def ensure_running(idle=IDLE_TIMEOUT, path=None):
+    """
+    Start the broker in the background unless it is already up.
+    """
+    path = path or SOCKET_PATH
+    if is_running(path):
+        return
+    with open(os.devnull, 'r+') as devnull:
+        subprocess.Popen([sys.executable, '-m', 'beeswithmachineguns.broker', '--idle', str(idle), '--socket', path],
+                         stdin=devnull, stdout=devnull, stderr=devnull, close_fds=True,
+                         preexec_fn=os.setsid)
+    deadline = time.time() + 10
+    while not is_running(path):
+        if time.time() > deadline:
+            raise socket.error('The SSH connection broker did not start.')
+        time.sleep(0.05)
+
+
+def shutdown(path=None):
+    """
+    Stop the broker if it is running, closing all of its connections.
+    """
+    if not is_running(path):
+        return False
+    sock = _connect_socket(path)
+    sock.sendall(json.dumps({'op': 'shutdown'}).encode('utf-8') + b'\n')
+    stream = _Stream(sock)
+    while stream.fill():
+        pass
+    return True
+
+
+class _Stream(object):
+    """
+    Reassemble the frames of one brokered command into stdout and stderr.
+    """
+    def __init__(self, sock):
+        self.sock = sock
+        self.rfile = sock.makefile('rb')
+        self.buffers = {STDOUT: b'', STDERR: b''}
+        self.exit_status = None
+
+    def fill(self):
+        """
+        Read the next frame.  Return False once the command has exited.
+        """
+        if self.exit_status is not None:
+            return False
+        try:
+            kind, data = _recv_frame(self.rfile)
+        except EOFError:
+            self.exit_status = -1
+            return False
+        if kind == EXIT:
+            self.exit_status = struct.unpack('!i', data)[0]
+            self.rfile.close()
+            self.sock.close()
+            return False
+        if kind == ERROR:
+            self.exit_status = -1
+            raise socket.error(data.decode('utf-8'))
+        self.buffers[kind] += data
+        return True
+
+
+class _ChannelFile(object):
+    """
+    The read end of a brokered stdout or stderr.  Like paramiko's own files,
+    read() returns bytes and iterating yields decoded lines.
+    """
+    def __init__(self, stream, kind):
+        self.stream = stream
+        self.kind = kind
+        self.channel = self
+
+    def read(self, size=-1):
+        stream = self.stream
+        while (size < 0 or len(stream.buffers[self.kind]) < size) and stream.fill():
+            pass
+        data = stream.buffers[self.kind]
+        if size < 0:
+            size = len(data)
+        stream.buffers[self.kind] = data[size:]
+        return data[:size]
+
+    def readline(self):
+        stream = self.stream
+        while b'\n' not in stream.buffers[self.kind] and stream.fill():
+            pass
+        data = stream.buffers[self.kind]
+        end = data.find(b'\n') + 1 or len(data)
+        stream.buffers[self.kind] = data[end:]
+        return data[:end]
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if not line:
+                return
+            yield line.decode('utf-8')
+
+    def recv_exit_status(self):
+        while self.stream.fill():
+            pass
+        return self.stream.exit_status
+
+
+class _StdinFile(object):
+    def __init__(self, sock):
+        self.sock = sock
+        self.channel = self
+
+    def write(self, data):
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+        if data:
+            _send_frame(self.sock, STDIN, data)
+
+    def flush(self):
+        pass
+
+    def shutdown_write(self):
+        _send_frame(self.sock, STDIN)
+
+    def close(self):
+        self.shutdown_write()
+
+
+class BrokerClient(object):
+    """
+    Stands in for a paramiko.SSHClient whose connection lives in the broker.
+    """
+    def __init__(self, host, username, key_filename=None, path=None, port=SSH_PORT):
+        self.request = {'host': host, 'port': port, 'username': username, 'key_filename': key_filename}
+        self.path = path
+
+    def _open(self, op, **fields):
+        request = dict(self.request, op=op, **fields)
+        sock = _connect_socket(self.path)
+        sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        return sock
+
+    def connect(self):
+        """
+        Make sure the broker holds a live connection to the bee, opening one
+        if needed.
+        """
+        stream = _Stream(self._open('connect'))
+        while stream.fill():
+            pass
+
+    def exec_command(self, command):
+        sock = self._open('exec', command=command)
+        stream = _Stream(sock)
+        return _StdinFile(sock), _ChannelFile(stream, STDOUT), _ChannelFile(stream, STDERR)
+
+    def close(self):
+        # the whole point is to leave the connection open in the broker
+        pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Keep SSH connections to the bees warm between bees commands.')
+    parser.add_argument('--idle', type=float, default=IDLE_TIMEOUT,
+                        help='close connections unused for this many seconds, and exit once none are left (default: %d)' % IDLE_TIMEOUT)
+    parser.add_argument('--socket', default=None)
+    args = parser.parse_args(argv)
+    serve(args.socket, args.idle)
+
+
+if __name__ == '__main__':
+    main()
@@ -29,13 +29,10 @@ from future import standard_library
 standard_library.install_aliases()
 from builtins import zip
 from . import bees
-try:
-    from urllib.parse import urlparse
-except ImportError:
-    from urllib.parse import urlparse
+from . import broker
+from urllib.parse import urlparse
 from optparse import OptionParser, OptionGroup, Values
 import threading
-import time
 import sys
 
 def parse_options():
@@ -53,6 +50,7 @@ A utility for arming (creating) many bees (small EC2 instances) to attack
 commands:
   up      Start a batch of load testing servers.
   attack  Begin the attack on a specific url.
+  find-capacity  Attack a url at rising rates to find the most it can take.
   down    Shutdown and deactivate the load testing servers.
   report  Report the status of the load testing servers.
     """)
@@ -93,6 +91,18 @@ commands:
                         action='store', dest='tags', type='string', default=None,
                         help="custome tags for bee instances")
 
+    up_group.add_option('--ready-timeout', metavar="SECONDS", nargs=1,
+                        action='store', dest='ready_timeout', type='float', default=bees.INSTANCE_READY_TIMEOUT,
+                        help="How long to wait for new bees to start and answer on the SSH port (default: %d)." % bees.INSTANCE_READY_TIMEOUT)
+    up_group.add_option('--spot-timeout', metavar="SECONDS", nargs=1,
+                        action='store', dest='spot_timeout', type='float', default=bees.SPOT_TIMEOUT,
+                        help="With -b, how long to wait for the spot requests to be fulfilled before cancelling the rest (default: %d)." % bees.SPOT_TIMEOUT)
+    up_group.add_option('--spot-quorum', metavar="COUNT", nargs=1,
+                        action='store', dest='spot_quorum', type='int', default=None,
+                        help="With -b, stop waiting and cancel the remaining spot requests as soon as this many are fulfilled (default: all of them).")
+    up_group.add_option('--spot-backfill', metavar="SPOT_BACKFILL",
+                        action='store_true', dest='spot_backfill', default=False,
+                        help="With -b, call up on-demand bees in place of the spot requests that were not fulfilled.")
     parser.add_option_group(up_group)
 
     attack_group = OptionGroup(parser, "attack",
@@ -134,25 +144,28 @@ commands:
                             help="ContentType header to send to the target of the attack.")
     attack_group.add_option('-I', '--sting', metavar="sting", nargs=1,
                             action='store', dest='sting', type='int', default=1,
-                            help="The flag to sting (ping to cache) url before attack (default: 1). 0: no sting, 1: sting sequentially, 2: sting in parallel")
+                            help="The flag to sting (ping to cache) url before attack (default: 1). 0: no sting, 1: sting sequentially, 2: sting in parallel. Each distinct url is stung once.")
+    attack_group.add_option('--sting-passes', metavar="PASSES", nargs=1,
+                            action='store', dest='sting_passes', type='int', default=1,
+                            help="How many times to sting the urls before the attack (default: 1).")
     attack_group.add_option('-S', '--seconds', metavar="SECONDS", nargs=1,
                             action='store', dest='seconds', type='int', default=60,
-                            help= "hurl only: The number of total seconds to attack the target (default: 60).")
+                            help= "hurl and wrk only: The number of total seconds to attack the target (default: 60).")
     attack_group.add_option('-X', '--verb', metavar="VERB", nargs=1,
                             action='store', dest='verb', type='string', default='',
-                            help= "hurl only: Request command -HTTP verb to use -GET/PUT/etc. Default GET")
+                            help= "hurl and wrk only: Request command -HTTP verb to use -GET/PUT/etc. Default GET")
     attack_group.add_option('-M', '--rate', metavar="RATE", nargs=1,
                             action='store', dest='rate', type='int',
                             help= "hurl only: Max Request Rate.")
     attack_group.add_option('-a', '--threads', metavar="THREADS", nargs=1,
                             action='store', dest='threads', type='int', default=1,
-                            help= "hurl only: Number of parallel threads. Default: 1")
+                            help= "hurl and wrk only: Number of parallel threads. Default: 1")
     attack_group.add_option('-f', '--fetches', metavar="FETCHES", nargs=1,
                             action='store', dest='fetches', type='int', 
                             help= "hurl only: Num fetches per instance.")
     attack_group.add_option('-d', '--timeout', metavar="TIMEOUT", nargs=1,
                             action='store', dest='timeout', type='int',
-                            help= "hurl only: Timeout (seconds).")
+                            help= "hurl and wrk only: Timeout (seconds).")
     attack_group.add_option('-E', '--send_buffer', metavar="SEND_BUFFER", nargs=1,
                             action='store', dest='send_buffer', type='int',
                             help= "hurl only: Socket send buffer size.")
@@ -168,7 +181,46 @@ commands:
                             help='BASIC authentication credentials, format auth-username:password (default: None).')
     attack_group.add_option('-j', '--hurl', metavar="HURL_COMMANDS",
                             action='store_true', dest='hurl',
-                            help="use hurl")
+                            help="use hurl, the same as --engine hurl")
+    attack_group.add_option('--engine', metavar="ENGINE", nargs=1,
+                            action='store', dest='engine', type='choice', choices=sorted(bees.ENGINES), default='ab',
+                            help="The load generator the bees fire with: ab, hurl, wrk, or native for the built-in asyncio engine which needs python3 on the bees (default: ab).")
+    attack_group.add_option('--interval', metavar="INTERVAL", nargs=1,
+                            action='store', dest='interval', type='float', default=0,
+                            help="native only: Stream results back from the bees every INTERVAL seconds and print a live ticker (default: 0, off).")
+    attack_group.add_option('--arrival-rate', metavar="RATE", nargs=1,
+                            action='store', dest='arrival_rate', type='float', default=0,
+                            help="native only: Send RATE requests per second in total on a fixed schedule split across the bees, whether or not earlier requests have been answered, and measure latency from when each request was due (default: 0, off).")
+    attack_group.add_option('--profile', metavar="PROFILE", nargs=1,
+                            action='store', dest='profile', type='string', default=None,
+                            help="native only: Instead of -n requests, send requests at the total rates given by a load profile of comma separated stages: hold:RATE:SECONDS, ramp:FROM:TO:SECONDS or step:FROM:TO:STEP:SECONDS, and report the results of each stage, e.g. ramp:0:1000:60,step:1000:3000:500:30 (default: None).")
+    attack_group.add_option('--workload', metavar="FILE", nargs=1,
+                            action='store', dest='workload', type='string', default=None,
+                            help="native only: Have every bee draw its requests from the weighted mix of paths, methods, headers and bodies in FILE, one JSON object per line, relative to the url (default: None).")
+    attack_group.add_option('--replay', metavar="ACCESS_LOG", nargs=1,
+                            action='store', dest='replay', type='string', default=None,
+                            help="native only: Have every bee draw its requests from the GET and HEAD requests in an nginx/Apache access log, weighted by how often each was made (default: None).")
+    attack_group.add_option('--corpus', metavar="PATH", nargs=1,
+                            action='store', dest='corpus', type='string', default=None,
+                            help="native only: Send a different body with every request, from a directory holding one body per file or a file holding one body per line, dealt out between the bees (default: None).")
+    attack_group.add_option('--expand', metavar="EXPAND",
+                            action='store_true', dest='expand', default=False,
+                            help="native only: Expand placeholders in the path and query of the url, the headers and the post file for every request: {{seq}} (the request's number across the swarm), {{bee}} (the bee's number), {{random:LO:HI}} and {{csv:FILE:COLUMN}} (the next value from a column of a local CSV file).")
+    attack_group.add_option('--ssh-window', metavar="SSH_WINDOW", nargs=1,
+                            action='store', dest='ssh_window', type='int', default=bees.SSH_WINDOW,
+                            help="The number of bees allowed to set up their SSH connection at the same time (default: %d)." % bees.SSH_WINDOW)
+    attack_group.add_option('--ssh-stagger', metavar="SSH_STAGGER", nargs=1,
+                            action='store', dest='ssh_stagger', type='float', default=bees.SSH_STAGGER,
+                            help="The number of seconds between starting each bee's SSH connection (default: %g)." % bees.SSH_STAGGER)
+    attack_group.add_option('--broker', metavar="BROKER",
+                            action='store_true', dest='broker', default=False,
+                            help="Keep the SSH connections to the bees open between attacks in a local broker process, so repeated attacks skip the SSH handshake.")
+    attack_group.add_option('--broker-idle', metavar="SECONDS", nargs=1,
+                            action='store', dest='broker_idle', type='float', default=None,
+                            help="With --broker, close connections unused for this many seconds and stop the broker once none are left (default: %d)." % broker.IDLE_TIMEOUT)
+    attack_group.add_option('--cache-ttl', metavar="SECONDS", nargs=1,
+                            action='store', dest='cache_ttl', type='float', default=bees.INSTANCE_CACHE_TTL,
+                            help="Use the bee addresses recorded in the roster if they were checked within this many seconds, instead of asking EC2; 0 always asks (default: %d)." % bees.INSTANCE_CACHE_TTL)
     attack_group.add_option('-o', '--long_output', metavar="LONG_OUTPUT",
                             action='store_true', dest='long_output',
                             help="display hurl output")
@@ -179,15 +231,30 @@ commands:
 
     parser.add_option_group(attack_group)
 
+    capacity_group = OptionGroup(parser, "find-capacity",
+                                 """Find the highest rate of requests per second the target can take while still meeting the -T/--tpr and/or -R/--rps thresholds. The bees attack at a rising --arrival-rate with the native engine, keeping their connections open between steps. The attack options above apply, and with --csv the throughput/latency curve is written instead of the percentiles.""")
+
+    capacity_group.add_option('--start-rate', metavar="RATE", nargs=1,
+                              action='store', dest='start_rate', type='float', default=bees.CAPACITY_START_RATE,
+                              help="The rate in requests per second to start the search at, doubling it until the target fails (default: %d)." % bees.CAPACITY_START_RATE)
+    capacity_group.add_option('--max-rate', metavar="RATE", nargs=1,
+                              action='store', dest='max_rate', type='float', default=None,
+                              help="The highest rate in requests per second to try (default: None).")
+    capacity_group.add_option('--step-duration', metavar="SECONDS", nargs=1,
+                              action='store', dest='step_duration', type='float', default=bees.CAPACITY_STEP_DURATION,
+                              help="How many seconds to attack for at each rate (default: %d)." % bees.CAPACITY_STEP_DURATION)
+    capacity_group.add_option('--precision', metavar="FRACTION", nargs=1,
+                              action='store', dest='precision', type='float', default=bees.CAPACITY_PRECISION,
+                              help="Stop once the highest rate that passed is within this fraction of the lowest that failed (default: %g)." % bees.CAPACITY_PRECISION)
+
+    parser.add_option_group(capacity_group)
+
     (options, args) = parser.parse_args()
 
     if len(args) <= 0:
         parser.error('Please enter a command.')
 
     command = args[0]
-    #set time for in between threads
-    delay = 0.2
-
     if command == 'up':
         if not options.key:
             parser.error('To spin up new instances you need to specify a key-pair name with -k')
@@ -202,20 +269,24 @@ commands:
             else:
                 ami_list = [a for a in options.instance.split(',')]
                 zone_list = [z for z in zone_len]
-                # for each ami and zone set zone and instance
+                # call up the swarms in all the zones at once
+                threads = []
                 for tup_val in zip(ami_list, zone_list):
                     options.instance, options.zone = tup_val
-                    threading.Thread(target=bees.up, args=(options.servers, options.group,
+                    threads.append(threading.Thread(target=bees.up, args=(options.servers, options.group,
                                                             options.zone, options.instance,
                                                             options.type,options.login,
                                                             options.key, options.subnet,
-                                                            options.tags, options.bid)).start()
-                    #time allowed between threads
-                    time.sleep(delay)
+                                                            options.tags, options.bid, options.ready_timeout,
+                                                            options.spot_timeout, options.spot_quorum, options.spot_backfill)))
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
         else:
-            bees.up(options.servers, options.group, options.zone, options.instance, options.type, options.login, options.key, options.subnet, options.tags, options.bid)
+            bees.up(options.servers, options.group, options.zone, options.instance, options.type, options.login, options.key, options.subnet, options.tags, options.bid, options.ready_timeout, options.spot_timeout, options.spot_quorum, options.spot_backfill)
 
-    elif command == 'attack':
+    elif command in ('attack', 'find-capacity'):
         if not options.url:
             parser.error('To run an attack you need to specify a url with -u')
 
@@ -241,7 +312,7 @@ commands:
             basic_auth=options.basic_auth,
             contenttype=options.contenttype,
             sting=options.sting,
-            hurl=options.hurl,
+            sting_passes=options.sting_passes,
             seconds=options.seconds,
             rate=options.rate,
             long_output=options.long_output,
@@ -251,22 +322,40 @@ commands:
             fetches=options.fetches,
             timeout=options.timeout,
             send_buffer=options.send_buffer,
-            recv_buffer=options.recv_buffer
+            recv_buffer=options.recv_buffer,
+            engine='hurl' if options.hurl else options.engine,
+            interval=options.interval,
+            arrival_rate=options.arrival_rate,
+            profile=options.profile,
+            workload=options.workload,
+            replay=options.replay,
+            corpus=options.corpus,
+            expand=options.expand,
+            ssh_window=options.ssh_window,
+            ssh_stagger=options.ssh_stagger,
+            broker=options.broker,
+            broker_idle=options.broker_idle,
+            cache_ttl=options.cache_ttl
         )
-        if options.hurl:
+        if command == 'find-capacity':
+            additional_options.update(
+                start_rate=options.start_rate,
+                max_rate=options.max_rate,
+                step_duration=options.step_duration,
+                precision=options.precision
+            )
+            # search one region at a time, as swarms attacking the same
+            # target at once would each find a share of its capacity
+            found = []
             for region in regions_list:
                 additional_options['zone'] = region
-                threading.Thread(target=bees.hurl_attack, args=(options.url, options.number, options.concurrent),
-                    kwargs=additional_options).start()
-                #time allowed between threads
-                time.sleep(delay)
+                found.append(bees.find_capacity(options.url, options.concurrent, **additional_options))
+            sys.exit(0 if found and None not in found else 1)
         else:
-            for region in regions_list:
-                additional_options['zone'] = region
-                threading.Thread(target=bees.attack, args=(options.url, options.number,
-                    options.concurrent), kwargs=additional_options).start()
-                #time allowed between threads
-                time.sleep(delay)
+            # the swarms in all the regions attack together and their
+            # results are summarized as one
+            additional_options['zones'] = regions_list
+            bees.attack(options.url, options.number, options.concurrent, **additional_options)
 
     elif command == 'down':
         bees.down()
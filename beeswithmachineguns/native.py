@@ -0,0 +1,1151 @@
+"""
+The MIT License
+
+Copyright (c) 2010 The Chicago Tribune & Contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+Native load generator.
+
+This module is kept in every bee's payload cache and run with ``python3`` in
+place of ab, so it must only depend on the standard library.  It can also be
+run locally against a test server:
+
+    python -m beeswithmachineguns.native -n 1000 -c 10 http://localhost:8000/
+
+The results use the same keys as the ones scraped out of ab's output by
+bees._attack and are printed to stdout as one packed line (see
+pack_result), or as a line of JSON with -J.  When streaming, it is preceded
+by one line per interval with "type" set to "interval".
+
+By default each connection sends its next request as soon as the last one
+is answered, like ab does.  With an arrival rate (-r) the requests are sent
+on a fixed timeline instead and their latency is measured from the time
+they were due, so time spent waiting for a free connection behind a slow
+target is counted rather than hidden.  A load profile (-P) does the same on
+a timeline whose rate changes from stage to stage, e.g.
+
+    hold:100:30,ramp:100:1000:60,step:1000:2000:250:20
+
+holds 100 requests/sec for 30 seconds, ramps up to 1000/sec over a minute
+and then steps up by 250/sec every 20 seconds until 2000/sec.  Results are
+reported for each stage as well as for the whole run.
+
+Instead of a single request, the bees can draw every request from a
+weighted mix loaded from a table built by bees.workload (-W), or send the
+request with a different body every time, taken in turn from a corpus
+built by pack_corpus (-B).  With -E, placeholders such as {{seq}} or
+{{random:1:1000}} in the path, headers and body are expanded for every
+request, see parse_placeholders.
+"""
+import argparse
+import array
+import asyncio
+import base64
+import bisect
+import gzip
+import json
+import math
+import mmap
+import multiprocessing
+import os
+import random
+import re
+import ssl
+import struct
+import sys
+import time
+import zlib
+
+from urllib.parse import urlsplit
+
+USER_AGENT = 'beeswithmachineguns'
+
+# starts a line holding a record packed by pack_result
+PACKED = 'bees-packed:'
+PACKED_HEADER = struct.Struct('<III')
+
+
+class Target(object):
+    """
+    Everything a worker needs to know to send requests to the target.
+    The raw bytes of every request are built once and reused, and with a mix
+    of requests each one is drawn by a bisect on their cumulative weights.
+    """
+    def __init__(self, url, method='GET', headers=(), body=None, timeout=30):
+        parsed = urlsplit(url if '://' in url else 'http://' + url)
+        self.host = parsed.hostname
+        self.tls = parsed.scheme == 'https'
+        self.port = parsed.port or (443 if self.tls else 80)
+        self.timeout = timeout
+        self.host_header = parsed.netloc.rsplit('@', 1)[-1]
+        self.headers = list(headers)
+        self.method = method
+        self.path = parsed.path or '/'
+        if parsed.query:
+            self.path += '?' + parsed.query
+
+        self.requests = []
+        self.cumulative_weights = []
+        self.corpus = None
+        self.formatter = None
+        self.body_template = None
+        self.add(method, self.path, body=body)
+
+    def _head_lines(self, method, path, headers):
+        lines = ['%s %s HTTP/1.1' % (method, path),
+                 'Host: %s' % self.host_header,
+                 'User-Agent: %s' % USER_AGENT,
+                 'Accept: */*']
+        lines.extend('%s: %s' % (name, value) for name, value in self.headers)
+        lines.extend('%s: %s' % (name, value) for name, value in headers)
+        return lines
+
+    def add(self, method, path, headers=(), body=None, weight=1):
+        lines = self._head_lines(method, path, headers)
+        if body is not None:
+            lines.append('Content-Length: %i' % len(body))
+        head = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+        self.requests.append((head + (body or b''), method == 'HEAD'))
+        self.cumulative_weights.append((self.cumulative_weights[-1] if self.cumulative_weights else 0) + weight)
+
+    def load_corpus(self, filename):
+        """
+        Send the request with the next body from a corpus every time.  Only
+        the Content-Length is filled in per request, the rest of the head
+        is built once.
+        """
+        self.corpus = Corpus(filename)
+        self._build_head()
+
+    def load_formatter(self, formatter, body=None):
+        """
+        Expand the placeholders in the path, headers and `body` with a
+        Formatter for every request.
+        """
+        self.formatter = formatter
+        if body is not None:
+            self.body_template = formatter.compile(body)
+        self._build_head()
+
+    def _build_head(self):
+        # the head of a request built per request, which leaves the
+        # Content-Length to fill in if the body changes from one to the next
+        head = '\r\n'.join(self._head_lines(self.method, self.path, ()))
+        if self.corpus is not None or self.body_template is not None:
+            self.head = (head + '\r\nContent-Length: ').encode('latin-1')
+        else:
+            self.head = (head + '\r\n\r\n').encode('latin-1')
+        if self.formatter is not None:
+            self.head = self.formatter.compile(self.head)
+
+    def load_table(self, table):
+        """
+        Replace the request with the weighted mix from a bees.workload table.
+        """
+        self.requests = []
+        self.cumulative_weights = []
+        for weight, method, path, headers, body in table:
+            self.add(method, path, headers, base64.b64decode(body) if body is not None else None, weight)
+
+    def pick(self):
+        """
+        Return the raw bytes of the next request to send and whether it is a
+        HEAD request.
+        """
+        if self.formatter is not None:
+            formatter = self.formatter
+            values = formatter.values()
+            head = formatter.expand(self.head, values)
+            if self.corpus is not None:
+                body = self.corpus.take()
+            elif self.body_template is not None:
+                body = formatter.expand(self.body_template, values)
+            else:
+                return head, self.method == 'HEAD'
+            return b'%s%i\r\n\r\n%s' % (head, len(body), body), False
+        if self.corpus is not None:
+            body = self.corpus.take()
+            return b'%s%i\r\n\r\n%s' % (self.head, len(body), body), False
+        if len(self.requests) == 1:
+            return self.requests[0]
+        weights = self.cumulative_weights
+        return self.requests[bisect.bisect(weights, random.random() * weights[-1])]
+
+    def ssl_context(self):
+        if not self.tls:
+            return None
+        # bees attack staging servers with self-signed certificates as well,
+        # so do what _sting does and skip verification
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        return context
+
+
+# a placeholder in a url, header or body: {{name}} or {{name:arg:arg}}
+PLACEHOLDER = re.compile(rb'\{\{([a-z]+)((?::[^:{}]*)*)\}\}')
+
+
+def parse_placeholders(text):
+    """
+    Return the placeholders in a template (bytes) as (name, args) pairs,
+    raising ValueError for unknown ones or ones with the wrong arguments:
+
+        {{seq}}                 the number of the request, counting from 0
+        {{bee}}                 the number of the bee sending it
+        {{random:LO:HI}}        a random integer from LO to HI
+        {{csv:FILE:COLUMN}}     the next value from a column of a CSV file
+    """
+    placeholders = []
+    for match in PLACEHOLDER.finditer(text):
+        name = match.group(1).decode('ascii')
+        args = tuple(a.decode('utf-8') for a in match.group(2).split(b':')[1:])
+        if name in ('seq', 'bee'):
+            ok = not args
+        elif name == 'random':
+            ok = len(args) == 2 and all(a.lstrip('-').isdigit() for a in args) and int(args[0]) <= int(args[1])
+        elif name == 'csv':
+            ok = len(args) == 2 and all(args)
+        else:
+            raise ValueError('unknown placeholder %s' % match.group(0).decode('utf-8'))
+        if not ok:
+            raise ValueError('bad placeholder %s' % match.group(0).decode('utf-8'))
+        placeholders.append((name, args))
+    return placeholders
+
+
+class Formatter(object):
+    """
+    Expands the placeholders (see parse_placeholders) in the head and body
+    of a request for every request sent.  Each template is compiled once
+    into a bytes format string, with the bee's number filled in and a %s
+    for every other placeholder, so a request costs a call for each
+    distinct placeholder and a % for each template.  Placeholders that
+    appear in more than one template get the same value in all of them.
+
+    `columns` maps "FILE:COLUMN" to the values bees read out of the CSV
+    file.  {{seq}} counts the requests of the `bee`th of `bees`, spread out
+    over the event loops (see shard) so that no two loops of the swarm send
+    the same numbers, and the csv values are taken in the same order.
+    """
+    def __init__(self, bee=0, columns=None, bees=1):
+        self.bee = bee
+        self.bees = bees
+        self.columns = columns or {}
+        self.placeholders = []
+        self.getters = []
+        self.seq = 0
+        self.step = 1
+
+    def shard(self, part, parts):
+        # every bee runs the same number of loops, so the numbers of the
+        # `part`th of her `parts` interleave with those of every other loop
+        self.seq = self.bee * parts + part
+        self.step = self.bees * parts
+
+    def _getter(self, name, args):
+        if name == 'seq':
+            return lambda seq: b'%i' % seq
+        if name == 'random':
+            # cheaper than random.randint, which dominates otherwise
+            rand, lo, span = random.random, int(args[0]), int(args[1]) - int(args[0]) + 1
+            return lambda seq: b'%i' % (lo + int(rand() * span))
+        values = [v.encode('utf-8') for v in self.columns[':'.join(args)]]
+        return lambda seq: values[seq % len(values)]
+
+    def compile(self, text):
+        """
+        Compile a template into a format string and the indexes of the
+        values it takes, for expand.
+        """
+        parts = []
+        indexes = []
+        last = 0
+        for match, (name, args) in zip(PLACEHOLDER.finditer(text), parse_placeholders(text)):
+            parts.append(text[last:match.start()].replace(b'%', b'%%'))
+            last = match.end()
+            if name == 'bee':
+                parts.append(b'%i' % self.bee)
+                continue
+            if (name, args) not in self.placeholders:
+                self.placeholders.append((name, args))
+                self.getters.append(self._getter(name, args))
+            parts.append(b'%s')
+            indexes.append(self.placeholders.index((name, args)))
+        parts.append(text[last:].replace(b'%', b'%%'))
+        return b''.join(parts), tuple(indexes)
+
+    def values(self):
+        """
+        Return the values of the placeholders for the next request.
+        """
+        seq = self.seq
+        self.seq += self.step
+        return [getter(seq) for getter in self.getters]
+
+    @staticmethod
+    def expand(template, values):
+        fmt, indexes = template
+        return fmt % tuple([values[i] for i in indexes])
+
+
+class Corpus(object):
+    """
+    The bodies a bee sends one after the other, from a file written by
+    pack_corpus and mapped into memory, so that taking the next body is a
+    slice rather than a read.  The file is a header giving the number of
+    bodies, the offsets they start at and then the bodies back to back.
+    Each event loop takes every `step`th body from its own `start` (see
+    shard), so that the loops of a bee don't send the same ones.
+    """
+    HEADER = struct.Struct('<4sQ')
+    MAGIC = b'BEEC'
+
+    def __init__(self, filename):
+        with open(filename, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count = self.HEADER.unpack_from(self.map)
+        if magic != self.MAGIC or not self.count:
+            raise ValueError('%s is not a corpus' % filename)
+        end = self.HEADER.size + 8 * (self.count + 1)
+        self.offsets = array.array('Q')
+        self.offsets.frombytes(self.map[self.HEADER.size:end])
+        if sys.byteorder != 'little':
+            self.offsets.byteswap()
+        self.bodies = memoryview(self.map)[end:]
+        self.next = 0
+        self.step = 1
+
+    def shard(self, start, step):
+        self.next = start % self.count
+        self.step = step
+
+    def take(self):
+        i = self.next
+        self.next = (i + self.step) % self.count
+        return self.bodies[self.offsets[i]:self.offsets[i + 1]]
+
+
+def pack_corpus(bodies):
+    """
+    Pack a list of bodies into the file Corpus maps.
+    """
+    offsets = [0]
+    for body in bodies:
+        offsets.append(offsets[-1] + len(body))
+    return b''.join([Corpus.HEADER.pack(Corpus.MAGIC, len(bodies)),
+                     struct.pack('<%iQ' % len(offsets), *offsets)] + list(bodies))
+
+
+class Histogram(object):
+    """
+    Log-bucketed latency histogram in the style of HdrHistogram.
+
+    Latencies are recorded in microseconds.  Values below 2**SUB_BUCKET_BITS
+    are counted exactly, above that every power of two is split into
+    2**(SUB_BUCKET_BITS - 1) linear buckets, so any reported value is within
+    1% of the recorded one.  The memory used is fixed however many requests
+    are recorded, and merging two histograms is a bucket-wise sum.
+    """
+    SUB_BUCKET_BITS = 8
+    MAX_VALUE = 2 ** 36 - 1  # ~19 hours, in microseconds
+    BUCKETS = ((MAX_VALUE.bit_length() - SUB_BUCKET_BITS) << (SUB_BUCKET_BITS - 1)) + 2 ** SUB_BUCKET_BITS
+
+    def __init__(self):
+        self.counts = array.array('q', [0]) * self.BUCKETS
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    @classmethod
+    def index(cls, value):
+        shift = value.bit_length() - cls.SUB_BUCKET_BITS
+        if shift <= 0:
+            return value
+        return (shift << (cls.SUB_BUCKET_BITS - 1)) + (value >> shift)
+
+    @classmethod
+    def highest_value(cls, index):
+        """
+        Return the largest value counted in the bucket at `index`.
+        """
+        if index < 2 ** cls.SUB_BUCKET_BITS:
+            return index
+        shift = (index >> (cls.SUB_BUCKET_BITS - 1)) - 1
+        mantissa = index - (shift << (cls.SUB_BUCKET_BITS - 1))
+        return ((mantissa + 1) << shift) - 1
+
+    def record(self, ms, count=1):
+        value = min(max(int(ms * 1000), 0), self.MAX_VALUE)
+        self.counts[self.index(value)] += count
+        self.count += count
+        self.total += value * count
+        if self.min is None or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        counts = self.counts
+        for i, c in enumerate(other.counts):
+            if c:
+                counts[i] += c
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        self.max = max(self.max, other.max)
+
+    @classmethod
+    def combine(cls, histograms):
+        """
+        Merge any number of histograms into a new one, summing each bucket
+        across all of them at once rather than one histogram at a time.
+        """
+        histograms = list(histograms)
+        combined = cls()
+        if not histograms:
+            return combined
+        combined.counts = array.array('q', map(sum, zip(*[h.counts for h in histograms])))
+        combined.count = sum(h.count for h in histograms)
+        combined.total = sum(h.total for h in histograms)
+        minimums = [h.min for h in histograms if h.min is not None]
+        combined.min = min(minimums) if minimums else None
+        combined.max = max(h.max for h in histograms)
+        return combined
+
+    def mean(self):
+        return self.total / self.count / 1000.0 if self.count else 0.0
+
+    def percentile(self, percent):
+        """
+        Return the latency in ms that `percent` percent of the requests were
+        faster than or equal to.
+        """
+        if not self.count:
+            return 0.0
+        if percent >= 100:
+            return self.max / 1000.0
+        rank = max(1, int(math.ceil(percent / 100.0 * self.count)))
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank:
+                return min(self.highest_value(i), self.max) / 1000.0
+        return self.max / 1000.0
+
+    def percentiles(self, percents):
+        """
+        Return the latencies for a sorted list of percentiles in one pass.
+        """
+        values = []
+        if not self.count:
+            return [0.0 for p in percents]
+        ranks = [max(1, int(math.ceil(p / 100.0 * self.count))) for p in percents]
+        seen = 0
+        j = 0
+        for i, c in enumerate(self.counts):
+            if not c:
+                continue
+            seen += c
+            while j < len(ranks) and seen >= ranks[j]:
+                values.append(min(self.highest_value(i), self.max) / 1000.0)
+                j += 1
+            if j == len(ranks):
+                break
+        values.extend(self.max / 1000.0 for p in ranks[j:])
+        return values
+
+    def to_dict(self):
+        return {
+            'counts': [[i, c] for i, c in enumerate(self.counts) if c],
+            'count': self.count,
+            'total': self.total,
+            'min': self.min,
+            'max': self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls()
+        for i, c in data['counts']:
+            histogram.counts[i] = c
+        histogram.count = data['count']
+        histogram.total = data['total']
+        histogram.min = data['min']
+        histogram.max = data['max']
+        return histogram
+
+    @classmethod
+    def load(cls, data):
+        """
+        Return the histogram of a record, whether it was read from JSON or
+        unpacked by unpack_result.
+        """
+        return data if isinstance(data, cls) else cls.from_dict(data)
+
+
+class Stats(object):
+    """
+    Counters collected by one event loop.
+
+    Besides the totals, `timeline` keeps [complete, failed, total ms]
+    for every wall-clock second in which requests finished, so that the
+    controller can line the bees up on one time axis.
+    """
+    def __init__(self):
+        self.complete_requests = 0
+        self.failed_requests_connect = 0
+        self.failed_requests_receive = 0
+        self.failed_requests_length = 0
+        self.failed_requests_exceptions = 0
+        self.status_classes = [0] * 6
+        self.histogram = Histogram()
+        self.timeline = {}
+
+    def merge(self, other):
+        self.complete_requests += other.complete_requests
+        self.failed_requests_connect += other.failed_requests_connect
+        self.failed_requests_receive += other.failed_requests_receive
+        self.failed_requests_length += other.failed_requests_length
+        self.failed_requests_exceptions += other.failed_requests_exceptions
+        self.status_classes = [a + b for a, b in zip(self.status_classes, other.status_classes)]
+        self.histogram.merge(other.histogram)
+        for second, counts in other.timeline.items():
+            bucket = self.timeline.setdefault(second, [0, 0, 0.0])
+            bucket[0] += counts[0]
+            bucket[1] += counts[1]
+            bucket[2] += counts[2]
+
+    @classmethod
+    def from_result(cls, result):
+        """
+        Rebuild the counters from a result or interval record.
+        """
+        stats = cls()
+        stats.complete_requests = result['complete_requests']
+        stats.failed_requests_connect = result['failed_requests_connect']
+        stats.failed_requests_receive = result['failed_requests_receive']
+        stats.failed_requests_length = result['failed_requests_length']
+        stats.failed_requests_exceptions = result['failed_requests_exceptions']
+        for i in range(2, 6):
+            stats.status_classes[i] = result['number_of_%i00s' % i]
+        stats.histogram = Histogram.load(result['histogram'])
+        for second, complete, failed, ms in result.get('timeline', ()):
+            stats.timeline[second] = [complete, failed, ms]
+        return stats
+
+    def record(self, outcome):
+        """
+        Count the (failure, status, ms) outcome of one request, where failure
+        is None or the kind of failure.
+        """
+        failure, status, ms = outcome
+        second = int(time.time())
+        bucket = self.timeline.get(second)
+        if bucket is None:
+            bucket = self.timeline[second] = [0, 0, 0.0]
+        if failure is not None:
+            name = 'failed_requests_' + failure
+            setattr(self, name, getattr(self, name) + 1)
+            bucket[1] += 1
+            return
+        self.histogram.record(ms)
+        self.complete_requests += 1
+        self.status_classes[min(status // 100, 5)] += 1
+        bucket[0] += 1
+        bucket[2] += ms
+
+    @property
+    def failed_requests(self):
+        return (self.failed_requests_connect + self.failed_requests_receive +
+                self.failed_requests_length + self.failed_requests_exceptions)
+
+    def as_result(self, elapsed):
+        """
+        Return the result in the same shape bees._attack builds from ab.
+        The latency distribution is sent as a histogram rather than ab's
+        percentile table.
+        """
+        return {
+            'complete_requests': self.complete_requests,
+            'failed_requests': self.failed_requests,
+            'failed_requests_connect': self.failed_requests_connect,
+            'failed_requests_receive': self.failed_requests_receive,
+            'failed_requests_length': self.failed_requests_length,
+            'failed_requests_exceptions': self.failed_requests_exceptions,
+            'number_of_200s': self.status_classes[2],
+            'number_of_300s': self.status_classes[3],
+            'number_of_400s': self.status_classes[4],
+            'number_of_500s': self.status_classes[5],
+            'requests_per_second': self.complete_requests / elapsed if elapsed else 0.0,
+            'ms_per_request': self.histogram.mean(),
+            'elapsed': elapsed,
+            'histogram': self.histogram.to_dict(),
+            'timeline': [[second] + self.timeline[second] for second in sorted(self.timeline)],
+        }
+
+
+class ReceiveError(Exception):
+    pass
+
+
+async def _read_response(reader, head_only):
+    """
+    Read one HTTP/1.1 response off the connection.
+
+    Returns the status code and whether the server asked for the
+    connection to be closed.
+    """
+    status_line = await reader.readline()
+    if not status_line:
+        raise ReceiveError('connection closed by the target')
+    version, status = status_line.split(None, 2)[:2]
+    status = int(status)
+
+    length = None
+    chunked = False
+    close = version == b'HTTP/1.0'
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n'):
+            break
+        if not line:
+            raise ReceiveError('connection closed while reading headers')
+        name, _, value = line.partition(b':')
+        name = name.strip().lower()
+        value = value.strip().lower()
+        if name == b'content-length':
+            length = int(value)
+        elif name == b'transfer-encoding':
+            chunked = b'chunked' in value
+        elif name == b'connection':
+            close = value == b'close' or (close and value != b'keep-alive')
+
+    if head_only or status < 200 or status in (204, 304):
+        return status, close
+    if chunked:
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            if size == 0:
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                break
+            await reader.readexactly(size + 2)
+    elif length is not None:
+        await reader.readexactly(length)
+    else:
+        await reader.read()
+        close = True
+    return status, close
+
+
+class Worker(object):
+    """
+    Owns one keep-alive connection from the loop's pool and sends requests
+    over it until the loop runs out of requests.
+    """
+    def __init__(self, target, stats, ssl_context):
+        self.target = target
+        self.stats = stats
+        self.ssl_context = ssl_context
+        self.reader = self.writer = None
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    async def connect(self):
+        target = self.target
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(target.host, target.port, ssl=self.ssl_context),
+            target.timeout)
+
+    async def fetch(self, due=None):
+        """
+        Send one request and return its outcome for Stats.record.  If the
+        request was due to be sent at an earlier time `due` (on the
+        time.monotonic clock, like every latency here, so that the wall
+        clock stepping doesn't skew them), its latency is counted from
+        then.  A request that fails on a connection that was
+        reused is retried once on a fresh connection, since the target is
+        free to close idle keep-alive connections.
+        """
+        target = self.target
+        request, head_only = target.pick()
+        for attempt in (0, 1):
+            reused = self.writer is not None
+            start = due if due is not None else time.monotonic()
+            if not reused:
+                try:
+                    await self.connect()
+                except (OSError, asyncio.TimeoutError):
+                    return ('connect', None, None)
+            try:
+                self.writer.write(request)
+                status, close = await asyncio.wait_for(
+                    _read_response(self.reader, head_only), target.timeout)
+            except (OSError, ReceiveError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+                self.close()
+                if reused and attempt == 0:
+                    continue
+                return ('receive', None, None)
+            except Exception:
+                self.close()
+                return ('exceptions', None, None)
+            if close:
+                self.close()
+            return (None, status, (time.monotonic() - start) * 1000.0)
+
+    # the counters are looked up on self.stats only once the outcome is
+    # known, as the reporter swaps them out between intervals
+
+    async def run(self, remaining):
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            outcome = await self.fetch()
+            self.stats.record(outcome)
+        self.close()
+
+    async def run_scheduled(self, schedule, stages):
+        while True:
+            due, stage = await schedule.get()
+            if due is None:
+                break
+            outcome = await self.fetch(due)
+            self.stats.record(outcome)
+            stages[stage].record(outcome)
+        self.close()
+
+
+def parse_profile(spec):
+    """
+    Parse a load profile into a list of (kind, start rate, end rate, seconds)
+    stages.  Step stages are expanded into one hold stage per step.
+    """
+    stages = []
+    for part in spec.split(','):
+        fields = part.strip().split(':')
+        kind = fields[0]
+        try:
+            values = [float(f) for f in fields[1:]]
+        except ValueError:
+            raise ValueError('invalid load profile stage %r' % part)
+        if kind == 'hold' and len(values) == 2:
+            stages.append(('hold', values[0], values[0], values[1]))
+        elif kind == 'ramp' and len(values) == 3:
+            stages.append(('ramp', values[0], values[1], values[2]))
+        elif kind == 'step' and len(values) == 4 and values[2] > 0:
+            start, end, step, seconds = values
+            direction = 1 if end >= start else -1
+            for i in range(int(abs(end - start) // step) + 1):
+                rate = start + direction * i * step
+                stages.append(('hold', rate, rate, seconds))
+        else:
+            raise ValueError('invalid load profile stage %r, expected hold:RATE:SECONDS, '
+                             'ramp:FROM:TO:SECONDS or step:FROM:TO:STEP:SECONDS' % part)
+        if min(stages[-1][1:]) < 0:
+            raise ValueError('invalid load profile stage %r, rates and durations cannot be negative' % part)
+    return stages
+
+
+def format_profile(stages, share=1.0):
+    """
+    Turn parsed stages back into a profile, with every rate scaled by `share`.
+    """
+    return ','.join('ramp:%r:%r:%r' % (start * share, end * share, seconds)
+                    for kind, start, end, seconds in stages)
+
+
+def stage_name(stage):
+    kind, start, end, seconds = stage
+    if kind == 'hold':
+        return 'hold %g/s %gs' % (start, seconds)
+    return 'ramp %g-%g/s %gs' % (start, end, seconds)
+
+
+def _due_times(stages):
+    """
+    Yield the time, relative to the start, that each request is due along
+    with the index of its stage.  Within a ramp the rate changes linearly, so
+    the k-th request is due when the area under the rate reaches k.
+    """
+    offset = 0.0
+    for i, (kind, start, end, seconds) in enumerate(stages):
+        slope = (end - start) / seconds if seconds else 0.0
+        k = 0
+        while True:
+            if not slope:
+                t = k / start if start else seconds
+            else:
+                discriminant = start * start + 2 * slope * k
+                if discriminant < 0:
+                    break
+                t = (math.sqrt(discriminant) - start) / slope
+            if t >= seconds:
+                break
+            yield offset + t, i
+            k += 1
+        offset += seconds
+
+
+async def _schedule(stages, schedule, workers):
+    """
+    Put the time each request is due on the schedule once it comes, whether
+    or not a worker is free to send it.
+    """
+    start = time.monotonic()
+    for offset, stage in _due_times(stages):
+        due = start + offset
+        delay = due - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        schedule.put_nowait((due, stage))
+    for worker in workers:
+        schedule.put_nowait((None, None))
+
+
+async def _report(workers, interval, queue):
+    """
+    Every `interval` seconds hand the counters collected since the last
+    report to the parent process and start afresh.
+    """
+    start = time.monotonic()
+    seq = 0
+    while True:
+        seq += 1
+        await asyncio.sleep(max(0, start + seq * interval - time.monotonic()))
+        stats = workers[0].stats
+        fresh = Stats()
+        for worker in workers:
+            worker.stats = fresh
+        queue.put(('interval', seq, stats))
+
+
+async def _run_loop(target, requests, concurrency, interval, stages, queue):
+    stats = Stats()
+    ssl_context = target.ssl_context()
+    workers = [Worker(target, stats, ssl_context) for i in range(concurrency)]
+    reporter = asyncio.ensure_future(_report(workers, interval, queue)) if interval else None
+    if stages:
+        schedule = asyncio.Queue()
+        stage_stats = [Stats() for stage in stages]
+        await asyncio.gather(_schedule(stages, schedule, workers),
+                             *[worker.run_scheduled(schedule, stage_stats) for worker in workers])
+        queue.put(('stages', None, stage_stats))
+    else:
+        remaining = [requests]
+        await asyncio.gather(*[worker.run(remaining) for worker in workers])
+    if reporter is not None:
+        reporter.cancel()
+    return workers[0].stats
+
+
+def _run_process(target, requests, concurrency, interval, stages, queue, start_at=None, part=(0, 1)):
+    """
+    Entry point of each forked process, the `part[0]`th of `part[1]`: run
+    one event loop to completion and hand the counters back to the parent.
+    """
+    # every forked process starts with the same random state, which would
+    # have all of them draw the same sequence of requests from a mix
+    random.seed()
+    if target.corpus is not None:
+        target.corpus.shard(*part)
+    if target.formatter is not None:
+        target.formatter.shard(*part)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    if start_at:
+        time.sleep(max(0, start_at - time.time()))
+    try:
+        stats = loop.run_until_complete(_run_loop(target, requests, concurrency, interval, stages, queue))
+    finally:
+        loop.close()
+    queue.put(('done', None, stats))
+
+
+def _split(total, parts):
+    return [total // parts + (1 if i < total % parts else 0) for i in range(parts)]
+
+
+def pack_result(record):
+    """
+    Pack a result or interval record into one line of text.
+
+    The counters go in as JSON, but the histogram buckets (of the record
+    and of its stages) and the timeline rows go in as packed little-endian
+    arrays, and the lot is deflated and base64 encoded.  That keeps a
+    record with thousands of buckets down to a few kilobytes on the wire
+    and lets unpack_result rebuild it without parsing a list per bucket.
+    """
+    record = dict(record)
+    buckets = array.array('q')
+
+    def pack_histogram(record):
+        histogram = record['histogram']
+        for i, c in histogram['counts']:
+            buckets.append(i)
+            buckets.append(c)
+        record['histogram'] = {'buckets': len(histogram['counts']), 'count': histogram['count'],
+                               'total': histogram['total'], 'min': histogram['min'], 'max': histogram['max']}
+
+    pack_histogram(record)
+    if 'stages' in record:
+        record['stages'] = [dict(stage) for stage in record['stages']]
+        for stage in record['stages']:
+            # the timeline of the whole run covers the stages too
+            stage.pop('timeline', None)
+            pack_histogram(stage)
+    timeline = array.array('d', [value for row in record.pop('timeline', ()) for value in row])
+    if sys.byteorder != 'little':
+        buckets.byteswap()
+        timeline.byteswap()
+
+    header = json.dumps(record, separators=(',', ':')).encode('utf-8')
+    data = PACKED_HEADER.pack(len(header), len(buckets), len(timeline)) + header + buckets.tobytes() + timeline.tobytes()
+    return PACKED + base64.b64encode(zlib.compress(data)).decode('ascii')
+
+
+def unpack_result(line):
+    """
+    Rebuild a record from a line written by pack_result.  Its histograms
+    come back as Histogram objects, filled straight from the packed array.
+    """
+    data = zlib.decompress(base64.b64decode(line.strip()[len(PACKED):]))
+    header_size, bucket_count, timeline_count = PACKED_HEADER.unpack_from(data)
+    offset = PACKED_HEADER.size
+    record = json.loads(data[offset:offset + header_size].decode('utf-8'))
+    offset += header_size
+    buckets = array.array('q')
+    buckets.frombytes(data[offset:offset + bucket_count * buckets.itemsize])
+    offset += bucket_count * buckets.itemsize
+    timeline = array.array('d')
+    timeline.frombytes(data[offset:offset + timeline_count * timeline.itemsize])
+    if sys.byteorder != 'little':
+        buckets.byteswap()
+        timeline.byteswap()
+
+    position = 0
+    for part in [record] + record.get('stages', []):
+        packed = part['histogram']
+        histogram = Histogram()
+        counts = histogram.counts
+        end = position + 2 * packed['buckets']
+        for i in range(position, end, 2):
+            counts[buckets[i]] = buckets[i + 1]
+        position = end
+        histogram.count = packed['count']
+        histogram.total = packed['total']
+        histogram.min = packed['min']
+        histogram.max = packed['max']
+        part['histogram'] = histogram
+    record['timeline'] = [[int(timeline[i]), int(timeline[i + 1]), int(timeline[i + 2]), timeline[i + 3]]
+                          for i in range(0, len(timeline), 4)]
+    return record
+
+
+# whether emit writes plain JSON rather than packed records
+EMIT_JSON = False
+
+
+def emit(record):
+    """
+    Write one record to stdout as a packed line and flush it straight
+    through to the controller.
+    """
+    if EMIT_JSON:
+        sys.stdout.write(json.dumps(record, separators=(',', ':')))
+    else:
+        sys.stdout.write(pack_result(record))
+    sys.stdout.write('\n')
+    sys.stdout.flush()
+
+
+def run(target, requests, concurrency, processes=None, interval=0, rate=0, profile=None, start_at=None):
+    """
+    Fire `requests` requests at the target over `concurrency` keep-alive
+    connections, spread over one event loop per CPU core.
+
+    With an `interval`, a record of the requests completed during the last
+    `interval` seconds is emitted as they go.  With a `rate`, requests are
+    sent at that many per second regardless of how fast they are answered,
+    and with a `profile` (a list of stages from parse_profile) they are sent
+    at the rates it gives instead of `requests` of them.  With `start_at`,
+    the loops are set up straight away but hold their fire until that
+    wall-clock time.
+    """
+    processes = max(1, min(processes or multiprocessing.cpu_count(), concurrency))
+    context = multiprocessing.get_context('fork')
+    queue = context.Queue()
+
+    # an arrival rate is a profile with a single hold stage, just long
+    # enough for each loop to send its share of the requests
+    stages = profile or (rate and [('hold', rate, rate, requests / rate)])
+    if profile:
+        shares = [1.0 / processes] * processes
+    else:
+        shares = [n / requests for n in _split(requests, processes)]
+
+    children = [context.Process(target=_run_process, args=(
+                    target, n, c, interval,
+                    stages and [(kind, a * share, b * share, t) for kind, a, b, t in stages],
+                    queue, start_at, (i, processes)))
+                for i, (n, c, share) in enumerate(zip(_split(requests, processes), _split(concurrency, processes), shares))]
+    for child in children:
+        child.start()
+    if start_at:
+        time.sleep(max(0, start_at - time.time()))
+    start = time.time()
+
+    stats = Stats()
+    stage_stats = [Stats() for stage in profile or ()]
+    # interval number -> counters merged so far and how many loops sent them
+    ticks = {}
+    running = len(children)
+    while running:
+        kind, seq, delta = queue.get()
+        if kind == 'stages':
+            for total, stage in zip(stage_stats, delta):
+                total.merge(stage)
+            continue
+        stats.merge(delta)
+        if kind == 'done':
+            running -= 1
+        else:
+            tick = ticks.setdefault(seq, [Stats(), 0])
+            tick[0].merge(delta)
+            tick[1] += 1
+        # an interval is complete once every loop still running reported it
+        for seq in sorted(ticks):
+            if ticks[seq][1] < running and running:
+                break
+            record = ticks.pop(seq)[0].as_result(interval)
+            record['type'] = 'interval'
+            record['seq'] = seq
+            emit(record)
+    for child in children:
+        child.join()
+    finished = time.time()
+    elapsed = finished - start
+
+    result = stats.as_result(elapsed)
+    result['started'] = start
+    result['finished'] = finished
+    if rate and not profile:
+        result['target_rate'] = rate
+        result['achieved_rate'] = (stats.complete_requests + stats.failed_requests) / elapsed
+    if profile:
+        result['stages'] = []
+        for stage, total in zip(profile, stage_stats):
+            record = total.as_result(stage[3])
+            record['target_rate'] = (stage[1] + stage[2]) / 2.0
+            result['stages'].append(record)
+    return result
+
+
+def _parse_headers(args):
+    headers = []
+    for header in args.headers:
+        name, _, value = header.partition(':')
+        headers.append((name.strip(), value.strip()))
+    if args.content_type and args.post_file:
+        headers.append(('Content-Type', args.content_type))
+    if args.cookies:
+        headers.append(('Cookie', args.cookies))
+    if args.basic_auth:
+        headers.append(('Authorization', 'Basic %s' % base64.b64encode(args.basic_auth.encode('utf-8')).decode('ascii')))
+    return headers
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Native bees load generator.')
+    parser.add_argument('url', nargs='?')
+    parser.add_argument('-n', dest='requests', type=int, default=1)
+    parser.add_argument('-c', dest='concurrency', type=int, default=1)
+    parser.add_argument('-H', dest='headers', action='append', default=[])
+    parser.add_argument('-T', dest='content_type', default='')
+    parser.add_argument('-C', dest='cookies', default='')
+    parser.add_argument('-A', dest='basic_auth', default='')
+    parser.add_argument('-p', dest='post_file', default=None)
+    parser.add_argument('-X', dest='method', default=None)
+    parser.add_argument('-s', dest='timeout', type=float, default=30)
+    parser.add_argument('-w', dest='processes', type=int, default=None,
+                        help='number of event loops to run (default: one per CPU core)')
+    parser.add_argument('-i', dest='interval', type=float, default=0,
+                        help='stream a record of the last INTERVAL seconds as the attack goes')
+    parser.add_argument('-r', dest='rate', type=float, default=0,
+                        help='send RATE requests per second on a fixed timeline, counting latency from when each was due')
+    parser.add_argument('-P', dest='profile', type=parse_profile, default=None,
+                        help='send requests on the timeline of a load profile instead, see above')
+    parser.add_argument('-W', dest='workload', default=None,
+                        help='draw the requests from the weighted mix in this gzipped table from bees.workload')
+    parser.add_argument('-S', dest='start_at', type=float, default=None,
+                        help='hold fire until this wall-clock time (seconds since the epoch)')
+    parser.add_argument('-J', dest='json', action='store_true',
+                        help='print the records as plain JSON rather than packed')
+    parser.add_argument('-B', dest='corpus', default=None,
+                        help='send every request with the next body from this corpus built by pack_corpus')
+    parser.add_argument('-E', dest='expand', action='store_true',
+                        help='expand the placeholders in the path, headers and body for every request')
+    parser.add_argument('-b', dest='bee', type=int, default=0,
+                        help='the number of the bee, for {{bee}}')
+    parser.add_argument('-k', dest='bees', type=int, default=1,
+                        help='the number of bees in the swarm, so that {{seq}} and {{csv}} go on from bee to bee')
+    parser.add_argument('-V', dest='columns', default=None,
+                        help='read the values for {{csv:FILE:COLUMN}} from this JSON table from bees')
+    parser.add_argument('-R', dest='request', default=None,
+                        help='send the request in this JSON template from bees, in place of the url, -H, -T, -C, -A and -X')
+    args = parser.parse_args(argv)
+    if not args.url and not args.request:
+        parser.error('a url or a request template (-R) is needed')
+
+    global EMIT_JSON
+    EMIT_JSON = args.json
+
+    body = None
+    if args.post_file:
+        with open(os.path.expanduser(args.post_file), 'rb') as f:
+            body = f.read()
+    if args.request:
+        with open(os.path.expanduser(args.request)) as f:
+            request = json.load(f)
+        target = Target(request['url'], request['method'], [tuple(h) for h in request['headers']], body, args.timeout)
+    else:
+        method = args.method or ('POST' if body is not None else 'GET')
+        target = Target(args.url, method, _parse_headers(args), body, args.timeout)
+    if args.workload:
+        with gzip.open(os.path.expanduser(args.workload), 'rt') as f:
+            target.load_table(json.load(f))
+    if args.corpus:
+        target.load_corpus(os.path.expanduser(args.corpus))
+    if args.expand:
+        columns = None
+        if args.columns:
+            with open(os.path.expanduser(args.columns)) as f:
+                columns = json.load(f)
+        target.load_formatter(Formatter(args.bee, columns, args.bees), body if not args.corpus else None)
+
+    emit(run(target, args.requests, args.concurrency, args.processes, args.interval, args.rate, args.profile, args.start_at))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,228 @@
+"""
+The MIT License
+
+Copyright (c) 2010 The Chicago Tribune & Contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+The swarm roster.
+
+Every swarm bees has called up is kept in a small SQLite database in the
+user's home directory: one row per zone with the user and key the bees are
+reached with, and one row per bee with what EC2 last told us about it
+(addresses, type, launch time, state and, for spot bees, the bid).  Each
+change is one transaction, so the threads of a multi-zone "bees up" can
+record their swarms at the same time without stepping on each other.
+
+Older versions kept a ~/.bees.<zone> text file per swarm; those are moved
+into the database the first time it is opened.
+"""
+from __future__ import print_function
+
+import os
+import re
+import sqlite3
+import time
+
+DATABASE = os.path.expanduser('~/.bees-state.db')
+LEGACY_FILENAME = os.path.expanduser('~/.bees')
+LOCK_TIMEOUT = 30
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS swarms (
+    zone TEXT PRIMARY KEY,
+    username TEXT NOT NULL,
+    key_name TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS bees (
+    instance_id TEXT PRIMARY KEY,
+    zone TEXT NOT NULL REFERENCES swarms (zone) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    public_dns_name TEXT,
+    private_dns_name TEXT,
+    instance_type TEXT,
+    launch_time TEXT,
+    state TEXT,
+    spot_price TEXT,
+    checked REAL
+);
+CREATE INDEX IF NOT EXISTS bees_zone ON bees (zone, position);
+"""
+
+BEE_COLUMNS = ('instance_id', 'zone', 'public_dns_name', 'private_dns_name', 'instance_type',
+               'launch_time', 'state', 'spot_price', 'checked')
+
+
+def _connect():
+    """
+    Open the database, creating it and taking in any legacy roster files
+    the first time.
+    """
+    new = not os.path.exists(DATABASE)
+    db = sqlite3.connect(DATABASE, timeout=LOCK_TIMEOUT, isolation_level=None)
+    db.execute('PRAGMA foreign_keys = ON')
+    if new:
+        os.chmod(DATABASE, 0o600)
+    db.executescript(SCHEMA)
+    if new:
+        _migrate(db)
+    return db
+
+
+class _transaction(object):
+    """
+    Run a block as one write transaction, taking the database lock up
+    front so concurrent writers queue up instead of failing halfway.
+    """
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute('BEGIN IMMEDIATE')
+        return self.db
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.db.execute('COMMIT' if exc_type is None else 'ROLLBACK')
+
+
+def _legacy_files():
+    home = os.path.dirname(LEGACY_FILENAME)
+    name = os.path.basename(LEGACY_FILENAME)
+    pattern = re.compile(r'^%s(\.[a-z0-9-]+)?$' % re.escape(name))
+    return [os.path.join(home, f) for f in sorted(os.listdir(home)) if pattern.match(f)
+            and os.path.isfile(os.path.join(home, f))]
+
+
+def _migrate(db):
+    """
+    Move the ~/.bees.<zone> files older versions wrote into the database.
+    Files that don't look like a roster are left alone.
+    """
+    moved = []
+    with _transaction(db):
+        for filename in _legacy_files():
+            try:
+                with open(filename) as f:
+                    lines = f.read().split('\n')
+            except IOError:
+                # another bees command got to it first
+                continue
+            if len(lines) < 3 or not lines[2].strip():
+                continue
+            username, key_name, zone = [line.strip() for line in lines[:3]]
+            instance_ids = [line.strip() for line in lines[3:] if line.strip()]
+            _replace_swarm(db, username, key_name, zone, [dict(instance_id=i) for i in instance_ids])
+            moved.append((filename, len(instance_ids)))
+        for filename, count in moved:
+            os.remove(filename)
+    for filename, count in moved:
+        print('Moved {} bees from {} into {}.'.format(count, filename, DATABASE))
+
+
+def _replace_swarm(db, username, key_name, zone, bees):
+    db.execute('DELETE FROM swarms WHERE zone = ?', (zone,))
+    db.execute('INSERT INTO swarms (zone, username, key_name, updated) VALUES (?, ?, ?, ?)',
+               (zone, username, key_name, time.time()))
+    for position, bee in enumerate(bees):
+        row = dict((column, bee.get(column)) for column in BEE_COLUMNS)
+        row.update(zone=zone, position=position)
+        db.execute('INSERT OR REPLACE INTO bees (%s) VALUES (%s)' % (', '.join(row), ', '.join('?' * len(row))),
+                   list(row.values()))
+
+
+def describe(instance, spot_price=None):
+    """
+    Turn a boto instance into the bee record the roster keeps.
+    """
+    bee = dict(
+        instance_id=instance.id,
+        public_dns_name=instance.public_dns_name or None,
+        private_dns_name=instance.private_dns_name or None,
+        instance_type=instance.instance_type,
+        launch_time=instance.launch_time,
+        state=instance.state,
+        checked=time.time())
+    if spot_price is not None and getattr(instance, 'spot_instance_request_id', None):
+        bee['spot_price'] = spot_price
+    return bee
+
+
+def read_swarm(zone):
+    """
+    Return (username, key_name, zone, bees) for the swarm in a zone, bees
+    being a list of bee records in the order they were called up, or None
+    if no swarm has been called up there.
+    """
+    db = _connect()
+    try:
+        swarm = db.execute('SELECT username, key_name FROM swarms WHERE zone = ?', (zone,)).fetchone()
+        if swarm is None:
+            return None
+        rows = db.execute('SELECT %s FROM bees WHERE zone = ? ORDER BY position' % ', '.join(BEE_COLUMNS), (zone,))
+        return (swarm[0], swarm[1], zone, [dict(zip(BEE_COLUMNS, row)) for row in rows])
+    finally:
+        db.close()
+
+
+def write_swarm(username, key_name, zone, bees):
+    """
+    Replace the swarm in a zone with the given bee records.
+    """
+    db = _connect()
+    try:
+        with _transaction(db):
+            _replace_swarm(db, username, key_name, zone, bees)
+    finally:
+        db.close()
+
+
+def update_bees(bees):
+    """
+    Record what EC2 last told us about some bees already in the roster.
+    """
+    db = _connect()
+    try:
+        with _transaction(db):
+            for bee in bees:
+                columns = [c for c in BEE_COLUMNS if c in bee and c not in ('instance_id', 'zone')]
+                db.execute('UPDATE bees SET %s WHERE instance_id = ?' % ', '.join('%s = ?' % c for c in columns),
+                           [bee[c] for c in columns] + [bee['instance_id']])
+    finally:
+        db.close()
+
+
+def delete_swarm(zone):
+    db = _connect()
+    try:
+        with _transaction(db):
+            db.execute('DELETE FROM swarms WHERE zone = ?', (zone,))
+    finally:
+        db.close()
+
+
+def zones():
+    """
+    Return the zones there are swarms in.
+    """
+    db = _connect()
+    try:
+        return [row[0] for row in db.execute('SELECT zone FROM swarms ORDER BY zone')]
+    finally:
+        db.close()
@@ -0,0 +1,181 @@
+"""
+The MIT License
+
+Copyright (c) 2010 The Chicago Tribune & Contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+Request mixes for the native engine.
+
+A workload file has one JSON object per line describing a request the bees
+should send, relative to the url being attacked:
+
+    {"path": "/", "weight": 10}
+    {"path": "/search?q=bees", "weight": 3, "headers": {"Accept": "application/json"}}
+    {"path": "/login", "method": "POST", "body": "user=bee&password=buzz",
+     "headers": {"Content-Type": "application/x-www-form-urlencoded"}}
+
+"method" defaults to GET and "weight" to 1.  A body can also be read from
+a file with "body_file", relative to the workload file.  Blank lines and
+lines starting with # are skipped.
+
+An nginx or Apache access log in the common or combined format can be
+replayed instead, in which case every distinct GET or HEAD request in the
+log is weighted by how often it was made.  Other requests are skipped, as
+the log doesn't record their bodies.
+
+Either way the mix is compiled into a compact table that is sent to the
+bees once and kept in their payload cache, see compile_table and
+native.Target.load_table.
+
+A corpus of request bodies, for sending a different body with every
+request, is either a directory holding one body per file or a file holding
+one body per line, see load_corpus and native.Corpus.
+
+The values of {{csv:FILE:COLUMN}} placeholders are read out of their CSV
+files here too, see load_columns and native.Formatter.
+"""
+from __future__ import print_function
+
+import base64
+import csv
+import gzip
+import io
+import json
+import os
+import re
+
+from collections import OrderedDict
+
+ACCESS_LOG_LINE = re.compile(r'^\S+ \S+ \S+ \[[^\]]*\] "([A-Z]+) (\S+)(?: HTTP/[0-9.]+)?" [0-9]{3} ')
+
+
+class WorkloadError(Exception):
+    pass
+
+
+def load(filename):
+    """
+    Read a workload file into a list of (weight, method, path, headers, body)
+    entries.
+    """
+    entries = []
+    with open(filename) as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                spec = json.loads(line)
+            except ValueError as e:
+                raise WorkloadError('%s:%i: %s' % (filename, number, e))
+            path = spec.get('path', '')
+            if not path.startswith('/'):
+                raise WorkloadError('%s:%i: "path" must start with /' % (filename, number))
+            weight = spec.get('weight', 1)
+            if not isinstance(weight, (int, float)) or weight <= 0:
+                raise WorkloadError('%s:%i: "weight" must be a positive number' % (filename, number))
+            body = spec.get('body')
+            if body is not None:
+                body = body.encode('utf-8')
+            elif spec.get('body_file'):
+                body_file = os.path.join(os.path.dirname(filename), spec['body_file'])
+                try:
+                    with open(body_file, 'rb') as b:
+                        body = b.read()
+                except IOError as e:
+                    raise WorkloadError('%s:%i: %s' % (filename, number, e))
+            headers = sorted((spec.get('headers') or {}).items())
+            entries.append((weight, spec.get('method', 'GET').upper(), path, headers, body))
+    if not entries:
+        raise WorkloadError('%s: no requests found' % filename)
+    return entries
+
+
+def load_access_log(filename):
+    """
+    Read the GET and HEAD requests out of an access log into a list of
+    entries, weighted by how often each was made.
+    """
+    counts = OrderedDict()
+    with io.open(filename, encoding='utf-8', errors='replace') as f:
+        for line in f:
+            match = ACCESS_LOG_LINE.match(line)
+            if match and match.group(1) in ('GET', 'HEAD') and match.group(2).startswith('/'):
+                key = (match.group(1), match.group(2))
+                counts[key] = counts.get(key, 0) + 1
+    if not counts:
+        raise WorkloadError('%s: no GET or HEAD requests found' % filename)
+    return [(count, method, path, [], None) for (method, path), count in counts.items()]
+
+
+def compile_table(entries):
+    """
+    Pack entries into the gzipped JSON table the native engine loads.
+    """
+    table = [[weight, method, path, headers, base64.b64encode(body).decode('ascii') if body is not None else None]
+             for weight, method, path, headers, body in entries]
+    # no timestamp, so the same mix always packs into the same table and
+    # the bees find it in their payload cache
+    packed = io.BytesIO()
+    with gzip.GzipFile(fileobj=packed, mode='wb', mtime=0) as f:
+        f.write(json.dumps(table, separators=(',', ':')).encode('utf-8'))
+    return packed.getvalue()
+
+
+def load_corpus(path):
+    """
+    Read a corpus into a list of bodies: every file in a directory, in name
+    order, or every line of a file.  Blank lines are skipped.
+    """
+    if os.path.isdir(path):
+        bodies = []
+        for name in sorted(os.listdir(path)):
+            filename = os.path.join(path, name)
+            if os.path.isfile(filename):
+                with open(filename, 'rb') as f:
+                    bodies.append(f.read())
+    else:
+        with open(path, 'rb') as f:
+            bodies = [line.rstrip(b'\r\n') for line in f if line.strip()]
+    if not bodies:
+        raise WorkloadError('%s: no bodies found' % path)
+    return bodies
+
+
+def load_columns(placeholders):
+    """
+    Read the columns the {{csv:FILE:COLUMN}} placeholders among the
+    (name, args) pairs from native.parse_placeholders refer to, into a dict
+    of the values by "FILE:COLUMN".  COLUMN is a name from the header row.
+    """
+    columns = {}
+    for name, args in placeholders:
+        if name != 'csv' or ':'.join(args) in columns:
+            continue
+        filename, column = args
+        with io.open(filename, encoding='utf-8', newline='') as f:
+            rows = csv.DictReader(f)
+            if column not in (rows.fieldnames or ()):
+                raise WorkloadError('%s: no column named %s' % (filename, column))
+            values = [row[column] for row in rows if row[column] is not None]
+        if not values:
+            raise WorkloadError('%s: no values in column %s' % (filename, column))
+        columns[':'.join(args)] = values
+    return columns
@@ -18,6 +18,7 @@ setup(name='beeswithmachineguns',
       packages=['beeswithmachineguns'],
       scripts=['bees'],
       install_requires=required_packages,
+      python_requires='>=3.5',
       classifiers=[
           'Development Status :: 4 - Beta',
           'Environment :: Console',
@@ -26,6 +27,8 @@ setup(name='beeswithmachineguns',
           'Natural Language :: English',
           'Operating System :: OS Independent',
           'Programming Language :: Python',
+          'Programming Language :: Python :: 3',
+          'Programming Language :: Python :: 3 :: Only',
           'Topic :: Software Development :: Testing :: Traffic Generation',
           'Topic :: Utilities',
           ],
@@ -0,0 +1,80 @@
+"""
+Time _summarize_results over a synthetic swarm.
+
+    python -m test.benchmark_summary [--bees 1000] [--seconds 11] [--no-numpy]
+
+Half the bees report a native histogram and half only an ab style cdf,
+spread over two regions, with 3000 requests each.  Prints the best of
+--repeat runs with and without a CSV file.
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from beeswithmachineguns import bees, native
+
+
+def _bee(seconds, with_histogram):
+    histogram = native.Histogram()
+    for i in range(3000):
+        histogram.record(random.lognormvariate(1, 0.8))
+    result = {
+        'complete_requests': histogram.count,
+        'failed_requests': 3,
+        'failed_requests_connect': 1,
+        'failed_requests_receive': 1,
+        'failed_requests_length': 0,
+        'failed_requests_exceptions': 1,
+        'number_of_200s': histogram.count,
+        'number_of_300s': 0,
+        'number_of_400s': 0,
+        'number_of_500s': 0,
+        'requests_per_second': 300.0,
+        'ms_per_request': histogram.mean(),
+        'started': 1000.0 + random.random(),
+        'finished': 1010.0 + random.random(),
+        'timeline': [[1000 + s, 300, 0, 900.0] for s in range(seconds)],
+        'request_time_cdf': histogram.percentiles(list(range(100))),
+    }
+    if with_histogram:
+        result['histogram'] = histogram
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--bees', type=int, default=1000)
+    parser.add_argument('--seconds', type=int, default=11, help='length of every bee\'s timeline')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--no-numpy', action='store_true', help='summarize with the standard library only')
+    args = parser.parse_args()
+
+    if args.no_numpy:
+        bees.numpy = None
+    random.seed(1)
+    results = [_bee(args.seconds, i % 2) for i in range(args.bees)]
+    params = [{'i': i, 'instance_id': 'i-%05d' % i, 'zone': 'us-east-1' + 'ab'[i % 2], 'tpr': None, 'rps': None}
+              for i in range(args.bees)]
+
+    directory = tempfile.mkdtemp()
+    try:
+        for csv_filename in (None, os.path.join(directory, 'summary.csv')):
+            best = float('inf')
+            for i in range(args.repeat):
+                started = time.perf_counter()
+                summary = bees._summarize_results(results, params, csv_filename)
+                best = min(best, time.perf_counter() - started)
+            print('%i bees, %is timelines, csv=%s: %.1f ms' % (args.bees, args.seconds, bool(csv_filename), best * 1000))
+    finally:
+        shutil.rmtree(directory)
+    print('requests %i, mean %.3f ms, p99 %.3f ms' % (
+        summary['total_complete_requests'], summary['mean_response'], summary['request_time_p99']))
+
+
+if __name__ == '__main__':
+    main()
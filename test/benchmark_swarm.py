@@ -0,0 +1,121 @@
+"""
+Measure what driving a swarm's SSH sessions costs the controller.
+
+    python -m test.benchmark_swarm [--bees 200] [--seconds 3] [--pool]
+
+Every bee connects to a local fake SSH server (see test.fakessh) and runs a
+command that takes --seconds, the way bees wait on their benchmark.  Prints
+the peak number of processes and their summed resident memory, sampled
+every 0.1 seconds, and the wall time.  With --pool the bees are forked one
+process each through multiprocessing.Pool, as attack() used to, rather
+than run from bees._run_swarm.
+"""
+from __future__ import print_function
+
+import argparse
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import paramiko
+
+from beeswithmachineguns import bees
+
+from . import fakessh
+
+
+def _bee(params):
+    client = bees._connect(params)
+    try:
+        stdin, stdout, stderr = client.exec_command('sleep %s' % params['seconds'])
+        return stdout.channel.recv_exit_status()
+    finally:
+        client.close()
+
+
+def _serve(home, ports):
+    with fakessh.serve(home) as server:
+        ports.put(server.port)
+        while True:
+            time.sleep(60)
+
+
+def _process_tree(server):
+    """
+    Return the number of this process and its children and their summed
+    resident memory in bytes, leaving out the fake `server`'s.
+    """
+    me = os.getpid()
+    count = rss = 0
+    for pid in os.listdir('/proc'):
+        if not pid.isdigit():
+            continue
+        try:
+            with open('/proc/%s/stat' % pid) as f:
+                # the command may hold spaces, the fields after it don't
+                fields = f.read().rsplit(')', 1)[1].split()
+        except IOError:
+            continue
+        if int(pid) == me or int(fields[1]) == me and int(pid) != server:
+            count += 1
+            rss += int(fields[21]) * os.sysconf('SC_PAGE_SIZE')
+    return count, rss
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--bees', type=int, default=200)
+    parser.add_argument('--seconds', type=float, default=3, help='how long every bee\'s command takes')
+    parser.add_argument('--pool', action='store_true', help='fork a process per bee instead')
+    args = parser.parse_args()
+
+    home = tempfile.mkdtemp()
+    key_filename = os.path.join(home, 'bee.pem')
+    paramiko.RSAKey.generate(2048).write_private_key_file(key_filename)
+    bees._get_pem_path = lambda key: key_filename
+    params = [{'i': i, 'instance_name': '127.0.0.1', 'username': 'bee', 'key_name': 'bee', 'seconds': args.seconds}
+              for i in range(args.bees)]
+
+    peak = [0, 0]
+    sampling = [True]
+
+    def sample():
+        while sampling[0]:
+            peak[:] = [max(a, b) for a, b in zip(peak, _process_tree(server.pid))]
+            time.sleep(0.1)
+
+    # the server runs in a process of its own, so that neither it nor the
+    # commands it runs count towards the controller's
+    ports = multiprocessing.Queue()
+    server = multiprocessing.Process(target=_serve, args=(home, ports))
+    server.start()
+    try:
+        bees.SSH_PORT = ports.get()
+        sampler = threading.Thread(target=sample)
+        sampler.daemon = True
+        sampler.start()
+        started = time.time()
+        if args.pool:
+            pool = multiprocessing.Pool(len(params))
+            try:
+                statuses = pool.map(_bee, params)
+            finally:
+                pool.close()
+        else:
+            statuses = bees._run_swarm(_bee, params)
+        elapsed = time.time() - started
+        sampling[0] = False
+        sampler.join()
+    finally:
+        server.terminate()
+        shutil.rmtree(home)
+    print('%s, %i bees: %i processes, %.0f MB summed RSS, %.1fs (%i failed)' % (
+        'Pool' if args.pool else '_run_swarm', args.bees, peak[0], peak[1] / 1e6, elapsed,
+        len([status for status in statuses if status != 0])))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""
+A fake of the parts of the EC2 Query API the bees use, for the tests to
+call swarms up and take them down against, with $BEES_EC2_ENDPOINT set to
+its url.
+
+New instances are pending for `pending_polls` DescribeInstances calls and
+then running, but their sshd only answers once `boot_polls` more calls
+went by, as on EC2.  Until then they are given a private address nothing
+listens on, and one of `hosts` after, in turn.
+"""
+import itertools
+import threading
+
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs
+
+NAMESPACE = 'http://ec2.amazonaws.com/doc/2014-10-01/'
+UNREACHABLE = '127.0.0.2'
+
+INSTANCE = ('<item><instanceId>%(id)s</instanceId><imageId>%(image)s</imageId>'
+            '<instanceState><code>%(code)i</code><name>%(state)s</name></instanceState>'
+            '<privateDnsName>%(dns)s</privateDnsName><dnsName>%(dns)s</dnsName>'
+            '<instanceType>%(type)s</instanceType><launchTime>2026-10-18T00:00:00.000Z</launchTime>'
+            '<placement><availabilityZone>%(zone)s</availabilityZone></placement></item>')
+STATE_CODES = {'pending': 0, 'running': 16, 'shutting-down': 32, 'terminated': 48}
+
+
+def _ids(query, prefix):
+    return [values[0] for key, values in sorted(query.items()) if key.startswith(prefix)]
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    # http.server only has one of these from Python 3.7 on
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        query = parse_qs(self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8'))
+        action = query['Action'][0]
+        with self.server.lock:
+            self.server.calls[action] = self.server.calls.get(action, 0) + 1
+            handler = getattr(self, '_' + action, None)
+            body = handler(query) if handler is not None else None
+        if body is None:
+            self.send_response(400)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        data = ('<%sResponse xmlns="%s">%s</%sResponse>' % (action, NAMESPACE, body, action)).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _xml(self, instance):
+        return INSTANCE % dict(instance, code=STATE_CODES[instance['state']])
+
+    def _RunInstances(self, query):
+        new = []
+        for i in range(int(query['MinCount'][0])):
+            instance_id = 'i-%08x' % next(self.server.counter)
+            self.server.instances[instance_id] = {
+                'id': instance_id,
+                'image': query['ImageId'][0],
+                'type': query.get('InstanceType', ['t1.micro'])[0],
+                'zone': query.get('Placement.AvailabilityZone', ['fake-zone-1a'])[0],
+                'state': 'pending',
+                'dns': UNREACHABLE,
+                'polls': 0,
+                'boot_polls': next(self.server.boot_polls),
+                'host': next(self.server.hosts),
+            }
+            new.append(self.server.instances[instance_id])
+        return ('<reservationId>r-1</reservationId><ownerId>1</ownerId><instancesSet>%s</instancesSet>' %
+                ''.join(self._xml(instance) for instance in new))
+
+    def _DescribeInstances(self, query):
+        ids = _ids(query, 'InstanceId.') or sorted(self.server.instances)
+        if any(instance_id not in self.server.instances for instance_id in ids):
+            return None
+        items = []
+        for instance_id in ids:
+            instance = self.server.instances[instance_id]
+            instance['polls'] += 1
+            if instance['state'] == 'pending' and instance['polls'] > self.server.pending_polls:
+                instance['state'] = 'running'
+            if instance['state'] == 'running' and instance['polls'] > self.server.pending_polls + instance['boot_polls']:
+                instance['dns'] = instance['host']
+            items.append(self._xml(instance))
+        return ('<reservationSet><item><reservationId>r-1</reservationId><instancesSet>%s</instancesSet>'
+                '</item></reservationSet>' % ''.join(items))
+
+    def _CreateTags(self, query):
+        return '<return>true</return>'
+
+    def _TerminateInstances(self, query):
+        items = []
+        for instance_id in _ids(query, 'InstanceId.'):
+            instance = self.server.instances[instance_id]
+            items.append('<item><instanceId>%s</instanceId><currentState><code>32</code><name>shutting-down</name>'
+                         '</currentState><previousState><code>%i</code><name>%s</name></previousState></item>' % (
+                             instance_id, STATE_CODES[instance['state']], instance['state']))
+            instance['state'] = 'terminated'
+        return '<instancesSet>%s</instancesSet>' % ''.join(items)
+
+
+@contextmanager
+def serve(hosts=('127.0.0.1',), pending_polls=2, boot_polls=(2, 4)):
+    """
+    Run the fake on a free local port for the duration of the block and
+    yield it, with its url in server.url, the instances it launched in
+    server.instances and how many times each action was called in
+    server.calls.  The instances take turns at the `boot_polls`.
+    """
+    server = _ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    server.lock = threading.Lock()
+    server.hosts = itertools.cycle(hosts)
+    server.pending_polls = pending_polls
+    server.boot_polls = itertools.cycle(boot_polls)
+    server.counter = itertools.count(1)
+    server.instances = {}
+    server.calls = {}
+    server.url = 'http://127.0.0.1:%i/' % server.server_address[1]
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,164 @@
+"""
+An SSH server for the tests that stands in for the bees: it lets anyone in
+and runs every command it is sent in a local shell, with `home` as the
+bee's home directory.
+"""
+import logging
+import os
+import socket
+import subprocess
+import threading
+import time
+
+from contextlib import contextmanager
+
+import paramiko
+
+_HOST_KEY = []
+
+# the bees hang up as soon as they have what they came for, which the
+# server side of paramiko reports as an error
+logging.getLogger('test.fakessh').setLevel(logging.CRITICAL)
+
+
+def _host_key():
+    # generating a key takes a while, so the servers of a test run share one
+    if not _HOST_KEY:
+        _HOST_KEY.append(paramiko.RSAKey.generate(2048))
+    return _HOST_KEY[0]
+
+
+class _Server(paramiko.ServerInterface):
+    def __init__(self, fake):
+        self.fake = fake
+
+    def get_allowed_auths(self, username):
+        return 'publickey,password'
+
+    def check_auth_publickey(self, username, key):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED
+
+    def check_channel_exec_request(self, channel, command):
+        thread = threading.Thread(target=self.fake.run, args=(channel, command.decode('utf-8')))
+        thread.daemon = True
+        thread.start()
+        return True
+
+
+class FakeSSH(object):
+    """
+    Accept SSH connections on a free port of each of the loopback `hosts`
+    until stopped, so bees can tell each other apart by address.  The
+    commands it ran are in `commands` and how many connections it took in
+    `connections`.  Every command starts `latency` seconds late, like one
+    sent halfway round the world.
+    """
+    def __init__(self, home, latency=0, hosts=('127.0.0.1',)):
+        self.home = home
+        self.latency = latency
+        self.host_key = _host_key()
+        self.commands = []
+        self.connections = 0
+        self.listeners = []
+        self.port = 0
+        for host in hosts:
+            listener = socket.socket()
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            listener.bind((host, self.port))
+            listener.listen(1024)
+            self.port = listener.getsockname()[1]
+            self.listeners.append(listener)
+        self.transports = []
+        self.stopped = False
+
+    def start(self):
+        for listener in self.listeners:
+            thread = threading.Thread(target=self._accept, args=(listener,))
+            thread.daemon = True
+            thread.start()
+
+    def stop(self):
+        self.stopped = True
+        for listener in self.listeners:
+            listener.close()
+        for transport in self.transports:
+            transport.close()
+
+    def _accept(self, listener):
+        while not self.stopped:
+            try:
+                sock, address = listener.accept()
+            except OSError:
+                return
+            self.connections += 1
+            thread = threading.Thread(target=self._handshake, args=(sock,))
+            thread.daemon = True
+            thread.start()
+
+    def _handshake(self, sock):
+        transport = paramiko.Transport(sock)
+        transport.set_log_channel('test.fakessh')
+        transport.add_server_key(self.host_key)
+        self.transports.append(transport)
+        try:
+            transport.start_server(server=_Server(self))
+        except (paramiko.SSHException, EOFError, OSError):
+            transport.close()
+
+    def run(self, channel, command):
+        self.commands.append(command)
+        if self.latency:
+            time.sleep(self.latency)
+        process = subprocess.Popen(['bash', '-c', command], cwd=self.home, env=dict(os.environ, HOME=self.home),
+                                   stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+        def pump_stdin():
+            try:
+                for data in iter(lambda: channel.recv(65536), b''):
+                    process.stdin.write(data)
+                    process.stdin.flush()
+            except (OSError, ValueError):
+                pass
+            try:
+                process.stdin.close()
+            except OSError:
+                pass
+
+        def pump_stderr():
+            try:
+                for data in iter(lambda: process.stderr.read1(65536), b''):
+                    channel.sendall_stderr(data)
+            except (OSError, EOFError):
+                pass
+
+        for pump in (pump_stdin, pump_stderr):
+            thread = threading.Thread(target=pump)
+            thread.daemon = True
+            thread.start()
+        try:
+            for data in iter(lambda: process.stdout.read1(65536), b''):
+                channel.sendall(data)
+            status = process.wait()
+            channel.send_exit_status(status if status >= 0 else 128 - status)
+            channel.close()
+        except (OSError, EOFError):
+            process.kill()
+
+
+@contextmanager
+def serve(home, latency=0, hosts=('127.0.0.1',)):
+    """
+    Run a FakeSSH for the duration of the block and yield it.
+    """
+    fake = FakeSSH(home, latency, hosts)
+    fake.start()
+    try:
+        yield fake
+    finally:
+        fake.stop()
@@ -0,0 +1,74 @@
+"""
+A local HTTP server for the tests to attack.
+"""
+import threading
+import time
+
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    # http.server only has one of these from Python 3.7 on
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def setup(self):
+        # a handler serves every request on one connection
+        BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def _reply(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        self.server.seen.append((self.command, self.path, dict(self.headers), body))
+        if self.server.capacity:
+            # one request every 1/capacity seconds, the rest queue up
+            with self.server.lock:
+                slot = self.server.slot = max(time.time(), self.server.slot + 1.0 / self.server.capacity)
+            time.sleep(max(slot - time.time(), 0))
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        reply = b'buzz' * 16
+        self.send_response(404 if 'missing' in self.path else 200)
+        self.send_header('Content-Length', str(len(reply)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(reply)
+
+    do_GET = do_POST = do_PUT = do_HEAD = _reply
+
+
+@contextmanager
+def serve(delay=0, capacity=None):
+    """
+    Run a server on a free local port for the duration of the block and
+    yield it, with its url in server.url and the (method, path, headers,
+    body) of every request it got in server.seen and how many connections
+    it took in server.connections.  With a `capacity` it answers no more
+    than that many requests per second.
+    """
+    server = _ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    server.delay = delay
+    server.capacity = capacity
+    server.lock = threading.Lock()
+    server.slot = 0
+    server.seen = []
+    server.connections = 0
+    server.url = 'http://127.0.0.1:%i' % server.server_address[1]
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,286 @@
+import base64
+import contextlib
+import gzip
+import io
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import unittest
+
+from beeswithmachineguns import bees
+
+from .target import serve
+
+
+def _bee(start, seconds, rate):
+    return {
+        'complete_requests': seconds * rate,
+        'failed_requests': 0,
+        'failed_requests_connect': 0,
+        'failed_requests_receive': 0,
+        'failed_requests_length': 0,
+        'failed_requests_exceptions': 0,
+        'number_of_200s': seconds * rate,
+        'number_of_300s': 0,
+        'number_of_400s': 0,
+        'number_of_500s': 0,
+        'requests_per_second': float(rate),
+        'ms_per_request': 5.0,
+        'started': float(start),
+        'finished': float(start + seconds),
+        'timeline': [[start + s, rate, 0, rate * 5.0] for s in range(seconds)],
+        'request_time_cdf': [5.0] * 100,
+    }
+
+
+def _params(count, rps=None):
+    return [{'i': i, 'instance_id': 'i-%i' % i, 'zone': 'us-east-1a', 'tpr': None, 'rps': rps} for i in range(count)]
+
+
+class SummarizeTest(unittest.TestCase):
+    def test_rate_is_time_aligned(self):
+        # two bees doing 100/sec one after the other never hit the target
+        # with 200/sec, however their own rates add up
+        results = [_bee(1000, 10, 100), _bee(1010, 10, 100)]
+        summary = bees._summarize_results(results, _params(2, rps=150), None)
+        self.assertEqual(summary['bees_requests'], 200)
+        self.assertEqual(summary['mean_requests'], 100)
+        self.assertFalse(summary['performance_accepted'])
+
+        summary = bees._summarize_results(results, _params(2, rps=90), None)
+        self.assertTrue(summary['performance_accepted'])
+
+    def test_overlapping_bees_add_up(self):
+        results = [_bee(1000, 10, 100), _bee(1000, 10, 100)]
+        summary = bees._summarize_results(results, _params(2, rps=150), None)
+        self.assertEqual(summary['mean_requests'], 200)
+        self.assertTrue(summary['performance_accepted'])
+
+    def test_rate_without_timelines(self):
+        results = [_bee(1000, 10, 100), _bee(1010, 10, 100)]
+        for result in results:
+            del result['timeline']
+        summary = bees._summarize_results(results, _params(2), None)
+        self.assertEqual(summary['mean_requests'], summary['span_requests_per_second'])
+        self.assertEqual(summary['mean_requests'], 100)
+
+    def test_rate_of_a_short_attack(self):
+        # no whole seconds to go on, just the span
+        results = [_bee(1000, 1, 100), _bee(1000, 1, 100)]
+        for result in results:
+            result['started'], result['finished'] = 1000.5, 1000.7
+        summary = bees._summarize_results(results, _params(2), None)
+        self.assertAlmostEqual(summary['mean_requests'], 1000)
+
+
+class StartBarrierTest(unittest.TestCase):
+    def test_countdown_starts_with_the_first_bee(self):
+        barrier = bees._StartBarrier([0, 1], lead=0, timeout=0.2)
+        # the bees take longer than the timeout to connect
+        time.sleep(0.3)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            armed = time.time()
+            start = barrier.wait(0)
+        self.assertGreaterEqual(start - armed, 0.2)
+        self.assertIn('1 bees were not armed', output.getvalue())
+        # the straggler goes at once, with the others
+        self.assertEqual(barrier.wait(1), start)
+
+    def test_last_bee_releases_the_swarm(self):
+        barrier = bees._StartBarrier([0], lead=1, timeout=10)
+        armed = time.time()
+        start = barrier.wait(0)
+        self.assertAlmostEqual(start, armed + 1, delta=0.1)
+
+
+def _section(name, text):
+    return '%s\n%s\n' % (bees.JOB_SECTION % name, text)
+
+
+def _packed(text):
+    # what _pack_job_output makes of the commands' output on the bee
+    return _section('packed', base64.b64encode(gzip.compress(text.encode('utf-8'))).decode('ascii'))
+
+
+AB_OUTPUT = _packed(
+    'Complete requests:      100\n'
+    'Failed requests:        3\n'
+    '   (Connect: 1, Receive: 0, Length: 2, Exceptions: 0)\n'
+    'Requests per second:    250.50 [#/sec] (mean)\n'
+    'Time per request:       39.920 [ms] (mean)\n'
+    'Time per request:       3.992 [ms] (mean, across all concurrent requests)\n'
+    'Responses 2xx: 95\nResponses 3xx: 0\nResponses 4xx: 2\nResponses 5xx: 0\n' +
+    _section('csv', '\n'.join('%i.5' % p for p in range(100))) +
+    _section('timeline', '1001 40 0 200\n1000 60 0 300.5\n'))
+
+HURL_OUTPUT = 'Running 1 parallel clients for: 2 seconds.\n' + _section('json', json.dumps({
+    'fetches': 200, 'fetches-per-sec': 100.5, 'end2end-ms-mean': 12.5, 'bytes': 12800,
+    'response-codes': {'200': 190, '404': 5}}))
+
+WRK_OUTPUT = ('Running 2s test @ http://localhost/\n'
+              'bees requests 500\nbees duration 2000000\nbees bytes 32000\n'
+              'bees connect 1\nbees read 2\nbees write 0\nbees timeout 3\n'
+              'bees 2xx 490\nbees 3xx 0\nbees 4xx 4\nbees 5xx 0\n'
+              'bees mean 4000.5\n' + ''.join('bees p%i %i\n' % (p, p * 10) for p in range(100)))
+
+TIMES = _section('times', '1000.5 1002.5')
+
+
+class EngineParseTest(unittest.TestCase):
+    """
+    Read what each engine's job prints on a bee back into a result.
+    """
+    cases = [
+        ('ab', AB_OUTPUT + TIMES, {
+            'complete_requests': 100, 'failed_requests': 3, 'failed_requests_connect': 1,
+            'failed_requests_receive': 0, 'failed_requests_length': 2, 'failed_requests_exceptions': 0,
+            'requests_per_second': 250.5, 'ms_per_request': 39.92,
+            'number_of_200s': 95, 'number_of_300s': 0, 'number_of_400s': 2, 'number_of_500s': 0,
+            'request_time_cdf': [p + 0.5 for p in range(100)],
+            'timeline': [[1000, 60, 0, 300.5], [1001, 40, 0, 200.0]],
+            'started': 1000.5, 'finished': 1002.5}),
+        ('hurl', HURL_OUTPUT + TIMES, {
+            'complete_requests': 200, 'failed_requests': 5, 'failed_requests_connect': 0,
+            'failed_requests_receive': 0, 'failed_requests_length': 0, 'failed_requests_exceptions': 0,
+            'requests_per_second': 100.5, 'ms_per_request': 12.5, 'bytes': 12800,
+            'number_of_200s': 190, 'number_of_300s': 0, 'number_of_400s': 5, 'number_of_500s': 0,
+            'started': 1000.5, 'finished': 1002.5}),
+        ('wrk', WRK_OUTPUT + TIMES, {
+            'complete_requests': 500, 'failed_requests': 6, 'failed_requests_connect': 1,
+            'failed_requests_receive': 2, 'failed_requests_length': 0, 'failed_requests_exceptions': 3,
+            'requests_per_second': 250.0, 'ms_per_request': 4.0005, 'bytes': 32000,
+            'number_of_200s': 490, 'number_of_300s': 0, 'number_of_400s': 4, 'number_of_500s': 0,
+            'request_time_cdf': [p / 100.0 for p in range(100)],
+            'started': 1000.5, 'finished': 1002.5}),
+    ]
+
+    # output of bees that lost sight of the target
+    lost = [
+        ('ab', _packed('apr_socket_recv: Connection refused (111)\n' + _section('csv', '')) + TIMES),
+        ('ab', _packed('Complete requests:      0\nFailed requests:        0\n'
+                       'Requests per second:    0.00 [#/sec] (mean)\nTime per request:       0.000 [ms] (mean)\n' +
+                       _section('csv', ''))),
+        ('hurl', 'hurl: error\n' + _section('json', '')),
+        ('wrk', 'unable to connect to localhost:80 Connection refused\n'),
+        ('wrk', WRK_OUTPUT.replace('bees duration 2000000', 'bees duration 0')),
+    ]
+
+    def parse(self, engine, output):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return bees.ENGINES[engine].parse(io.BytesIO(output.encode('utf-8')), {'i': 0, 'instance_id': 'i-0'})
+
+    def test_parse(self):
+        for engine, output, expected in self.cases:
+            result = self.parse(engine, output)
+            self.assertEqual(dict((key, result.get(key)) for key in expected), expected, engine)
+
+    def test_lost_sight_of_the_target(self):
+        for engine, output in self.lost:
+            self.assertIsNone(self.parse(engine, output), engine)
+
+
+class StingTest(unittest.TestCase):
+    def params(self, url):
+        request, body = bees._RequestTemplate.parse({'headers': 'X-Bees: buzz'})
+        # two bees on each url
+        return [{'expand': False, 'body': body, 'request': request._replace(url='%s/%s' % (url, path))}
+                for path in 'abcabc']
+
+    def sting(self, target, sting):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return bees._sting(self.params(target.url), sting, passes=2)
+
+    def test_each_url_once_a_pass(self):
+        with serve() as target:
+            results = self.sting(target, 1)
+        self.assertEqual([result['urls'] for result in results], [3, 3])
+        self.assertEqual([result['failed'] for result in results], [0, 0])
+        self.assertEqual([path for method, path, headers, body in target.seen], ['/a', '/b', '/c'] * 2)
+        self.assertTrue(all(headers['X-Bees'] == 'buzz' for method, path, headers, body in target.seen))
+        # one connection for both passes
+        self.assertEqual(target.connections, 1)
+
+    def test_in_parallel(self):
+        with serve() as target:
+            results = self.sting(target, 2)
+        self.assertEqual([result['failed'] for result in results], [0, 0])
+        paths = [path for method, path, headers, body in target.seen]
+        self.assertEqual(sorted(paths[:3]), ['/a', '/b', '/c'])
+        self.assertEqual(sorted(paths[3:]), ['/a', '/b', '/c'])
+        # no more connections than stinging threads, kept from pass to pass
+        self.assertLessEqual(target.connections, 3)
+
+
+class _LocalChannel(object):
+    def __init__(self, process):
+        self.process = process
+
+    def shutdown_write(self):
+        self.process.stdin.close()
+
+
+class _LocalStdin(object):
+    def __init__(self, process):
+        self.channel = _LocalChannel(process)
+        self.write = process.stdin.write
+
+
+class _LocalClient(object):
+    """
+    Run the commands a paramiko SSHClient would on a bee in a local shell,
+    with `home` as the bee's home directory.
+    """
+    def __init__(self, home):
+        self.home = home
+        self.commands = []
+
+    def exec_command(self, command):
+        self.commands.append(command)
+        process = subprocess.Popen(['sh', '-c', command], cwd=self.home, stdin=subprocess.PIPE,
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stdout = (line.decode('utf-8') for line in process.stdout)
+        return _LocalStdin(process), stdout, process.stderr
+
+
+class StockPayloadsTest(unittest.TestCase):
+    def setUp(self):
+        self.home = tempfile.mkdtemp()
+        self.client = _LocalClient(self.home)
+
+    def tearDown(self):
+        shutil.rmtree(self.home)
+
+    def cached(self, payload):
+        with open(os.path.join(self.home, bees.PAYLOAD_CACHE, payload.digest), 'rb') as f:
+            return f.read()
+
+    def test_only_missing_payloads_are_sent(self):
+        post = bees._Payload.pack(b'buzz ' * 1000)
+        corpus = bees._Payload.pack(os.urandom(700))
+        self.assertTrue(post.gzipped)
+        self.assertFalse(corpus.gzipped)
+
+        self.assertEqual(bees._stock_payloads(self.client, [post]), [post])
+        self.assertEqual(self.cached(post), b'buzz ' * 1000)
+
+        sent = bees._stock_payloads(self.client, [post, corpus])
+        self.assertEqual(sent, [corpus])
+        self.assertEqual(self.cached(corpus), corpus.data)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.home, bees.PAYLOAD_CACHE))),
+                         sorted([post.digest, corpus.digest]))
+
+        self.assertEqual(bees._stock_payloads(self.client, [corpus, post]), [])
+        # one command a bee, whatever she has to be sent
+        self.assertEqual(len(self.client.commands), 3)
+
+    def test_no_payloads(self):
+        self.assertEqual(bees._stock_payloads(self.client, []), [])
+        self.assertEqual(self.client.commands, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
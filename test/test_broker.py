@@ -0,0 +1,48 @@
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from beeswithmachineguns import broker
+
+
+@contextlib.contextmanager
+def running_broker(idle=60):
+    """
+    Run a broker on a socket of its own in a thread for the duration of
+    the block and yield the socket's path.
+    """
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'broker.sock')
+    thread = threading.Thread(target=broker.serve, args=(path, idle))
+    thread.daemon = True
+    thread.start()
+    try:
+        deadline = time.time() + 5
+        while not os.path.exists(path) and time.time() < deadline:
+            time.sleep(0.01)
+        yield path
+    finally:
+        broker.shutdown(path)
+        thread.join(5)
+        shutil.rmtree(directory)
+
+
+class BrokerTest(unittest.TestCase):
+    def test_checking_it_is_up_is_quiet(self):
+        errors = io.StringIO()
+        with contextlib.redirect_stderr(errors), running_broker() as path:
+            for i in range(3):
+                self.assertTrue(broker.is_running(path))
+            # the handler runs on a thread of its own
+            time.sleep(0.1)
+        self.assertEqual(errors.getvalue(), '')
+        self.assertFalse(broker.is_running(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,266 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from beeswithmachineguns import native
+
+from .target import serve
+
+
+class HistogramTest(unittest.TestCase):
+    def test_index_is_exact_below_the_sub_buckets(self):
+        for value in (0, 1, 100, 2 ** native.Histogram.SUB_BUCKET_BITS - 1):
+            self.assertEqual(native.Histogram.index(value), value)
+            self.assertEqual(native.Histogram.highest_value(value), value)
+
+    def test_index_is_within_one_percent(self):
+        for value in (300, 1234, 99999, 10 ** 7, native.Histogram.MAX_VALUE):
+            index = native.Histogram.index(value)
+            self.assertLess(index, native.Histogram.BUCKETS)
+            highest = native.Histogram.highest_value(index)
+            self.assertGreaterEqual(highest, value)
+            self.assertLessEqual(highest - value, value * 0.01)
+            # the bucket ends where the next one starts
+            self.assertEqual(native.Histogram.index(highest + 1), index + 1)
+
+    def test_percentiles(self):
+        histogram = native.Histogram()
+        for ms in range(1, 101):
+            histogram.record(ms)
+        self.assertEqual(histogram.count, 100)
+        self.assertAlmostEqual(histogram.mean(), 50.5)
+        self.assertAlmostEqual(histogram.percentile(50), 50, delta=0.5)
+        self.assertAlmostEqual(histogram.percentile(99), 99, delta=1)
+        self.assertEqual(histogram.percentile(100), 100)
+        self.assertEqual(histogram.percentiles([50, 99]), [histogram.percentile(50), histogram.percentile(99)])
+
+    def test_empty_percentiles(self):
+        self.assertEqual(native.Histogram().percentile(50), 0.0)
+        self.assertEqual(native.Histogram().percentiles([50, 90]), [0.0, 0.0])
+
+    def test_merge_and_combine(self):
+        a, b = native.Histogram(), native.Histogram()
+        a.record(1)
+        a.record(5)
+        b.record(500, count=3)
+        combined = native.Histogram.combine([a, b])
+        a.merge(b)
+        for merged in (a, combined):
+            self.assertEqual(merged.count, 5)
+            self.assertEqual(merged.min, 1000)
+            self.assertEqual(merged.max, 500000)
+            self.assertEqual(merged.counts[native.Histogram.index(500000)], 3)
+        self.assertEqual(list(a.counts), list(combined.counts))
+
+    def test_dict_round_trip(self):
+        histogram = native.Histogram()
+        histogram.record(3.5)
+        histogram.record(250, count=2)
+        loaded = native.Histogram.load(histogram.to_dict())
+        self.assertEqual(list(loaded.counts), list(histogram.counts))
+        self.assertEqual((loaded.count, loaded.total, loaded.min, loaded.max),
+                         (histogram.count, histogram.total, histogram.min, histogram.max))
+
+    def test_negative_latency_is_clamped(self):
+        histogram = native.Histogram()
+        histogram.record(-0.5)
+        self.assertEqual(histogram.counts[0], 1)
+        self.assertEqual(sum(histogram.counts), 1)
+        self.assertEqual(histogram.min, 0)
+
+
+class PackTest(unittest.TestCase):
+    def _stats(self, outcomes):
+        stats = native.Stats()
+        for outcome in outcomes:
+            stats.record(outcome)
+        return stats
+
+    def test_round_trip(self):
+        stats = self._stats([(None, 200, 12.5), (None, 503, 80.0), ('connect', None, None)])
+        record = stats.as_result(2.0)
+        record['stages'] = [dict(self._stats([(None, 200, 3.0)]).as_result(1.0), target_rate=10.0)]
+        line = native.pack_result(record)
+        self.assertTrue(line.startswith(native.PACKED))
+        self.assertNotIn('\n', line)
+
+        unpacked = native.unpack_result(line)
+        for key in ('complete_requests', 'failed_requests', 'failed_requests_connect', 'number_of_200s',
+                    'number_of_500s', 'requests_per_second', 'timeline'):
+            self.assertEqual(unpacked[key], record[key], key)
+        histogram = native.Histogram.load(unpacked['histogram'])
+        self.assertEqual(list(histogram.counts), list(stats.histogram.counts))
+        self.assertEqual(unpacked['stages'][0]['target_rate'], 10.0)
+        self.assertEqual(native.Histogram.load(unpacked['stages'][0]['histogram']).count, 1)
+
+
+class ProfileTest(unittest.TestCase):
+    def test_parse(self):
+        self.assertEqual(native.parse_profile('hold:100:30, ramp:100:200:60'),
+                         [('hold', 100, 100, 30), ('ramp', 100, 200, 60)])
+        self.assertEqual(native.parse_profile('step:10:30:10:5'),
+                         [('hold', 10, 10, 5), ('hold', 20, 20, 5), ('hold', 30, 30, 5)])
+
+    def test_parse_errors(self):
+        for spec in ('hold:100', 'burst:1:2', 'ramp:a:b:c', 'hold:-5:10', 'step:1:10:0:5'):
+            self.assertRaises(ValueError, native.parse_profile, spec)
+
+    def test_format_round_trip(self):
+        stages = native.parse_profile('hold:100:30,ramp:100:200:60')
+        halved = native.parse_profile(native.format_profile(stages, 0.5))
+        self.assertEqual([stage[1:] for stage in halved], [(50, 50, 30), (50, 100, 60)])
+
+    def test_hold_due_times(self):
+        due = list(native._due_times([('hold', 10, 10, 2)]))
+        self.assertEqual(len(due), 20)
+        self.assertAlmostEqual(due[1][0], 0.1)
+        self.assertEqual(set(stage for t, stage in due), {0})
+
+    def test_ramp_due_times(self):
+        # ramping from 0 to 20/sec over 2 seconds sends 20 requests, more
+        # of them towards the end
+        due = [t for t, stage in native._due_times([('ramp', 0, 20, 2)])]
+        self.assertEqual(len(due), 20)
+        self.assertGreater(due[1] - due[0], due[-1] - due[-2])
+        self.assertTrue(all(0 <= t < 2 for t in due))
+
+    def test_stages_follow_each_other(self):
+        due = list(native._due_times([('hold', 5, 5, 1), ('hold', 10, 10, 1)]))
+        self.assertEqual([stage for t, stage in due], [0] * 5 + [1] * 10)
+        self.assertAlmostEqual(due[5][0], 1.0)
+
+
+class FormatterTest(unittest.TestCase):
+    def test_placeholders(self):
+        self.assertEqual(native.parse_placeholders(b'/{{seq}}/{{random:1:9}}?u={{csv:u.csv:id}}&b={{bee}}'),
+                         [('seq', ()), ('random', ('1', '9')), ('csv', ('u.csv', 'id')), ('bee', ())])
+        for bad in (b'{{nope}}', b'{{seq:1}}', b'{{random:9:1}}', b'{{random:1}}', b'{{csv:u.csv}}'):
+            self.assertRaises(ValueError, native.parse_placeholders, bad)
+
+    def test_expand(self):
+        formatter = native.Formatter(bee=3, columns={'u.csv:id': ['a', 'b']})
+        url = formatter.compile(b'/p/{{seq}}?u={{csv:u.csv:id}}&b={{bee}}&pct=100%')
+        body = formatter.compile(b'{"n": {{seq}}, "r": {{random:5:6}}}')
+        expanded = []
+        for i in range(3):
+            values = formatter.values()
+            expanded.append((formatter.expand(url, values), formatter.expand(body, values)))
+        self.assertEqual([u for u, b in expanded],
+                         [b'/p/0?u=a&b=3&pct=100%', b'/p/1?u=b&b=3&pct=100%', b'/p/2?u=a&b=3&pct=100%'])
+        # the same placeholder has the same value throughout a request
+        self.assertEqual([b[:8] for u, b in expanded], [b'{"n": 0,', b'{"n": 1,', b'{"n": 2,'])
+        self.assertTrue(all(b.endswith((b'5}', b'6}')) for u, b in expanded))
+
+    def test_shard(self):
+        formatter = native.Formatter()
+        template = formatter.compile(b'{{seq}}')
+        formatter.shard(1, 3)
+        self.assertEqual([formatter.expand(template, formatter.values()) for i in range(3)], [b'1', b'4', b'7'])
+
+    def test_bees_go_on_from_each_other(self):
+        # two bees running two loops each never send the same number
+        sent = []
+        for bee in range(2):
+            for part in range(2):
+                formatter = native.Formatter(bee, {'u.csv:id': [str(i) for i in range(8)]}, bees=2)
+                template = formatter.compile(b'{{seq}}:{{csv:u.csv:id}}')
+                formatter.shard(part, 2)
+                sent.extend(formatter.expand(template, formatter.values()) for i in range(2))
+        self.assertEqual(sorted(sent), [b'%i:%i' % (i, i) for i in range(8)])
+
+    def test_target(self):
+        target = native.Target('http://example.com/p/{{seq}}', 'POST', [('X-Seq', '{{seq}}')], b'n={{seq}}')
+        target.load_formatter(native.Formatter(), b'n={{seq}}')
+        request, head_only = target.pick()
+        self.assertFalse(head_only)
+        self.assertTrue(request.startswith(b'POST /p/0 HTTP/1.1\r\n'))
+        self.assertIn(b'\r\nX-Seq: 0\r\n', request)
+        self.assertTrue(request.endswith(b'\r\nContent-Length: 3\r\n\r\nn=0'))
+
+
+class CorpusTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'corpus')
+        with open(self.filename, 'wb') as f:
+            f.write(native.pack_corpus([b'zero', b'', b'two\nlines', b'three']))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_take(self):
+        corpus = native.Corpus(self.filename)
+        self.assertEqual(corpus.count, 4)
+        self.assertEqual([bytes(corpus.take()) for i in range(5)], [b'zero', b'', b'two\nlines', b'three', b'zero'])
+
+    def test_shard(self):
+        corpus = native.Corpus(self.filename)
+        corpus.shard(1, 2)
+        self.assertEqual([bytes(corpus.take()) for i in range(3)], [b'', b'three', b''])
+
+    def test_not_a_corpus(self):
+        with open(self.filename, 'wb') as f:
+            f.write(b'not a corpus at all')
+        self.assertRaises(ValueError, native.Corpus, self.filename)
+
+    def test_target(self):
+        target = native.Target('http://example.com/', 'POST')
+        target.load_corpus(self.filename)
+        self.assertTrue(target.pick()[0].endswith(b'\r\nContent-Length: 4\r\n\r\nzero'))
+        self.assertTrue(target.pick()[0].endswith(b'\r\nContent-Length: 0\r\n\r\n'))
+
+
+class RunTest(unittest.TestCase):
+    def test_run(self):
+        with serve() as server:
+            target = native.Target(server.url + '/bees?q=1', 'POST', [('X-Bee', 'yes')], b'buzz')
+            result = native.run(target, 50, 5, processes=2)
+        self.assertEqual(result['complete_requests'], 50)
+        self.assertEqual(result['failed_requests'], 0)
+        self.assertEqual(result['number_of_200s'], 50)
+        self.assertEqual(native.Histogram.load(result['histogram']).count, 50)
+        self.assertEqual(sum(row[1] for row in result['timeline']), 50)
+        self.assertLessEqual(result['started'], result['finished'])
+        self.assertEqual(len(server.seen), 50)
+        method, path, headers, body = server.seen[0]
+        self.assertEqual((method, path, headers['X-Bee'], body), ('POST', '/bees?q=1', 'yes', b'buzz'))
+
+    def test_status_classes(self):
+        with serve() as server:
+            result = native.run(native.Target(server.url + '/missing'), 10, 2, processes=1)
+        self.assertEqual(result['number_of_400s'], 10)
+
+    def test_connect_failures(self):
+        with serve() as server:
+            url = server.url
+        result = native.run(native.Target(url + '/'), 4, 2, processes=1)
+        self.assertEqual(result['complete_requests'], 0)
+        self.assertEqual(result['failed_requests_connect'], 4)
+
+    def test_arrival_rate(self):
+        with serve() as server:
+            result = native.run(native.Target(server.url + '/'), 20, 2, processes=1, rate=100)
+        self.assertEqual(result['complete_requests'], 20)
+        self.assertEqual(result['target_rate'], 100)
+        self.assertGreater(result['achieved_rate'], 0)
+
+    def test_profile(self):
+        with serve() as server:
+            result = native.run(native.Target(server.url + '/'), 0, 2, processes=1,
+                                profile=native.parse_profile('hold:50:0.2,hold:100:0.2'))
+        self.assertEqual([stage['complete_requests'] for stage in result['stages']], [10, 20])
+        self.assertEqual(result['complete_requests'], 30)
+
+    def test_interval_reports_keep_every_request(self):
+        # the reporter swaps the counters out while requests are in flight,
+        # none of their outcomes may land in counters already reported
+        with serve(delay=0.002) as server:
+            target = native.Target(server.url + '/')
+            result = native.run(target, 400, 4, processes=2, interval=0.05)
+        self.assertEqual(result['complete_requests'], 400)
+        self.assertEqual(len(server.seen), 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from unittest import mock
+
+import paramiko
+
+from beeswithmachineguns import bees, broker, state
+
+from . import fakeec2, fakessh
+from .target import serve
+from .test_broker import running_broker
+
+ZONE = 'fake-zone-1a'
+# the addresses of the bees, so that no two share a connection in the broker
+HOSTS = ('127.0.0.1', '127.0.0.3', '127.0.0.4', '127.0.0.5')
+
+
+class SwarmTest(unittest.TestCase):
+    """
+    Call swarms up against the fake EC2 and send them in against a local
+    target, the bees being a fake SSH server running their jobs here.
+    """
+    @classmethod
+    def setUpClass(cls):
+        cls.key = paramiko.RSAKey.generate(2048)
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.home = os.path.join(self.directory, 'bee')
+        os.mkdir(self.home)
+        key_filename = os.path.join(self.directory, 'bees-test.pem')
+        self.key.write_private_key_file(key_filename)
+
+        self.ssh = self.enter(fakessh.serve(self.home, hosts=HOSTS))
+        for target, value in ((state, {'DATABASE': os.path.join(self.directory, 'state.db'),
+                                       'LEGACY_FILENAME': os.path.join(self.directory, 'legacy')}),
+                              (bees, {'SSH_PORT': self.ssh.port, 'INSTANCE_POLL_MIN': 0.05,
+                                      'INSTANCE_POLL_MAX': 0.1, '_get_pem_path': lambda key: key_filename})):
+            self.enter(mock.patch.multiple(target, **value))
+        self.enter(mock.patch.dict(os.environ, AWS_ACCESS_KEY_ID='bees', AWS_SECRET_ACCESS_KEY='buzz'))
+
+    def enter(self, context):
+        value = context.__enter__()
+        self.addCleanup(context.__exit__, None, None, None)
+        return value
+
+    def up(self, count, zone=ZONE, **options):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            bees.up(count, 'default', zone, 'ami-bees', 't1.micro', 'bee', 'bees-test', None, None, **options)
+        return output.getvalue()
+
+    def use(self, ec2):
+        self.enter(mock.patch.dict(os.environ, BEES_EC2_ENDPOINT=ec2.url))
+
+    def test_up_polls_the_swarm_at_once(self):
+        with fakeec2.serve() as ec2:
+            self.use(ec2)
+            output = self.up(6)
+        self.assertIn('The swarm has assembled 6 bees.', output)
+        username, key_name, zone, roster = state.read_swarm(ZONE)
+        self.assertEqual(len(roster), 6)
+        self.assertEqual(set(bee['public_dns_name'] for bee in roster), {'127.0.0.1'})
+        # a poll for every bee still waiting, rather than one for each: 2
+        # pending, up to 4 more until sshd answers and one to see it does
+        self.assertLessEqual(ec2.calls['DescribeInstances'], 7)
+        self.assertEqual(ec2.calls['RunInstances'], 1)
+
+    def test_up_reports_stragglers(self):
+        with fakeec2.serve(boot_polls=(0, 10 ** 6)) as ec2:
+            self.use(ec2)
+            output = self.up(4, ready_timeout=0.5)
+        self.assertIn('bees: warning: 2 bees were not ready after 0 seconds', output)
+        # they are still in the roster, for bees down to find
+        self.assertEqual(len(state.read_swarm(ZONE)[3]), 4)
+
+    def test_attack_and_down(self):
+        with fakeec2.serve(boot_polls=(0,)) as ec2, serve() as target:
+            self.use(ec2)
+            self.up(2)
+            for attack in range(2):
+                output = io.StringIO()
+                with contextlib.redirect_stdout(output):
+                    bees.attack(target.url + '/bees', 40, 4, zone=ZONE, engine='native', sting=0)
+                self.assertIn('Complete requests:\t\t40', output.getvalue())
+                # the engine is only sent the first time
+                self.assertEqual('loading' in output.getvalue(), attack == 0)
+            self.assertEqual(len(target.seen), 80)
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                bees.down()
+        self.assertIsNone(state.read_swarm(ZONE))
+        self.assertEqual(set(instance['state'] for instance in ec2.instances.values()), {'terminated'})
+
+    def attack(self, url, n, c, **options):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            bees.attack(url, n, c, zone=ZONE, sting=0, **options)
+        return output.getvalue()
+
+    def test_broker_keeps_one_connection_a_bee(self):
+        with fakeec2.serve(HOSTS, boot_polls=(0,)) as ec2, serve() as target, running_broker() as path:
+            self.use(ec2)
+            self.enter(mock.patch.object(broker, 'SOCKET_PATH', path))
+            self.up(2)
+            # up() only knocked on the SSH port
+            connections = self.ssh.connections
+            for attack in range(2):
+                output = self.attack(target.url + '/', 20, 2, engine='native', broker=True)
+                self.assertIn('Complete requests:\t\t20', output)
+        self.assertEqual(self.ssh.connections - connections, 2)
+        self.assertEqual(len(target.seen), 40)
+
+    def test_find_capacity(self):
+        with fakeec2.serve(HOSTS, boot_polls=(0,)) as ec2, serve(capacity=100) as target, running_broker() as path:
+            self.use(ec2)
+            self.enter(mock.patch.object(broker, 'SOCKET_PATH', path))
+            self.up(2)
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                rate = bees.find_capacity(target.url + '/', 20, zone=ZONE, sting=0, tpr=50, start_rate=20,
+                                          step_duration=1, precision=0.1)
+        steps = [float(line.split()[2]) for line in output.getvalue().splitlines() if line.startswith('Attacking at')]
+        # doubling until the queue at the target shows, then halving the gap
+        self.assertEqual(steps[:5], [20, 40, 80, 160, 120])
+        self.assertGreaterEqual(rate, 90)
+        self.assertLessEqual(rate, 100)
+        self.assertIn('Maximum sustainable rate:\t%f [#/sec]' % rate, output.getvalue())
+
+    def test_attack_from_two_regions(self):
+        zones = [ZONE, 'fake-zone-2b']
+        with fakeec2.serve(HOSTS, boot_polls=(0,)) as ec2, serve() as target:
+            self.use(ec2)
+            self.up(2, zone=zones[0])
+            self.up(1, zone=zones[1])
+            with mock.patch.object(bees, '_print_results', wraps=bees._print_results) as print_results:
+                output = io.StringIO()
+                with contextlib.redirect_stdout(output):
+                    bees.attack(target.url + '/', 30, 3, zones=zones, engine='native', sting=0)
+        self.assertIn('3 bees from 2 regions will attack together.', output.getvalue())
+        summary = print_results.call_args[0][0]
+        # each swarm fires all of n, as it would alone
+        self.assertEqual(len(target.seen), 60)
+        self.assertEqual(summary['total_complete_requests'], 60)
+        self.assertEqual(sorted(p['i'] for p in summary['complete_bees_params']), [0, 1, 2])
+        regions = summary['regions']
+        self.assertEqual([region['zone'] for region in regions], zones)
+        self.assertEqual([(region['num_bees'], region['num_complete_bees']) for region in regions], [(2, 2), (1, 1)])
+        self.assertEqual([region['total_complete_requests'] for region in regions], [30, 30])
+        self.assertEqual(sum(region['total_failed_requests'] for region in regions), summary['total_failed_requests'])
+        self.assertAlmostEqual(sum(region['mean_requests'] for region in regions), summary['bees_requests'])
+        for region in regions:
+            self.assertEqual(len(region['request_time_cdf']), 100)
+            self.assertLessEqual(region['request_time_p99'], summary['request_time_max'])
+
+
+if __name__ == '__main__':
+    unittest.main()
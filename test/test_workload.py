@@ -0,0 +1,103 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from beeswithmachineguns import native, workload
+
+
+class WorkloadTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, content):
+        filename = os.path.join(self.directory, name)
+        with open(filename, 'wb') as f:
+            f.write(content.encode('utf-8') if isinstance(content, str) else content)
+        return filename
+
+    def test_load(self):
+        self.write('login.txt', b'user=bee')
+        filename = self.write('mix.jsonl', '\n'.join([
+            '# the front page, mostly',
+            '{"path": "/", "weight": 10}',
+            '',
+            '{"path": "/search?q=bees", "headers": {"Accept": "application/json"}}',
+            '{"path": "/login", "method": "post", "body_file": "login.txt"}',
+            '{"path": "/echo", "method": "PUT", "body": "buzz"}',
+        ]))
+        self.assertEqual(workload.load(filename), [
+            (10, 'GET', '/', [], None),
+            (1, 'GET', '/search?q=bees', [('Accept', 'application/json')], None),
+            (1, 'POST', '/login', [], b'user=bee'),
+            (1, 'PUT', '/echo', [], b'buzz'),
+        ])
+
+    def test_load_errors(self):
+        for content in ('', '# nothing\n', '{"path": "relative"}', '{"path": "/", "weight": 0}',
+                        'not json', '{"path": "/", "body_file": "missing.txt"}'):
+            filename = self.write('mix.jsonl', content)
+            self.assertRaises(workload.WorkloadError, workload.load, filename)
+
+    def test_load_access_log(self):
+        filename = self.write('access.log', '\n'.join([
+            '1.2.3.4 - - [10/Oct/2026:13:55:36 +0000] "GET /a HTTP/1.1" 200 2326 "-" "curl"',
+            '1.2.3.4 - - [10/Oct/2026:13:55:37 +0000] "POST /login HTTP/1.1" 302 0',
+            '1.2.3.4 - - [10/Oct/2026:13:55:38 +0000] "GET /b HTTP/1.1" 404 12',
+            '1.2.3.4 - - [10/Oct/2026:13:55:39 +0000] "GET /a HTTP/1.1" 200 2326',
+            '1.2.3.4 - - [10/Oct/2026:13:55:40 +0000] "HEAD /a HTTP/1.0" 200 0',
+            'garbage',
+        ]))
+        self.assertEqual(workload.load_access_log(filename), [
+            (2, 'GET', '/a', [], None),
+            (1, 'GET', '/b', [], None),
+            (1, 'HEAD', '/a', [], None),
+        ])
+        filename = self.write('posts.log', '1.2.3.4 - - [10/Oct/2026:13:55:37 +0000] "POST /login HTTP/1.1" 302 0\n')
+        self.assertRaises(workload.WorkloadError, workload.load_access_log, filename)
+
+    def test_compile_table(self):
+        entries = [(3, 'GET', '/', [('Accept', '*/*')], None), (1, 'POST', '/p', [], b'\x00body')]
+        table = workload.compile_table(entries)
+        # the same mix always packs the same, so it stays cached on the bees
+        self.assertEqual(workload.compile_table(entries), table)
+        rows = json.loads(gzip.decompress(table).decode('utf-8'))
+        self.assertEqual(rows, [[3, 'GET', '/', [['Accept', '*/*']], None], [1, 'POST', '/p', [], 'AGJvZHk=']])
+
+        target = native.Target('http://example.com/base')
+        target.load_table(rows)
+        requests = set(target.pick()[0].split(b'\r\n')[0] for i in range(50))
+        self.assertEqual(requests, {b'GET / HTTP/1.1', b'POST /p HTTP/1.1'})
+
+    def test_load_corpus_file(self):
+        filename = self.write('bodies.txt', b'one\r\n\ntwo\nthree')
+        self.assertEqual(workload.load_corpus(filename), [b'one', b'two', b'three'])
+        self.assertRaises(workload.WorkloadError, workload.load_corpus, self.write('empty.txt', b'\n\n'))
+
+    def test_load_corpus_directory(self):
+        corpus = os.path.join(self.directory, 'corpus')
+        os.mkdir(corpus)
+        os.mkdir(os.path.join(corpus, 'skipped'))
+        for name, body in (('b.json', b'{"b": 2}\n'), ('a.json', b'{"a": 1}')):
+            with open(os.path.join(corpus, name), 'wb') as f:
+                f.write(body)
+        self.assertEqual(workload.load_corpus(corpus), [b'{"a": 1}', b'{"b": 2}\n'])
+
+    def test_load_columns(self):
+        filename = self.write('users.csv', 'id,name\n1,ann\n2,bob\n')
+        placeholders = [('seq', ()), ('csv', (filename, 'name')), ('csv', (filename, 'name')),
+                        ('csv', (filename, 'id'))]
+        self.assertEqual(workload.load_columns(placeholders),
+                         {filename + ':name': ['ann', 'bob'], filename + ':id': ['1', '2']})
+        self.assertRaises(workload.WorkloadError, workload.load_columns, [('csv', (filename, 'email'))])
+        empty = self.write('empty.csv', 'id\n')
+        self.assertRaises(workload.WorkloadError, workload.load_columns, [('csv', (empty, 'id'))])
+
+
+if __name__ == '__main__':
+    unittest.main()